@@ -7,16 +7,109 @@
 #from ctypes import *
 #from binascii import hexlify
 from . import SparkClasses
-from . import sparkclip
+import os
+import stat
 import sys
 
+# The clipboard is reached through a backend, picked by name from BACKENDS.  By default that's the native
+# Windows clipboard, but the SPARK_CLIPBOARD_BACKEND environment variable (or SetBackend()) can swap in the
+# file/pipe or in-memory stand-ins, so import and export can run headless (on Linux build hosts, in tests, in
+# benchmarks...).  Backends take and return anything supporting the buffer protocol, and never copy the data
+# more than the transfer itself requires.
+
+class NativeClipboard:
+	"""The Windows clipboard, through the prebuilt sparkclip module"""
+	def __init__(self):
+		from . import sparkclip
+		self.sparkclip = sparkclip
+	
+	def get(self):
+		return self.sparkclip.get_clipboard_data()
+	
+	def set(self, data):
+		self.sparkclip.set_clipboard_data(data)
+
+class FileClipboard:
+	"""Stands in for the clipboard with a file or named pipe (FIFO).  The path defaults to the
+	SPARK_CLIPBOARD_FILE environment variable."""
+	def __init__(self, path = None):
+		self.path = path if path != None else os.environ.get("SPARK_CLIPBOARD_FILE")
+		if not self.path:
+			raise SparkClasses.SparkError("No file given for the file clipboard backend (set SPARK_CLIPBOARD_FILE)")
+	
+	def get(self):
+		with open(self.path, 'rb', buffering=0) as f:
+			info = os.fstat(f.fileno())
+			if stat.S_ISREG(info.st_mode):
+				#Regular file: we know the size, so read straight into a single buffer
+				data = bytearray(info.st_size)
+				view = memoryview(data)
+				n = 0
+				while n < len(data):
+					r = f.readinto(view[n:])
+					if not r:
+						raise SparkClasses.SparkError("\"" + self.path + "\" shrank while it was being read!")
+					n += r
+				view.release()
+			else:
+				data = f.readall() #Pipe, read until the writer closes it
+		if len(data) == 0:
+			raise SparkClasses.SparkError("No Spark data found in \"" + self.path + "\"!")
+		return data
+	
+	def set(self, data):
+		view = memoryview(data).cast('B')
+		with open(self.path, 'wb', buffering=0) as f:
+			n = 0
+			while n < len(view):
+				n += f.write(view[n:])
+
+class MemoryClipboard:
+	"""Stands in for the clipboard with a buffer held in memory"""
+	def __init__(self, data = None):
+		self.data = data
+	
+	def get(self):
+		if self.data == None:
+			raise SparkClasses.SparkError("No Spark data found on clipboard!")
+		return self.data
+	
+	def set(self, data):
+		self.data = data if isinstance(data, bytes) else bytes(data) #Snapshot anything mutable
+
+BACKENDS = {
+	'native' : NativeClipboard,
+	'file' : FileClipboard,
+	'memory' : MemoryClipboard,
+	}
+
+activeBackend = None
+
+def RegisterBackend(name, backendClass):
+	"""Makes a new backend available to SetBackend().  It needs get() and set(data) methods."""
+	BACKENDS[name] = backendClass
+
+def SetBackend(name, **options):
+	"""Switches the clipboard to the named backend, created with the options given, and returns it"""
+	global activeBackend
+	if not name in BACKENDS:
+		raise SparkClasses.SparkError("Unknown clipboard backend \"" + name + "\"")
+	activeBackend = BACKENDS[name](**options)
+	return activeBackend
+
+def GetBackend():
+	"""Returns the clipboard backend in use, setting up the default one the first time"""
+	if activeBackend == None:
+		SetBackend(os.environ.get("SPARK_CLIPBOARD_BACKEND", 'native'))
+	return activeBackend
+
 def GetClipboardAsString():
 	"""Returns a byte string of all the data contained on the clipboard, as long as it's Spark data"""
-	return sparkclip.get_clipboard_data()
+	return GetBackend().get()
 
 def SetClipboardFromString(data):
 	"""Sets the data in the clipboard to the data supplied in the byte string, and sets the clipboard format to the proper spark data format"""
-	sparkclip.set_clipboard_data(data)
+	GetBackend().set(data)
 	return True
 
 '''def GetClipboardAsString():
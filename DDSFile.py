@@ -0,0 +1,97 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Reads just the header of a .dds file, to find out its size and channel count without decoding any pixels.
+# The header is the first 128 bytes: the magic "DDS ", then the DDS_HEADER structure, which holds the
+# DDS_PIXELFORMAT structure.  See "DDS_HEADER structure" in Microsoft's DirectX documentation for the layout.
+
+import os
+import struct
+
+DDS_MAGIC = b'DDS '
+DDS_HEADER_SIZE = 128
+DDS_HEADER = struct.Struct("<4s4L") #magic, size (always 124), flags, height, width
+DDS_PIXELFORMAT = struct.Struct("<2L4s5L") #size (always 32), flags, fourCC, bit count, r, g, b, a masks
+DDS_PIXELFORMAT_OFFSET = 76
+
+DDPF_ALPHAPIXELS = 0x1
+DDPF_ALPHA = 0x2
+DDPF_FOURCC = 0x4
+DDPF_RGB = 0x40
+DDPF_LUMINANCE = 0x20000
+
+FOURCC_CHANNELS = { #Channels of the block compressed formats
+    b'DXT1' : 3, #Can have 1-bit alpha, but there's no telling from the header.  Treated as opaque.
+    b'DXT2' : 4,
+    b'DXT3' : 4,
+    b'DXT4' : 4,
+    b'DXT5' : 4,
+    b'ATI1' : 1,
+    b'BC4U' : 1,
+    b'BC4S' : 1,
+    b'ATI2' : 2,
+    b'BC5U' : 2,
+    b'BC5S' : 2,
+    }
+
+ddsInfoCache = {} #path -> (GetFileStamp() of the file when read, ReadDDSInfo() result)
+
+
+def ParseDDSHeader(header):
+    """Returns (width, height, channels) from the first 128 bytes of a .dds file, or None if it isn't one."""
+    if (len(header) < DDS_HEADER_SIZE):
+        return None
+    magic, size, flags, height, width = DDS_HEADER.unpack_from(header, 0)
+    if (magic != DDS_MAGIC or size != 124):
+        return None
+    pfSize, pfFlags, fourCC, bitCount, rMask, gMask, bMask, aMask = DDS_PIXELFORMAT.unpack_from(header, DDS_PIXELFORMAT_OFFSET)
+    if (pfFlags & DDPF_FOURCC):
+        channels = FOURCC_CHANNELS.get(fourCC, 4) #Anything else (eg: DX10 extended header) is assumed to be RGBA
+    elif (pfFlags & DDPF_RGB):
+        channels = 4 if (pfFlags & DDPF_ALPHAPIXELS) else 3
+    elif (pfFlags & DDPF_LUMINANCE):
+        channels = 2 if (pfFlags & DDPF_ALPHAPIXELS) else 1
+    elif (pfFlags & DDPF_ALPHA):
+        channels = 1
+    else:
+        channels = 4
+    return (width, height, channels)
+
+
+def ProbeDDSFile(path):
+    """Returns (width, height, channels) of the .dds file at 'path', or None if it can't be read or isn't a .dds
+    file.  Only the header is read."""
+    try:
+        with open(path, 'rb') as f:
+            return ParseDDSHeader(f.read(DDS_HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def GetFileStamp(path):
+    """Returns (mtime, size) of the file at 'path', or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def RememberDDSInfo(path, info, stamp = None):
+    """Puts 'info' in the cache for the .dds file at 'path', as it is now (or as it was when it had 'stamp')."""
+    if stamp == None:
+        stamp = GetFileStamp(path)
+    ddsInfoCache[path] = (stamp, info)
+
+
+def ReadDDSInfo(path):
+    """Same as ProbeDDSFile(), but the result is remembered for next time.  It's read again if the file has
+    changed since."""
+    stamp = GetFileStamp(path)
+    entry = ddsInfoCache.get(path)
+    if entry != None and entry[0] == stamp:
+        return entry[1]
+    info = ProbeDDSFile(path)
+    RememberDDSInfo(path, info, stamp)
+    return info
@@ -7,6 +7,7 @@
 import bpy
 from . import SparkClasses
 from . import ClipUtils
+from . import Profiling
 import bmesh
 import math
 import os
@@ -246,8 +247,10 @@ def ExportClipboardData(operator, context,
         correct_units = True,
         correct_axes = True,
         export_textures = True,
+        profile = False,
         ):
     from mathutils import Matrix
+    prof = Profiling.GetProfiler("export", profile)
     scene = bpy.context.scene
     obs = bpy.context.selected_objects if selection_only else bpy.context.visible_objects
     
@@ -255,7 +258,7 @@ def ExportClipboardData(operator, context,
     
     materials = []
     
-    mDatTotal = None
+    meshes = [] #One SparkMeshColumns per object, all merged in one go at the end
     
     CORRECT_UNIT_FACTOR = 1.0
     if (correct_units):
@@ -264,107 +267,70 @@ def ExportClipboardData(operator, context,
     for object in obs:
         if not object.type == 'MESH':
             continue
-        me = object.to_mesh(scene = scene, apply_modifiers = True, settings = 'PREVIEW')
-        me.transform(object.matrix_world)
-        if (correct_units):
-            me.transform(scaleMat)
+        prof.count("objects")
+        with prof.phase("to_mesh"):
+            me = object.to_mesh(scene = scene, apply_modifiers = True, settings = 'PREVIEW')
+            me.transform(object.matrix_world)
+            if (correct_units):
+                me.transform(scaleMat)
         
-        mDat = SparkClasses.SparkMeshChunkClipboard()
-        mDat.materialChunk = SparkClasses.SparkMaterialChunk()
-        mDat.vertexChunk = SparkClasses.SparkVertexChunk()
-        mDat.edgeChunk = SparkClasses.SparkEdgeChunk()
-        mDat.faceChunk = SparkClasses.SparkFaceChunk()
-        mDat.mappingChunk = SparkClasses.SparkMappingGroupChunk()
+        mDat = SparkClasses.SparkMeshColumns()
         
-        vC = mDat.vertexChunk
-        vC.vertices = []
-        
-        for vert in me.vertices:
-            sV = SparkClasses.SparkVertex()
-            if correct_axes:
-                sV.x = vert.co[1]
-                sV.y = vert.co[2]
-                sV.z = vert.co[0]
-            else:
-                sV.x = vert.co[0]
-                sV.y = vert.co[1]
-                sV.z = vert.co[2]
-            vC.vertices.append(sV)
-        
-        eC = mDat.edgeChunk
-        eC.edges = []
-        
-        for edge in me.edges:
-            sE = SparkClasses.SparkEdge()
-            sE.a = edge.vertices[0]
-            sE.b = edge.vertices[1]
-            sE.smooth = edge.use_edge_sharp
-            eC.edges.append(sE)
+        with prof.phase("vertex build"):
+            for vert in me.vertices:
+                if correct_axes:
+                    mDat.positions.extend((vert.co[1], vert.co[2], vert.co[0]))
+                else:
+                    mDat.positions.extend((vert.co[0], vert.co[1], vert.co[2]))
         
-        fC = mDat.faceChunk
-        fC.faces = []
+        with prof.phase("edge build"):
+            for edge in me.edges:
+                mDat.endpoints.extend((edge.vertices[0], edge.vertices[1]))
+                mDat.smooth.append(1 if edge.use_edge_sharp else 0)
         
-        for face in me.polygons:
-            sF = SparkClasses.SparkFace()
-            if export_textures:
-                tex = CalculateSparkTex(face, me, CORRECT_UNIT_FACTOR)
-                sF.mapping = 4294967295 # max 32 bit unsigned integer, no mapping group
-                if tex == None: #error during calculations, using defaults instead
-                    sF.angle = 0.0
-                    sF.xOffset = 0.0
-                    sF.yOffset = 0.0
-                    sF.xScale = 1.0
-                    sF.yScale = 1.0
-                    sF.material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
-                else:
-                    sF.angle = tex.angle
-                    sF.xOffset = tex.xOffs
-                    sF.yOffset = tex.yOffs
-                    sF.xScale = tex.xScale
-                    sF.yScale = tex.yScale
-                    if not tex.image == None:
-                        sF.material = AddMaterial(tex.image.filepath, materials)
+        with prof.phase("face build"):
+            for face in me.polygons:
+                mapping = 4294967295 # max 32 bit unsigned integer, no mapping group
+                angle, xOffset, yOffset, xScale, yScale = 0.0, 0.0, 0.0, 1.0, 1.0
+                if export_textures:
+                    tex = CalculateSparkTex(face, me, CORRECT_UNIT_FACTOR)
+                    if tex == None: #error during calculations, using defaults instead
+                        material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
+                        prof.count("faces_default_texture")
                     else:
-                        sF.material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
+                        angle, xOffset, yOffset, xScale, yScale = tex.angle, tex.xOffs, tex.yOffs, tex.xScale, tex.yScale
+                        if not tex.image == None:
+                            material = AddMaterial(tex.image.filepath, materials)
+                        else:
+                            material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
+                            prof.count("faces_default_texture")
                 
-            else:
-                sF.angle = 0.0
-                sF.xOffset = 0.0
-                sF.yOffset = 0.0
-                sF.xScale = 1.0
-                sF.yScale = 1.0
-                sF.mapping = 4294967295 # max 32 bit unsigned integer, no mapping group
-                sF.material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
-                #print(sF.material)
-            sF.innerLoops = []
-            sF.borderLoop = SparkClasses.SparkEdgeLoop()
-            sF.borderLoop.edgeLoopMembers = []
-            for loop in face.loop_indices:
-                selm = SparkClasses.SparkEdgeLoopMember()
-                selm.edge = me.loops[loop].edge_index
-                selm.flipped = True if me.edges[me.loops[loop].edge_index].vertices[1] == me.loops[loop].vertex_index else False
-                sF.borderLoop.edgeLoopMembers.append(selm)
-            fC.faces.append(sF)
-            #print("material#: ",sF.material)
+                else:
+                    material = AddMaterial("ns2/materials/dev/dev_1024x1024.dds",materials)
+                borderLoop = []
+                for loop in face.loop_indices:
+                    edge = me.loops[loop].edge_index
+                    flipped = True if me.edges[edge].vertices[1] == me.loops[loop].vertex_index else False
+                    borderLoop.append((flipped, edge))
+                mDat.addFace(angle, xOffset, yOffset, xScale, yScale, mapping, material, [borderLoop])
+            prof.count("faces", len(me.polygons))
         
-        matC = mDat.materialChunk #Simple matter of copying a list
-        matC.materials=[]
-        for material in materials:
-            matC.materials.append(material)
+        mDat.materials = list(materials) #Simple matter of copying a list
         
-        mapC = mDat.mappingChunk
-        mapC.mappingGroups = [] #Currently not supporting the exporting of these mapping groups :(
+        #Currently not supporting the exporting of mapping groups :(
         
-        #Now, we merge the data with the existing data
-        if mDatTotal == None:
-            mDatTotal = mDat
-        else:
-            mDatTotal = SparkClasses.mergeSparkData(mDatTotal,mDat)
+        meshes.append(mDat)
     
-    if (mDatTotal == None):
+    if (meshes == []):
         print("No mesh data to export to clipboard.  Aborting...")
         raise SparkClasses.SparkError("No mesh data to export, aborting...")
     else:
-        bData = mDatTotal.convertToBinString()
-        ClipUtils.SetClipboardFromString(bData)
+        with prof.phase("merge"):
+            merged = SparkClasses.mergeSparkMeshes(meshes)
+        with prof.phase("encode"):
+            bData = merged.convertToBinString()
+        with prof.phase("clipboard set"):
+            ClipUtils.SetClipboardFromString(bData)
+        prof.count("bytes", len(bData))
+    prof.finish()
     materials = []
@@ -6,10 +6,17 @@
 
 import bpy
 import os
+import array
+import concurrent.futures
+import threading
 from . import SparkClasses
 from . import ClipUtils
-import bmesh
 from . import Triangulation
+from . import TextureIndex
+from . import DDSFile
+from . import MaterialCache
+from . import Profiling
+from . import ImportUtils
 import math
 
 def INCHESPERMETER(): return 39.3700787
@@ -18,6 +25,7 @@ class MaterialGrouping:
     '''Just a small class to hold the potential maps as they are read-in'''
     def __init__(self):
         self.name = None
+        self.file = None #The .material file itself
         self.albedoMap = None
         self.normalMap = None
         self.specularMap = None
@@ -37,11 +45,43 @@ def FixPath(path):
     return path.replace('\\','/')
 
 
-def AddTexture(tex, textures):
+def NormalizeImagePath(path):
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+
+class ImageCache:
+    '''Hands out the Blender image for a texture file, so each file only gets loaded once per import no matter how
+    many materials or texture slots use it.  Images already in the .blend file are reused too.  An image's
+    use_alpha setting applies to every texture using it, so the slots that read the alpha channel (gloss, and
+    specular-in-albedo-alpha) get their own image.'''
+    def __init__(self):
+        self.images = {} #(normalized path, use_alpha) -> image
+        for img in bpy.data.images:
+            if img.source == 'FILE' and img.filepath != '':
+                self.images.setdefault((NormalizeImagePath(bpy.path.abspath(img.filepath)), img.use_alpha), img)
+    
+    def load(self, path, useAlpha = False):
+        key = (NormalizeImagePath(path), useAlpha)
+        img = self.images.get(key)
+        if img == None:
+            img = bpy.data.images.load(path)
+            img.use_alpha = useAlpha
+            self.images[key] = img
+        return img
+
+
+def GetImageInfo(image):
+    '''Returns (width, height, channels) of an image.  For .dds files it's read from the header, so the image's
+    pixels don't have to be decoded (asking Blender for the size or channels decodes the whole thing).'''
+    info = DDSFile.ReadDDSInfo(bpy.path.abspath(image.filepath))
+    if info == None:
+        info = (image.size[0], image.size[1], image.channels)
+    return info
+
+
+def AddTexture(tex, textures, images):
     if not tex == None:
-        img = bpy.data.images.load(tex)
-        img.use_alpha = False
-        textures.append(img)
+        textures.append(images.load(tex))
     else:
         textures.append(None)
 
@@ -58,9 +98,9 @@ def AddDummyMaterial():
     mat.emit = 0.5
     return mat
 
-def AddMaterial(mGrouping):
+def AddMaterial(mGrouping, images):
     '''Returns a material from the textures provided, and returns it, or returns an
-    existing material if the name matches the path'''
+    existing material if the name matches the path.  Images are loaded through the ImageCache 'images'.'''
     #Check to see if material is 'None', in which case it's a dummy material.
     if (mGrouping == None):
         return AddDummyMaterial()
@@ -74,8 +114,7 @@ def AddMaterial(mGrouping):
         if not mGrouping.albedoMap == None:
             if not mGrouping.albedoMap == '': #If there's an albedoMap present, create a texture for it.
                 albedoTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.albedoMap), 'IMAGE' )
-                albedoTex.image = bpy.data.images.load(mGrouping.albedoMap)
-                albedoTex.image.use_alpha = False
+                albedoTex.image = images.load(mGrouping.albedoMap)
                 texSlot = mat.texture_slots.add()
                 texSlot.texture = albedoTex
                 texSlot.use_map_color_diffuse = True
@@ -84,9 +123,8 @@ def AddMaterial(mGrouping):
         if not mGrouping.normalMap == None:
             if not mGrouping.normalMap == '': #If there's a normalMap preset, create a texture for it.
                 normalTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.normalMap), 'IMAGE' )
-                normalTex.image = bpy.data.images.load(mGrouping.normalMap)
+                normalTex.image = images.load(mGrouping.normalMap)
                 normalTex.use_normal_map = True
-                normalTex.image.use_alpha = False
                 texSlot = mat.texture_slots.add()
                 texSlot.texture = normalTex
                 texSlot.normal_map_space = 'TANGENT'
@@ -98,8 +136,7 @@ def AddMaterial(mGrouping):
         if not mGrouping.specularMap == None:
             if not mGrouping.specularMap == '': #If there's a specularMap present, create a texture for it.
                 specularTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.specularMap), 'IMAGE' )
-                specularTex.image = bpy.data.images.load(mGrouping.specularMap)
-                specularTex.image.use_alpha = False #Don't want to use the alpha, that's the gloss channel
+                specularTex.image = images.load(mGrouping.specularMap) #Don't want to use the alpha, that's the gloss channel
                 texSlot = mat.texture_slots.add()
                 texSlot.texture = specularTex
                 texSlot.use_map_color_spec = True
@@ -107,9 +144,9 @@ def AddMaterial(mGrouping):
                 texSlot.specular_color_factor = 1.0
                 texSlot.texture_coords = 'UV'
                 specularMapFound = True
-                if (specularTex.image.channels == 4): #Gloss channel on this needs a new texture
+                if (GetImageInfo(specularTex.image)[2] == 4): #Gloss channel on this needs a new texture
                     glossTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.specularMap) + '_gloss', 'IMAGE')
-                    glossTex.image = bpy.data.images.load(mGrouping.specularMap)
+                    glossTex.image = images.load(mGrouping.specularMap, True)
                     glossTex.use_alpha = True
                     texSlotG = mat.texture_slots.add()
                     texSlotG.texture = glossTex
@@ -121,9 +158,9 @@ def AddMaterial(mGrouping):
             #Didn't locate a dedicated specular map.  Need to check to see if this is one of those materials
             #where they've made the albedo map's alpha channel into a greyscale specular map.
             if not albedoTex == None:
-                if (albedoTex.image.channels == 4): #4th channel is alpha
+                if (GetImageInfo(albedoTex.image)[2] == 4): #4th channel is alpha
                     specularTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.albedoMap) + '_spec', 'IMAGE')
-                    specularTex.image = bpy.data.images.load(mGrouping.albedoMap)
+                    specularTex.image = images.load(mGrouping.albedoMap, True)
                     specularTex.use_alpha = True
                     texSlot = mat.texture_slots.add()
                     texSlot.texture = specularTex
@@ -134,8 +171,7 @@ def AddMaterial(mGrouping):
         if not mGrouping.opacityMap == None: #If there's an opacityMap present, create a texture for it.
             if not mGrouping.opacityMap == '':
                 opacityTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.opacityMap), 'IMAGE' )
-                opacityTex.image = bpy.data.images.load(mGrouping.opacityMap)
-                opacityTex.image.use_alpha = False
+                opacityTex.image = images.load(mGrouping.opacityMap)
                 texSlot = mat.texture_slots.add()
                 texSlot.texture = opacityTex
                 texSlot.use_map_alpha = True
@@ -147,8 +183,7 @@ def AddMaterial(mGrouping):
         if not mGrouping.emissiveMap == None: #If there's an emissiveMap present, create a texture for it.
             if not mGrouping.emissiveMap == '':
                 emissiveTex = bpy.data.textures.new(GetCleanTextureName(mGrouping.emissiveMap), 'IMAGE' )
-                emissiveTex.image = bpy.data.images.load(mGrouping.emissiveMap)
-                emissiveTex.image.use_alpha = False
+                emissiveTex.image = images.load(mGrouping.emissiveMap)
                 texSlot = mat.texture_slots.add()
                 texSlot.texture = emissiveTex
                 texSlot.use_map_emit = True
@@ -177,41 +212,96 @@ def IsPathValid(dir):
 def DoesFileExist(file):
     return os.path.isfile(file)
 
+
+def FindFile(file, index = None):
+    '''Returns the path of 'file' as it is on disk, or None if it doesn't exist.  Looks it up in the TextureIndex
+    'index' if there is one, which also takes care of any difference in case.'''
+    if index != None:
+        return index.resolve(file)
+    return file if DoesFileExist(file) else None
+
     
-def LocateSuitableTexture(mGroup, path):
+def LocateSuitableTexture(mGroup, path, index = None):
     #loop through each of these 5 variables, sorted by priority.  This is the texture that will be used for the
-    #UV map background, and all the calculations.
-    maps = [mGroup.albedoMap, mGroup.emissiveMap, mGroup.normalMap, mGroup.opacityMap, mGroup.specularMap ]
-    for map in maps:
+    #UV map background, and all the calculations.  Along the way, each map that exists is pointed at the file as
+    #it is on disk (the paths in the .material file are all lower case).
+    tex = None
+    for attr in ('albedoMap', 'emissiveMap', 'normalMap', 'opacityMap', 'specularMap'):
+        map = getattr(mGroup, attr)
         if not map == None:
             if not map == '':
-                tex = map
-                if DoesFileExist(tex):
-                    return tex
-    return None #This ain't good!
+                found = FindFile(map, index)
+                if not found == None:
+                    setattr(mGroup, attr, found)
+                    if tex == None:
+                        tex = found
+    return tex #None if nothing could be found.  This ain't good!
     
-def ReadMaterialFile(file, path):
-    '''knownMaps = ['albedomap','normalmap','specularmap','opacitymap','emissivemap']'''
+MATERIAL_MAPS = ( #The keys of the maps we care about in a .material file, and the MaterialGrouping attribute for each
+    ('albedomap', 'albedoMap'),
+    ('normalmap', 'normalMap'),
+    ('specularmap', 'specularMap'),
+    ('opacitymap', 'opacityMap'),
+    ('emissivemap', 'emissiveMap'),
+    )
+
+
+def ReadMaterialMaps(file):
+    '''Returns a dict of MaterialGrouping attribute -> map path (relative to the game directory, lower case) for
+    each of the maps listed in a .material file'''
+    maps = {}
+    with open(file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            start = line[:11].lower() #Only need to lower case the rest if it's one of ours
+            for key, attr in MATERIAL_MAPS:
+                if (start.startswith(key)):
+                    maps[attr] = line.split('"')[1].lower()
+                    break
+    return maps
+
+
+def ReadMaterialFile(file, path, cache = None):
+    '''Reads a .material file into a MaterialGrouping.  If there's a MaterialCache 'cache', the maps are taken from
+    it, unless the file has changed since it was cached.'''
+    if cache != None:
+        maps = cache.get('materials', file, ReadMaterialMaps)
+    else:
+        maps = ReadMaterialMaps(file)
     mGrouping = MaterialGrouping()
     mGrouping.name = GetCleanTextureName(file)
-    f = open(file, 'r')
-    mLine = []
-    for line in f:
-        mLine.append(line.strip().lower())
-    
-    for line in mLine:
-        if (line.startswith("albedomap")):
-            mGrouping.albedoMap = path + line.split('"')[1]
-        elif (line.startswith("normalmap")):
-            mGrouping.normalMap = path + line.split('"')[1]
-        elif (line.startswith("specularmap")):
-            mGrouping.specularMap = path + line.split('"')[1]
-        elif (line.startswith("opacitymap")):
-            mGrouping.opacityMap = path + line.split('"')[1]
-        elif (line.startswith("emissivemap")):
-            mGrouping.emissiveMap = path + line.split('"')[1]
-    
+    mGrouping.file = file
+    for attr, map in maps.items():
+        setattr(mGrouping, attr, path + map)
     return mGrouping
+
+
+def ReadTextureInfo(file, cache = None):
+    '''Reads the size and channels of a .dds texture into DDSFile's cache, going through the MaterialCache
+    'cache' if there is one.'''
+    if cache == None:
+        return DDSFile.ReadDDSInfo(file)
+    info = cache.get('textures', file, DDSFile.ProbeDDSFile)
+    if info != None:
+        info = tuple(info)
+    DDSFile.RememberDDSInfo(file, info)
+    return info
+
+
+materialCache = None
+
+
+def GetMaterialCache():
+    '''Returns the MaterialCache, loading it from the Blender config directory the first time'''
+    global materialCache
+    if materialCache == None:
+        try:
+            cacheFile = os.path.join(bpy.utils.user_resource('CONFIG', create=True), MaterialCache.MATERIAL_CACHE_FILENAME)
+        except Exception as e:
+            print("WARNING: Unable to find the config directory, material cache won't be saved:", e)
+            cacheFile = None
+        materialCache = MaterialCache.MaterialCache(cacheFile)
+    return materialCache
     
     
 def calcMagnitude(vec):
@@ -231,113 +321,98 @@ def cross(a,b):
 
 
 def CalculateNormal(v1,v2,v3):
-    vec1 = ( v2.x-v1.x , v2.y-v1.y , v2.z-v1.z )
-    vec2 = ( v3.x-v1.x , v3.y-v1.y , v3.z-v1.z )
+    vec1 = ( v2[0]-v1[0] , v2[1]-v1[1] , v2[2]-v1[2] )
+    vec2 = ( v3[0]-v1[0] , v3[1]-v1[1] , v3[2]-v1[2] )
     norm = cross(vec1,vec2)
     if (abs(norm[0]) < 0.00001) and (abs(norm[1]) < 0.00001) and (abs(norm[2]) < 0.00001):
         return None #failed: the vertex formed a PERFECT 180 degree angle, therefore normal cannot be derived from these vectors
     mag = calcMagnitude(norm)
     return ( norm[0]/mag , norm[1]/mag , norm[2]/mag )
 
-def CalculateVertUVCoord(vertex, normalVector, texSettings, CORRECT_UNIT_FACTOR, textures):
-    angle = texSettings[0]
-    xOffset = texSettings[1]*-1
-    yOffset = texSettings[2]*-1
-    xScale = texSettings[3]
-    yScale = texSettings[4]
-    material = texSettings[5]
-    texDim = (512, 512) #default value, if no texture is found
-    if (textures[material] != None):
-        texDim = textures[material].size
-    norm = [normalVector[0], normalVector[1], normalVector[2]]
-    
-    #Correct the scaling values back to being in terms of image size, not meters.  Spark stores the scale
-    #in meters in the clipboard (scale value from editor = 39.37 * 8 / image dimensions)
-    xScale = (8*CORRECT_UNIT_FACTOR) / (xScale * texDim[0])
-    yScale = (8*CORRECT_UNIT_FACTOR) / (yScale * texDim[1])
-    
-    # First, we need to rotate the coordinates for this vertex around the world origin
-    # to get it into the proper texture space.  I'm no good at this kind of math... so
-    # uh... buckle up if you're reading this.  Things are about to get rocky.
-    texCoords = []
-    texCoords.append(vertex.co[0])
-    texCoords.append(vertex.co[1])
-    texCoords.append(vertex.co[2])
-    
-    norm[0]*=-1
-    norm[1]*=-1
-    norm[2]*=-1
-    
-    #Allowing a 0.00127 margin of error for something being "flat" or not.  This is very close to spark's actual tolerance.
-    if ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] >= -0.99873 ):
-        #Normal is close enough to straight up
-        norm[0] = 0.0
-        norm[1] = 0.0
-        norm[2] = 1.0
-    elif ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] <= 0.99873 ):
-        #Normal is close enough to straight down.  We'll just flip it.
-        norm[0] = 0.0
-        norm[1] = 0.0
-        norm[2] = 1.0
-        texCoords[0] = texCoords[0]*-1
-        texCoords[1] = texCoords[1]*-1
-        texCoords[2] = texCoords[2]*-1
-    else:
-        a = math.pi - math.atan2( norm[0] , norm[1] ) #Z rotation of normal
-        x = texCoords[0] * math.cos(-a) - texCoords[1] * math.sin(-a)
-        y = texCoords[0] * math.sin(-a) + texCoords[1] * math.cos(-a)
-        texCoords[0] = x
-        texCoords[1] = y
-        norm[1] = math.sqrt( ( norm[0]*norm[0] ) + ( norm[1]*norm[1] ) )
-        norm[0] = 0.0
-        
-        #Now we'll deal with the pitch (y axis)
-        a = -math.atan2( norm[1], norm[2] )
-        texCoords[1] = texCoords[1] * math.cos(a) - texCoords[2] * math.sin(a)
-    
-    #Now we need to rotate it once more around the z axis to cancel out the face's "angle"
-    #We have to take into account the texture's aspect ratio as well because it'll have to skew when it rotates
-    #aspect = texDim[0]/texDim[1]
-    #texCoords[1] = texCoords[1] * aspect
-    x = texCoords[0] * math.cos(angle) - texCoords[1] * math.sin(angle)
-    y = texCoords[0] * math.sin(angle) + texCoords[1] * math.cos(angle)
-    texCoords[0] = x
-    texCoords[1] = y#/aspect
-    
-    #Now the polygon should be completely flat, save for any minor imperfections due
-    #to >3 sided polygons never being technically 100% planar
-    #Okay, now we should be good to start calculating where this vertex lies in UV-space
-    texCoords[0] = (((texCoords[0] * 8) / (texDim[0] * xScale)) - xOffset)
-    texCoords[1] = (((texCoords[1] * 8) / (texDim[1] * yScale)) + yOffset)
-    
-    texCoords=texCoords[:2] #We don't need that 3rd dimension anymore
-    return texCoords
 
+def ResolveMaterial(texPaths, mat, index = None, cache = None):
+    '''Finds the .material file for material 'mat' in the texture directories, and the texture to use for it.
+    Files are looked up in the TextureIndex 'index', and .material files read through the MaterialCache 'cache',
+    if there are any.  Returns (MaterialGrouping, texture path), or (None, None) if nothing suitable could be
+    found.'''
+    for path in texPaths:
+        file = FindFile(path + mat, index)
+        if not file == None:
+            mGrouping = ReadMaterialFile(file, path, cache)
+            tex = LocateSuitableTexture(mGrouping, path, index)
+            if not tex == None: #Can only fail if NONE of the textures from the .material file can be located
+                return (mGrouping, tex)
+    return (None, None)
+
+
+def LoadMaterial(texPaths, mat, textures, images, resolved = None):
+    '''Loads material 'mat' into Blender, adding its texture to 'textures'.  Images are loaded through the
+    ImageCache 'images'.  'resolved' is the result of ResolveMaterial, if it's already known.'''
+    mGrouping, tex = resolved if resolved != None else ResolveMaterial(texPaths, mat)
+    AddTexture(tex, textures, images)
+    return AddMaterial(mGrouping, images)
+
+
+PREFETCH_THREADS = 4 #Threads used to find materials and read their textures during an import
+
+
+def PrefetchFile(path, buf):
+    '''Reads a file and throws the data away, just so it's sitting in the OS's file cache by the time Blender wants
+    to load it.'''
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            while f.readinto(buf) > 0:
+                pass
+    except OSError:
+        pass
+
+
+class MaterialPrefetch:
+    '''Finds the materials of an import, and reads their texture files from disk, on a pool of background threads.
+    None of that depends on the geometry, so it can be going on while the clip gets decoded and the geometry gets
+    built.  Nothing here touches bpy; binding the results to Blender data is left for the main thread.'''
+    def __init__(self, texPaths, materials, indexFile = None, cache = None, threads = PREFETCH_THREADS):
+        self.cache = cache
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.prefetched = set()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.index = self.pool.submit(TextureIndex.TextureIndex, texPaths, indexFile)
+        self.jobs = [self.pool.submit(self._resolve, texPaths, material, self.index) for material in materials]
+    
+    def _resolve(self, texPaths, material, index):
+        mGrouping, tex = ResolveMaterial(texPaths, material, index.result(), self.cache)
+        if tex != None:
+            ReadTextureInfo(tex, self.cache) #Gets the size in the cache for working out the UVs
+        if mGrouping != None:
+            for map in (mGrouping.albedoMap, mGrouping.normalMap, mGrouping.specularMap, mGrouping.opacityMap, mGrouping.emissiveMap):
+                if map == None or map == '':
+                    continue
+                with self.lock:
+                    if map in self.prefetched:
+                        continue
+                    self.prefetched.add(map)
+                if not hasattr(self.local, 'buf'):
+                    self.local.buf = bytearray(1024 * 1024)
+                PrefetchFile(map, self.local.buf)
+        return (mGrouping, tex)
     
-def MapUVsFromSparkTex(bm, bface, normalVector, texSettings, CORRECT_UNIT_FACTOR, textures):
-    uv_layer = bm.loops.layers.uv.verify()
-    bm.faces.layers.tex.verify()
+    def result(self):
+        '''Waits for everything to finish, and returns the ResolveMaterial() result for each material'''
+        try:
+            return [job.result() for job in self.jobs]
+        finally:
+            self.pool.shutdown()
     
-    bm.faces.layers.tex.verify()
-    bm.faces.ensure_lookup_table()
-    for l in bm.faces[bface].loops:
-        luv = l[uv_layer]
-        co = CalculateVertUVCoord(l.vert, normalVector, texSettings, CORRECT_UNIT_FACTOR, textures)
-        luv.uv = co
+    def cancel(self):
+        '''Drops any jobs that haven't started yet, without waiting for the running ones.  Safe to call after
+        result().'''
+        for job in [self.index] + self.jobs:
+            job.cancel()
+        self.pool.shutdown(wait=False)
 
 
-def LoadMaterial(texPaths, mat, textures):
-    for path in texPaths:
-        file = path + mat
-        if DoesFileExist(file):
-            mGrouping = ReadMaterialFile(file,path)
-            tex = LocateSuitableTexture(mGrouping, path)
-            if not tex == None: #Can only fail if NONE of the textures from the .material file can be located
-                AddTexture(tex, textures)
-                mat = AddMaterial(mGrouping)
-                return mat
-    AddTexture(None, textures)
-    return AddMaterial(None)
+parseCache = ImportUtils.ParseCache()
 
 
 def ImportClipboardData(operator, context,
@@ -349,8 +424,11 @@ def ImportClipboardData(operator, context,
         tex_dir_3 = "",
         tex_dir_4 = "",
         tex_dir_5 = "",
+        texture_index_file = "",
+        profile = False,
         ):
     """Imports the clipboard data, and creates all the necessary objects"""
+    prof = Profiling.GetProfiler("import", profile)
     validPaths = []
     
     textures = []   ### The texture indices in this list should line up perfectly with the imported material indices.
@@ -378,163 +456,247 @@ def ImportClipboardData(operator, context,
     if (validPaths == None or validPaths == []):
         import_textures = False
         print("WARNING: None of the texture paths are valid.  Switching texture import off.")
-    data = ClipUtils.GetClipboardAsString()
-    sparkData = SparkClasses.SparkMeshChunkClipboard()
-    sparkData.constructFromBinString(data)
-    
-    ###DEBUG PRINTING###
-    if True:
-        print("VERTICES")
-        for i,v in enumerate(sparkData.vertexChunk.vertices):
-            print("    ",i,":",(v.x*INCHESPERMETER(),v.y*INCHESPERMETER(),v.z*INCHESPERMETER()))
-        print("EDGES")
-        for i,e in enumerate(sparkData.edgeChunk.edges):
-            print("    ",i,":",e.a,"-->",e.b,"(smooth)" if e.smooth else "(sharp)")
-        print("FACES")
-        for i,f in enumerate(sparkData.faceChunk.faces):
-            print("    ",i)
-            print("        angle:",f.angle)
-            print("        xOffs:",f.xOffset)
-            print("        yOffs:",f.yOffset)
-            print("        xScale:",f.xScale)
-            print("        yScale:",f.yScale)
-            print("        mapping:",f.mapping)
-            print("        material:", f.material)
-            print("        BORDER LOOP")
-            for b in f.borderLoop.edgeLoopMembers:
-                print("            e",b.edge,"(flipped)" if b.flipped else "(no flip)","( ",sparkData.edgeChunk.edges[b.edge].b if b.flipped else sparkData.edgeChunk.edges[b.edge].a, "-->", sparkData.edgeChunk.edges[b.edge].a if b.flipped else sparkData.edgeChunk.edges[b.edge].b,")")
-            for j,l in enumerate(f.innerLoops):
-                print("        INNER LOOP",j)
-                for b in l.edgeLoopMembers:
-                    print("            e",b.edge,"(flipped)" if b.flipped else "(no flip)","( ",sparkData.edgeChunk.edges[b.edge].b if b.flipped else sparkData.edgeChunk.edges[b.edge].a, "-->", sparkData.edgeChunk.edges[b.edge].a if b.flipped else sparkData.edgeChunk.edges[b.edge].b,")")
-    
-    
-    ### Import Materials ###
-    if (import_textures):
-        for material in sparkData.materialChunk.materials:
-            b = LoadMaterial(validPaths, material, textures)
-            bMats.append(b)
-            if b == None:
-                print("WARNING: Unable to locate texture file for \"", material, "\".  UVs may be distorted!")
-    
-    ### Import Vertices ###
-    bm = bmesh.new()
-    verts = []
-    CORRECT_UNIT_FACTOR = 1.0
-    if correct_units:
-        CORRECT_UNIT_FACTOR = INCHESPERMETER()
-    for vertex in sparkData.vertexChunk.vertices:
-        if correct_axes:
-            verts.append(bm.verts.new((vertex.z*CORRECT_UNIT_FACTOR,vertex.x*CORRECT_UNIT_FACTOR,vertex.y*CORRECT_UNIT_FACTOR)))
-        else:
-            verts.append(bm.verts.new((vertex.x*CORRECT_UNIT_FACTOR,vertex.y*CORRECT_UNIT_FACTOR,vertex.z*CORRECT_UNIT_FACTOR)))
+    with prof.phase("clipboard fetch"):
+        data = ClipUtils.GetClipboardAsString()
+    materialJobs = None #Materials are found in the background, while the geometry is decoded and built
+    resolved = None
+    try:
+        with prof.phase("decode"):
+            cacheKey = ImportUtils.ParseCache.getKey(data)
+            cached = parseCache.lookup(cacheKey)
+            prof.count("parse_cache_hits" if cached != None else "parse_cache_misses")
+            indexFile = texture_index_file if texture_index_file != "" else None
+            if cached == None:
+                sparkData = SparkClasses.SparkMeshChunkClipboard()
+                sparkData.constructFromBinString(data, True) #Lazily, so the materials can be sent off before the rest is decoded
+                if (import_textures):
+                    materialJobs = MaterialPrefetch(validPaths, sparkData.getMaterials(), indexFile, GetMaterialCache())
+                cached = ImportUtils.ParseCacheEntry(SparkClasses.SparkMeshColumns.fromMeshChunk(sparkData))
+                parseCache.store(cacheKey, cached)
+            elif (import_textures):
+                resolved = cached.getMaterials(validPaths)
+                if resolved == None:
+                    materialJobs = MaterialPrefetch(validPaths, cached.mesh.materials, indexFile, GetMaterialCache())
+            mesh = cached.mesh
+        
+        ###DEBUG PRINTING###
+        if prof.enabled:
+            with prof.phase("debug dump"):
+                print("VERTICES")
+                for i in range(0, mesh.vertexCount()):
+                    v = mesh.getVertex(i)
+                    print("    ",i,":",(v[0]*INCHESPERMETER(),v[1]*INCHESPERMETER(),v[2]*INCHESPERMETER()))
+                print("EDGES")
+                for i in range(0, mesh.edgeCount()):
+                    print("    ",i,":",mesh.endpoints[i*2],"-->",mesh.endpoints[i*2+1],"(smooth)" if mesh.smooth[i] else "(sharp)")
+                print("FACES")
+                for i in range(0, mesh.faceCount()):
+                    print("    ",i)
+                    print("        angle:",mesh.texParams[i*5])
+                    print("        xOffs:",mesh.texParams[i*5+1])
+                    print("        yOffs:",mesh.texParams[i*5+2])
+                    print("        xScale:",mesh.texParams[i*5+3])
+                    print("        yScale:",mesh.texParams[i*5+4])
+                    print("        mapping:",mesh.mappingIds[i])
+                    print("        material:", mesh.materialIds[i])
+                    for j in range(0, mesh.getFaceLoopCount(i)):
+                        print("        BORDER LOOP" if j == 0 else "        INNER LOOP " + str(j-1))
+                        for k in range(mesh.memberStarts[mesh.loopStarts[i]+j], mesh.memberStarts[mesh.loopStarts[i]+j+1]):
+                            e = mesh.memberEdges[k]
+                            flipped = mesh.memberFlipped[k]
+                            print("            e",e,"(flipped)" if flipped else "(no flip)","( ",mesh.endpoints[e*2+flipped], "-->", mesh.endpoints[e*2+1-flipped],")")
+        
+        
+        ### Import Vertices ###
+        with prof.phase("vertex build"):
+            CORRECT_UNIT_FACTOR = 1.0
+            if correct_units:
+                CORRECT_UNIT_FACTOR = INCHESPERMETER()
+            #Every polygon's vertices come from the edges' endpoints, and once they're handed to foreach_set
+            #nothing checks them (me.update() doesn't), so make sure they're all real vertices first.
+            if len(mesh.endpoints) > 0 and max(mesh.endpoints) >= mesh.vertexCount():
+                raise SparkClasses.SparkError("Edge data refers to a vertex that doesn't exist!")
+            flatCoords = ImportUtils.TransformPositions(mesh.positions, CORRECT_UNIT_FACTOR, correct_axes)
+        
+        ### Import Faces ###
+        #Rather than building the faces one at a time with bmesh, every face is resolved into a ring of vertex indices
+        #first, then the whole mesh is created in one go.  Polygons are laid out like the Mesh API wants them:
+        #loopVerts holds every polygon's vertex indices back to back, polyStarts/polyTotals say where each one is.
+        #The UVs are done in one go at the end too, once the textures (and so their sizes) are known.  Each polygon just
+        #gets the index of its UV matrix, which is shared by every face with the same normal and texture settings (eg:
+        #all the faces of a mapping group).
+        uvKey = (correct_units, correct_axes, import_textures, tuple(validPaths))
+        uvs = cached.uvs.get(uvKey)
+        loopVerts = array.array('i') #Signed, to match the buffer type foreach_set expects for int properties
+        polyStarts = array.array('i')
+        polyTotals = array.array('i')
+        polyMaterials = array.array('i')
+        polyMatrices = array.array('i')
+        matrixKeys = []
+        matrixIndices = {} #(normal, texture settings) -> index in matrixKeys
+        existing = set() #Sorted vertex rings of the polygons added so far, to skip duplicates like bmesh would
+        
+        def GetCoord(v):
+            return flatCoords[v*3:v*3+3]
+        
+        def AddPolygon(ring, normalVector, texSettings):
+            key = tuple(sorted(ring))
+            if key in existing:
+                return False
+            existing.add(key)
+            polyStarts.append(len(loopVerts))
+            polyTotals.append(len(ring))
+            polyMaterials.append(texSettings[5])
+            loopVerts.extend(ring)
+            if uvs == None:
+                matrixKey = (tuple(normalVector), texSettings)
+                m = matrixIndices.get(matrixKey)
+                if m == None:
+                    m = matrixIndices[matrixKey] = len(matrixKeys)
+                    matrixKeys.append(matrixKey)
+                polyMatrices.append(m)
+            return True
+        
+        with prof.phase("face build"):
+            for faceIndex in range(0, mesh.faceCount()):
+                normalVector = None
+                texSettings = None
+                angle, xOffset, yOffset, xScale, yScale = mesh.texParams[faceIndex*5:faceIndex*5+5]
+                mapping = mesh.mappingIds[faceIndex]
+                material = mesh.materialIds[faceIndex]
+                if (mapping == SparkClasses.NO_MAPPING): #FF FF FF FF as an unsigned 32-bit integer
+                    #No mapping group applied, therefore we just go ahead and use the face's
+                    #mapping settings
+                    texSettings = (angle, xOffset, yOffset, xScale, yScale, material)
+                else:
+                    mappingParams = mesh.mappingChunk.getMappingParams(mapping)
+                    if (mappingParams == None):
+                        #Mapping group doesn't exist, just go ahead and use the face normals
+                        texSettings = (angle, xOffset, yOffset, xScale, yScale, material)
+                    else:
+                        mapTex, mapNormal = mappingParams
+                        normalVector = [mapNormal[2], mapNormal[0], mapNormal[1]]
+                        texSettings = mapTex + (material,)
+                
+                if (mesh.getFaceLoopCount(faceIndex) < 2 or mesh.getLoopVertices(faceIndex, 1) == []):
+                    # It's a polygon with no holes, hot damn!
+                    ring = mesh.getLoopVertices(faceIndex) #verts just for this face
+                    
+                    #Do a quick check to ensure this face doesn't have double verts.
+                    if len(set(ring)) != len(ring):
+                        print("WARNING: Skipping face", faceIndex, "as it contained duplicate vertices")
+                        prof.count("faces_skipped")
+                        continue #skips this face and moves on to the next face.
+                    if len(ring) < 3:
+                        print("WARNING: Error creating face", faceIndex, ", skipping...")
+                        prof.count("faces_skipped")
+                        continue
+                    if normalVector == None:
+                        #Calculate the normal from the first 3 vertices in the list.  BUT, in the unlikely, but still very
+                        #possible event that the 3 vertices selected are inline (ie: a perfect 180 degree angle is formed,
+                        #and therefore the normal cannot be derived from those 3 points), we move down the list one vertex
+                        #and try again.  Eventually, we'll reach a vertex triplet that will work.  If we don't, just move
+                        #on to the next face.
+                        n = len(ring)
+                        for i in range(0,n):
+                            normalVector = CalculateNormal( GetCoord(ring[i]) , GetCoord(ring[(i+n-1)%n]) , GetCoord(ring[(i+1)%n]) )
+                            if not normalVector == None:
+                                break
+                        if normalVector == None: #this only happens if the face is made of colinear vertices; an invalid face.
+                            prof.count("faces_skipped")
+                            continue
+                    if not AddPolygon(ring, normalVector, texSettings):
+                        print("WARNING: Error creating face", faceIndex, ", skipping...")
+                        prof.count("faces_skipped")
+                else:
+                    #Only faces with holes are triangulated here.  The rest go to Blender as they are, so triangles,
+                    #quads and other simple faces never get to Triangulation.
+                    p = Triangulation.polygon(mesh, faceIndex)
+                    prof.count("faces_triangulated")
+                    tris = p.triangles
+                    for t in range(0, len(tris), 3):
+                        ring = (tris[t], tris[t+1], tris[t+2])
+                        #Same checks as above, per triangle: the holes can share vertices with the border or each other
+                        if len(set(ring)) != 3:
+                            print("WARNING: Skipping a triangle of face", faceIndex, "as it contained duplicate vertices")
+                            prof.count("faces_skipped")
+                            continue
+                        if normalVector == None:
+                            normalVector = CalculateNormal( GetCoord(ring[0]) , GetCoord(ring[1]) , GetCoord(ring[2]) )
+                        if not AddPolygon(ring, normalVector, texSettings):
+                            print("WARNING: Error creating a triangle of face", faceIndex, ", skipping...")
+                            prof.count("faces_skipped")
+        
+        prof.count("polygons", len(polyStarts))
+        
+        ### Import Materials ###
+        with prof.phase("material resolve"):
+            if (import_textures):
+                prof.count("material_resolve_cache_hits" if resolved != None else "material_resolve_cache_misses")
+                if resolved == None:
+                    resolved = materialJobs.result()
+                    cached.storeMaterials(validPaths, resolved, materialJobs.index.result().getChecked())
+                    GetMaterialCache().save()
+                images = ImageCache()
+                for material, res in zip(mesh.materials, resolved):
+                    b = LoadMaterial(validPaths, material, textures, images, res)
+                    bMats.append(b)
+                    if b == None:
+                        print("WARNING: Unable to locate texture file for \"", material, "\".  UVs may be distorted!")
+    finally:
+        #Normally the jobs are all done by now, but if anything went wrong on the way, don't leave them running
+        if materialJobs != None:
+            materialJobs.cancel()
     
-    ### Import Edges ###
-    edges = []
-    for edge in sparkData.edgeChunk.edges:
-        edges.append( edge )
+    prof.count("uv_cache_hits" if uvs != None else "uv_cache_misses")
+    with prof.phase("uv"):
+        if uvs == None:
+            texSizes = [None] * len(mesh.materials)
+            for i in range(0, len(textures)):
+                if textures[i] != None:
+                    texSizes[i] = GetImageInfo(textures[i])[:2]
+            matrices = array.array('d')
+            for normalVector, texSettings in matrixKeys:
+                matrices.extend(ImportUtils.CalculateUVMatrix(normalVector, texSettings, CORRECT_UNIT_FACTOR, texSizes))
+            uvs = ImportUtils.ProjectUVs(flatCoords, loopVerts, polyTotals, polyMatrices, matrices)
+            cached.uvs[uvKey] = uvs
+            parseCache.trim()
     
-    ### Import Faces ###
-    polys = []
-    tex_layer = bm.faces.layers.tex.verify()
-    for faceIndex, face in enumerate(sparkData.faceChunk.faces):
-        normalVector = None
-        texSettings = None
-        if (face.mapping == 4294967295): #FF FF FF FF as an unsigned 32-bit integer
-            #No mapping group applied, therefore we just go ahead and use the face's
-            #mapping settings
-            texSettings = (face.angle, face.xOffset, face.yOffset, face.xScale, face.yScale, face.material)
-        else:
-            mappingIndex = sparkData.mappingChunk.getMappingByID(face.mapping)
-            if (mappingIndex == -1):
-                #Mapping group doesn't exist, just go ahead and use the face normals
-                texSettings = (face.angle, face.xOffset, face.yOffset, face.xScale, face.yScale, face.material)
-            else:
-                map = sparkData.mappingChunk.mappingGroups[mappingIndex]
-                normalVector = [map.zNormal, map.xNormal, map.yNormal]
-                texSettings = (map.angle, map.xOffset, map.yOffset, map.xScale, map.yScale, face.material)
+    ### Build the Mesh ###
+    with prof.phase("to_mesh"):
+        me = bpy.data.meshes.new("ImportedSparkMesh")
+        me.vertices.add(mesh.vertexCount())
+        me.vertices.foreach_set("co", flatCoords)
+        me.loops.add(len(loopVerts))
+        me.loops.foreach_set("vertex_index", loopVerts)
+        me.polygons.add(len(polyStarts))
+        me.polygons.foreach_set("loop_start", polyStarts)
+        me.polygons.foreach_set("loop_total", polyTotals)
+        me.polygons.foreach_set("material_index", polyMaterials)
+        me.update(calc_edges=True)
         
-        f = []
-        if (face.innerLoops == None or face.innerLoops == [] or face.innerLoops[0].edgeLoopMembers == []):
-            # It's a polygon with no holes, hot damn!
-            v = [] #verts just for this face
-            
-            for loopM in face.borderLoop.edgeLoopMembers:
-                bm.verts.ensure_lookup_table()
-                v.append(bm.verts[edges[loopM.edge].b] if loopM.flipped else bm.verts[edges[loopM.edge].a])
-            
-            #Do a quick check to ensure this face doesn't have double verts.
-            faceValid = True
-            for vertIndex in range(0,len(v)):
-                if v.count(v[vertIndex]) != 1:
-                    faceValid = False
-                    break
-            if not faceValid:
-                print("WARNING: Skipping face", faceIndex, "as it contained duplicate vertices")
-                continue #skips this face and moves on to the next face.
-            try:
-                bmf = bm.faces.new(v)
-            except ValueError:
-                print("WARNING: Error creating face", faceIndex, ", skipping...")
-                continue
-            f.append(bmf)
-            if normalVector == None:
-                #Calculate the normal from the first 3 vertices in the list.  BUT, in the unlikely, but still very
-                #possible event that the 3 vertices selected are inline (ie: a perfect 180 degree angle is formed,
-                #and therefore the normal cannot be derived from those 3 points), we move down the list one vertex
-                #and try again.  Eventually, we'll reach a vertex triplet that will work.  If we don't, just move
-                #on to the next face.
-                foundNonCollinear = False
-                for i in range(0,len(v)):
-                    normalVector = CalculateNormal( v[i].co , v[(i+len(v)-1)%len(v)].co , v[(i+1)%len(v)].co )
-                    if not normalVector == None:
-                        foundNonCollinear = True
-                        break
-                if not foundNonCollinear: #this only happens if the face is made of colinear vertices; an invalid face.
-                    #Valid face cannot be formed, delete the face that was just added.
-                    bm.faces.remove(bmf)
-                    continue
-            MapUVsFromSparkTex(bm, bmf.index, normalVector, texSettings, CORRECT_UNIT_FACTOR, textures)
-            bm.faces[bmf.index][tex_layer].image=textures[texSettings[5]]
-            bm.faces[bmf.index].material_index = texSettings[5]
-        else:
-            p = Triangulation.polygon(face, sparkData)
-            polys.append( p )
-            norm = None
-            for triangle in p.triangles:
-                v1 = verts[triangle.v1.realId]
-                v2 = verts[triangle.v2.realId]
-                v3 = verts[triangle.v3.realId]
-                if normalVector == None:
-                    normalVector = CalculateNormal( v1.co , v2.co , v3.co )
-                bmf = bm.faces.new((v1,v2,v3))
-                f.append(bmf)
-                MapUVsFromSparkTex(bm, bmf.index, normalVector, texSettings, CORRECT_UNIT_FACTOR, textures)
-                bm.faces[bmf.index][tex_layer].image=textures[texSettings[5]]
-                bm.faces[bmf.index].material_index = texSettings[5]
+        uvTex = me.uv_textures.new()
+        me.uv_layers[uvTex.name].data.foreach_set("uv", uvs)
+        if len(textures) > 0: #Empty if textures weren't imported
+            for i in range(0, len(polyMaterials)):
+                image = textures[polyMaterials[i]]
+                if image != None:
+                    uvTex.data[i].image = image
+    
     #Now we need to go through and ensure that edges that were marked as smooth are now set as "sharp" in Blender.
-    #Yea it's a bit odd, but that's the only analog I could find that worked suitably well.  Unfortunately, there's
-    #no guarantee that the edges indices will line up from one mesh format to the other as new edges are created
-    #automatically by bmesh when the polygons are created.  Therefore we must loop through every spark edge and when
-    #we find a 'smooth' edge, we'll need to search through every bmesh edge for the match, and then set that to sharp.
-    bm.verts.index_update()
-    for sEdge in edges:
-        if (sEdge.smooth):
-            for bEdge in bm.edges:
-                if (bEdge.verts[0].index == sEdge.a) and (bEdge.verts[1].index == sEdge.b):
-                    bEdge.smooth = False
-                elif (bEdge.verts[0].index == sEdge.b) and (bEdge.verts[1].index == sEdge.a):
-                    bEdge.smooth = False
+    #Yea it's a bit odd, but that's the only analog I could find that worked suitably well.
+    with prof.phase("sharp edges"):
+        edgeVerts = array.array('i', [0]) * (len(me.edges) * 2)
+        me.edges.foreach_get("vertices", edgeVerts)
+        sharp = ImportUtils.FindSharpEdges(mesh.endpoints, mesh.smooth, edgeVerts)
+        me.edges.foreach_set("use_edge_sharp", sharp)
     
-    #That should be it!  Just need to convert it back to a mesh from the bmesh module.
+    #That should be it!  Just need to link the mesh into the scene.
     
-    mesh = bpy.data.meshes.new("ImportedSparkMesh")
-    bm.to_mesh(mesh)
-    bm.free()
     scene = bpy.context.scene
-    obj = bpy.data.objects.new("ImportedSparkMeshObject", mesh)
-    me = obj.data
+    obj = bpy.data.objects.new("ImportedSparkMeshObject", me)
     for bmat in bMats:
         me.materials.append(bmat)
     scene.objects.link(obj)
+    prof.finish()
     textures = []
\ No newline at end of file
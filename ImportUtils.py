@@ -0,0 +1,253 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# The parts of the importer that don't need Blender: the vertex and UV math, matching up the sharp edges, and the
+# cache of decoded clipboard payloads kept between imports.  Keeping them out of ImportSparkClipboard means they can
+# be tested without Blender.
+
+import array
+import collections
+import hashlib
+import math
+from . import SparkClasses
+from . import TextureIndex
+
+
+def TransformPositions(positions, CORRECT_UNIT_FACTOR, correctAxes):
+    '''Returns the flat x,y,z array of Spark vertex positions 'positions', scaled by CORRECT_UNIT_FACTOR and, if
+    'correctAxes' is set, turned from Spark's y-up axes to Blender's z-up ones (x,y,z -> z,x,y).  It's laid out
+    for vertices.foreach_set("co", ...).'''
+    numpy = SparkClasses.numpy
+    if numpy != None and len(positions) > 0:
+        co = numpy.frombuffer(positions, dtype=numpy.float32).reshape(-1, 3).astype(numpy.float64) * CORRECT_UNIT_FACTOR
+        if correctAxes:
+            co = co[:,(2, 0, 1)]
+        return array.array('f', co.astype(numpy.float32).tobytes())
+    
+    scaled = array.array('f', [v * CORRECT_UNIT_FACTOR for v in positions])
+    if not correctAxes:
+        return scaled
+    co = array.array('f', [0.0]) * len(scaled)
+    co[0::3] = scaled[2::3]
+    co[1::3] = scaled[0::3]
+    co[2::3] = scaled[1::3]
+    return co
+
+
+def CalculateUVMatrix(normalVector, texSettings, CORRECT_UNIT_FACTOR, texSizes):
+    '''Works out the mapping from a vertex position to its UV coordinates for a face with the given normal and
+    texture settings.  'texSizes' holds the (width, height) of each material's texture, or None if it has none.
+    It's an affine transform, returned as a tuple of 8 values: the u row (x, y, z, offset) followed by the v row,
+    so that u = ux*x + uy*y + uz*z + uo.'''
+    angle = texSettings[0]
+    xOffset = texSettings[1]*-1
+    yOffset = texSettings[2]*-1
+    xScale = texSettings[3]
+    yScale = texSettings[4]
+    material = texSettings[5]
+    texDim = (512, 512) #default value, if no texture is found
+    if (texSizes[material] != None):
+        texDim = texSizes[material]
+    norm = [normalVector[0], normalVector[1], normalVector[2]]
+    
+    #Correct the scaling values back to being in terms of image size, not meters.  Spark stores the scale
+    #in meters in the clipboard (scale value from editor = 39.37 * 8 / image dimensions)
+    xScale = (8*CORRECT_UNIT_FACTOR) / (xScale * texDim[0])
+    yScale = (8*CORRECT_UNIT_FACTOR) / (yScale * texDim[1])
+    
+    # First, we need to rotate the coordinates into the proper texture space.  Rather than rotating each vertex,
+    # we build up the rows of the rotation: xRow and yRow are what the vertex's x and y texture space coordinates
+    # are, in terms of its world x, y, and z.  I'm no good at this kind of math... so uh... buckle up if you're
+    # reading this.  Things are about to get rocky.
+    norm[0]*=-1
+    norm[1]*=-1
+    norm[2]*=-1
+    
+    #Allowing a 0.00127 margin of error for something being "flat" or not.  This is very close to spark's actual tolerance.
+    if ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] >= -0.99873 ):
+        #Normal is close enough to straight up
+        xRow = (1.0, 0.0, 0.0)
+        yRow = (0.0, 1.0, 0.0)
+    elif ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] <= 0.99873 ):
+        #Normal is close enough to straight down.  We'll just flip it.
+        xRow = (-1.0, 0.0, 0.0)
+        yRow = (0.0, -1.0, 0.0)
+    else:
+        a = math.pi - math.atan2( norm[0] , norm[1] ) #Z rotation of normal
+        c = math.cos(-a)
+        s = math.sin(-a)
+        xRow = (c, -s, 0.0)
+        yRow = (s, c, 0.0)
+        norm[1] = math.sqrt( ( norm[0]*norm[0] ) + ( norm[1]*norm[1] ) )
+        norm[0] = 0.0
+        
+        #Now we'll deal with the pitch (y axis)
+        a = -math.atan2( norm[1], norm[2] )
+        yRow = (yRow[0] * math.cos(a), yRow[1] * math.cos(a), -math.sin(a))
+    
+    #Now we need to rotate it once more around the z axis to cancel out the face's "angle"
+    c = math.cos(angle)
+    s = math.sin(angle)
+    uRow = [xRow[i] * c - yRow[i] * s for i in range(0,3)]
+    vRow = [xRow[i] * s + yRow[i] * c for i in range(0,3)]
+    
+    #Now the polygon should be completely flat, save for any minor imperfections due
+    #to >3 sided polygons never being technically 100% planar
+    #Okay, now we should be good to scale and offset to get where this vertex lies in UV-space
+    uScale = 8 / (texDim[0] * xScale)
+    vScale = 8 / (texDim[1] * yScale)
+    return (uRow[0] * uScale, uRow[1] * uScale, uRow[2] * uScale, -xOffset,
+            vRow[0] * vScale, vRow[1] * vScale, vRow[2] * vScale, yOffset)
+
+
+def ProjectUVs(coords, loopVerts, polyTotals, polyMatrices, matrices):
+    '''Calculates the UV coordinates of every loop of the mesh in one go.  'coords' is the flat x,y,z array of
+    vertex positions, 'loopVerts' the vertex index of each loop, 'polyTotals' the number of loops of each polygon,
+    'polyMatrices' the index of each polygon's UV matrix in 'matrices' (flat, 8 values per CalculateUVMatrix()).
+    Returns the flat u,v array to give to foreach_set.'''
+    numpy = SparkClasses.numpy
+    if numpy != None:
+        co = numpy.frombuffer(coords, dtype=numpy.float32).reshape(-1, 3).astype(numpy.float64)
+        co = co[numpy.frombuffer(loopVerts, dtype=numpy.int32)]
+        m = numpy.frombuffer(matrices, dtype=numpy.float64).reshape(-1, 2, 4)
+        m = m[numpy.repeat(numpy.frombuffer(polyMatrices, dtype=numpy.int32), numpy.frombuffer(polyTotals, dtype=numpy.int32))]
+        uvs = numpy.einsum('lij,lj->li', m[:,:,:3], co) + m[:,:,3]
+        return array.array('f', uvs.astype(numpy.float32).tobytes())
+    
+    uvs = array.array('f', [0.0]) * (len(loopVerts) * 2)
+    l = 0
+    for p in range(0, len(polyTotals)):
+        ux, uy, uz, uo, vx, vy, vz, vo = matrices[polyMatrices[p]*8:polyMatrices[p]*8+8]
+        for i in range(0, polyTotals[p]):
+            v = loopVerts[l] * 3
+            x = coords[v]
+            y = coords[v+1]
+            z = coords[v+2]
+            uvs[l*2] = ux*x + uy*y + uz*z + uo
+            uvs[l*2+1] = vx*x + vy*y + vz*z + vo
+            l += 1
+    return uvs
+
+
+def FindSharpEdges(endpoints, smooth, edgeVerts):
+    '''Works out which Blender edges need to be marked sharp, given the spark edges ('endpoints', two vertex
+    indices per edge, and 'smooth', one flag per edge) and the Blender edges ('edgeVerts', two vertex indices per
+    edge, as from foreach_get).  Returns a list with a bool per Blender edge.  There's no guarantee the edge
+    indices line up from one to the other, so edges are matched up by their (unordered) pair of vertices.'''
+    numpy = SparkClasses.numpy
+    if numpy != None:
+        def PairKeys(pairs):
+            pairs = numpy.sort(numpy.asarray(pairs, dtype=numpy.uint64).reshape(-1, 2), axis=1)
+            return (pairs[:,0] << numpy.uint64(32)) | pairs[:,1]
+        #isin only came in with NumPy 1.13, newer than some Blenders bundle, and in1d is gone from NumPy 2.4
+        isin = getattr(numpy, 'isin', None) or numpy.in1d
+        smoothKeys = PairKeys(endpoints)[numpy.frombuffer(smooth, dtype=numpy.uint8) != 0]
+        return isin(PairKeys(edgeVerts), smoothKeys).tolist()
+    
+    smoothPairs = set()
+    for e in range(0, len(smooth)):
+        if (smooth[e]):
+            a = endpoints[e*2]
+            b = endpoints[e*2+1]
+            smoothPairs.add((a, b) if a < b else (b, a))
+    sharp = [False] * (len(edgeVerts) // 2)
+    for e in range(0, len(sharp)):
+        a = edgeVerts[e*2]
+        b = edgeVerts[e*2+1]
+        if ((a, b) if a < b else (b, a)) in smoothPairs:
+            sharp[e] = True
+    return sharp
+
+
+class MaterialSnapshot:
+    '''What a set of ResolveMaterial() results depended on: the directories and files the TextureIndex checked to
+    find them (a file being added, removed or renamed changes its directory's mtime), and the .material and texture
+    files that were found.  If any of them have changed, the materials need resolving again.'''
+    def __init__(self, resolved, checked):
+        self.files = dict(checked) #path -> mtime, or None if it didn't exist
+        for mGrouping, tex in resolved:
+            paths = [tex]
+            if mGrouping != None:
+                paths += [mGrouping.file, mGrouping.albedoMap, mGrouping.normalMap, mGrouping.specularMap,
+                          mGrouping.opacityMap, mGrouping.emissiveMap]
+            for path in paths:
+                if path != None and path != '' and not path in self.files:
+                    self.files[path] = TextureIndex.GetMTime(path)
+    
+    def isCurrent(self):
+        for path, mtime in self.files.items():
+            if TextureIndex.GetMTime(path) != mtime:
+                return False
+        return True
+
+
+class ParseCacheEntry:
+    '''Everything a repeat import of one clipboard payload can reuse'''
+    def __init__(self, mesh):
+        self.mesh = mesh        #SparkMeshColumns
+        self.materials = {}     #texture directories -> (ResolveMaterial() result for each material, MaterialSnapshot)
+        self.uvs = {}           #import settings -> UVs (flat u,v array)
+    
+    def getMaterials(self, texPaths):
+        '''Returns the ResolveMaterial() results for the texture directories 'texPaths', or None if there aren't
+        any, or the files they came from have changed since.  In that case the UVs worked out from them are
+        dropped too.'''
+        key = tuple(texPaths)
+        entry = self.materials.get(key)
+        if entry == None:
+            return None
+        resolved, snapshot = entry
+        if not snapshot.isCurrent():
+            del self.materials[key]
+            for uvKey in [k for k in self.uvs if k[3] == key]:
+                del self.uvs[uvKey]
+            return None
+        return resolved
+    
+    def storeMaterials(self, texPaths, resolved, checked):
+        '''Keeps the ResolveMaterial() results for the texture directories 'texPaths'.  'checked' is what the
+        TextureIndex checked to find them, from getChecked().'''
+        self.materials[tuple(texPaths)] = (resolved, MaterialSnapshot(resolved, checked))
+    
+    def getMemorySize(self):
+        #Only what's kept: the raw clipboard data isn't
+        return self.mesh.getMemorySize() + sum(uvs.itemsize * len(uvs) for uvs in self.uvs.values())
+
+
+class ParseCache:
+    '''Keeps the decoded data of the last few clipboard payloads imported, keyed by a hash of the raw bytes, so
+    pasting the same selection again skips decoding, material resolution, and UV math.  The least recently used
+    entries are dropped once there are more than 'maxEntries' of them, or they take up more than 'maxBytes'.'''
+    def __init__(self, maxEntries = 4, maxBytes = 256 * 1024 * 1024):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+    
+    @staticmethod
+    def getKey(data):
+        '''Returns the key for the clipboard payload 'data' (bytes)'''
+        return hashlib.sha1(data).digest()
+    
+    def lookup(self, key):
+        '''Returns the entry for the payload with the given key, or None'''
+        entry = self.entries.get(key)
+        if entry != None:
+            self.entries.move_to_end(key)
+        return entry
+    
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.trim()
+    
+    def trim(self):
+        '''Drops the least recently used entries until the cache fits its limits again.  Call after adding to an
+        entry.'''
+        total = sum(entry.getMemorySize() for entry in self.entries.values())
+        while len(self.entries) > 0 and (len(self.entries) > self.maxEntries or total > self.maxBytes):
+            key, entry = self.entries.popitem(last=False)
+            total -= entry.getMemorySize()
+    
+    def clear(self):
+        self.entries.clear()
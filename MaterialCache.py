@@ -0,0 +1,69 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Persistent cache of what was read out of .material and .dds files, so importing from the same game install
+# over and over doesn't keep re-reading files that haven't changed.  Each entry is keyed by the file's path and
+# remembers the file's mtime; an entry is only used if the file's mtime still matches, otherwise the file is
+# read again.  The cache is a small JSON file, loaded once and saved after any import that changed it.
+
+import os
+import json
+import threading
+
+MATERIAL_CACHE_VERSION = 1
+MATERIAL_CACHE_FILENAME = "spark_material_cache.json"
+
+
+class MaterialCache:
+    """Cache of values read from files, each kept with the mtime of the file it came from.  The values are
+    grouped into sections (eg: 'materials', 'textures') and must be JSON-friendly.  'cacheFile' is where it's
+    saved, or None to only keep it in memory.  Safe to use from several threads at once."""
+    def __init__(self, cacheFile = None):
+        self.cacheFile = cacheFile
+        self.sections = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        if cacheFile != None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cacheFile, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return #Missing or corrupt, start over
+        if isinstance(data, dict) and data.get('version') == MATERIAL_CACHE_VERSION:
+            self.sections = data.get('sections', {})
+
+    def get(self, section, path, read):
+        """Returns the value for the file at 'path', calling read(path) for a fresh one if there's no entry for it
+        or the file has changed since.  Files that can't be stat'ed aren't cached."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return read(path)
+        with self.lock:
+            entry = self.sections.get(section, {}).get(path)
+        if entry != None and entry[0] == mtime:
+            return entry[1]
+        value = read(path)
+        with self.lock:
+            self.sections.setdefault(section, {})[path] = (mtime, value)
+            self.dirty = True
+        return value
+
+    def save(self):
+        """Writes the cache out, if anything's changed since it was loaded"""
+        if self.cacheFile == None or not self.dirty:
+            return
+        tmp = self.cacheFile + '.tmp'
+        with self.lock:
+            data = json.dumps({'version' : MATERIAL_CACHE_VERSION, 'sections' : self.sections})
+            self.dirty = False
+        try:
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.cacheFile)
+        except OSError as e:
+            print("WARNING: Unable to save material cache to \"", self.cacheFile, "\":", e)
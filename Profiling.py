@@ -0,0 +1,111 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Optional timing of the phases of an import or export, plus a few counters, reported as JSON.  Turned on with
+# the operators' "Profile" option, or by setting the SPARK_PROFILE environment variable: to "1" to print the
+# report to the console, or to a file path to write it there as well.  When it's off, GetProfiler() hands out a
+# profiler that does nothing.
+
+import os
+import time
+import json
+import collections
+
+PROFILE_ENV_VAR = "SPARK_PROFILE"
+
+
+class PhaseTimer:
+    """Context manager that adds the time spent inside it to one of the profiler's phases"""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.profiler.addTime(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """Collects phase times and counters for one import or export ('operation')"""
+    enabled = True
+
+    def __init__(self, operation, reportFile = None):
+        self.operation = operation
+        self.reportFile = reportFile
+        #Plain dicts only keep their order from Python 3.6 on
+        self.phases = collections.OrderedDict() #name -> [seconds, times entered], in the order they were first entered
+        self.counters = collections.OrderedDict()
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        """Returns a context manager timing the phase 'name'.  Entering the same phase again adds to its time."""
+        return PhaseTimer(self, name)
+
+    def addTime(self, name, seconds):
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def getReport(self):
+        """Returns the report as a JSON-friendly dict"""
+        return collections.OrderedDict((
+            ('operation', self.operation),
+            ('total_seconds', time.perf_counter() - self.start),
+            ('phases', [collections.OrderedDict((('name', name), ('seconds', seconds), ('calls', calls)))
+                        for name, (seconds, calls) in self.phases.items()]),
+            ('counters', collections.OrderedDict(self.counters)),
+            ))
+
+    def finish(self):
+        """Prints the report to the console, and writes it to the report file if there is one"""
+        report = json.dumps(self.getReport(), indent = 2)
+        print("Spark", self.operation, "profile:")
+        print(report)
+        if self.reportFile != None:
+            try:
+                with open(self.reportFile, 'w') as f:
+                    f.write(report)
+            except OSError as e:
+                print("WARNING: Unable to write profile report to \"", self.reportFile, "\":", e)
+
+
+class NullPhaseTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+class NullProfiler:
+    """Stands in for Profiler when profiling is off, doing nothing"""
+    enabled = False
+    timer = NullPhaseTimer()
+
+    def phase(self, name):
+        return self.timer
+
+    def count(self, name, n = 1):
+        pass
+
+    def finish(self):
+        pass
+
+nullProfiler = NullProfiler()
+
+
+def GetProfiler(operation, enabled = False):
+    """Returns a Profiler for 'operation' if profiling is turned on, either by 'enabled' (the operator's option)
+    or the SPARK_PROFILE environment variable, or the NullProfiler otherwise"""
+    setting = os.environ.get(PROFILE_ENV_VAR, "")
+    if not enabled and setting in ("", "0"):
+        return nullProfiler
+    reportFile = setting if not setting in ("", "0", "1") else None
+    return Profiler(operation, reportFile)
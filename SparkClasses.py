@@ -5,180 +5,298 @@
 # Last modified November 22, 2014
 
 import struct
+import array
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None #Bulk decoding falls back to struct.iter_unpack without it
+
+class LazyChunk:
+    """Attribute holding one of the sub-chunks of a SparkMeshChunkClipboard.  If the clipboard data was read
+    lazily, the chunk is only decoded the first time the attribute is accessed, then kept."""
+    def __init__(self, name):
+        self.name = name
+    
+    def __get__(self, mc, owner):
+        if mc == None:
+            return self
+        if self.name in mc._chunkOffsets:
+            if mc._sD == None:
+                raise SparkError("Can't read the " + self.name + ", the data it was in has been released!")
+            mc._sD.dPt = mc._chunkOffsets.pop(self.name)
+            chunk = CHUNK_CLASSES[self.name]()
+            chunk.readData(mc._sD)
+            mc._chunks[self.name] = chunk
+        return mc._chunks.get(self.name)
+    
+    def __set__(self, mc, value):
+        mc._chunkOffsets.pop(self.name, None)
+        mc._chunks[self.name] = value
 
 class SparkMeshChunkClipboard:
     """Contains all the sub-chunks that make up the mesh chunk"""
+    materialChunk = LazyChunk('materialChunk')
+    vertexChunk = LazyChunk('vertexChunk')
+    edgeChunk = LazyChunk('edgeChunk')
+    faceChunk = LazyChunk('faceChunk')
+    mappingChunk = LazyChunk('mappingChunk')
+    
     def __init__(self):
-        self.materialChunk = None
-        self.vertexChunk = None
-        self.edgeChunk = None
-        self.faceChunk = None
-        self.mappingChunk = None
-    def constructFromBinString(self, data):
-        sD = SparkData(data)
-
-        if (sD.readL() != 1):
-            raise SparkError("Data in clipboard doesn't appear to be valid (header byte not 1???)")
+        self._chunks = {}
+        self._chunkOffsets = {} #offset of the length field of each chunk that has yet to be decoded
+        self._sD = None
         
-        rem = sD.readL() + 4
-
-        if (sD.readS() != 2):
-            raise SparkError("No geometry data detected in clipboard!")
-        chunkOrder = [4,1,2,3,6,7,8]
-        chunkNames = ["vertex", "edge", "face", "material", "unknown", "face-layers", "mapping", "geometry group"]
-        expectedChunk = 0
-        while (sD.dPt < (rem)):
-            chunkID = sD.readL()
-            if (chunkID != chunkOrder[expectedChunk]) and (expectedChunk < len(chunkOrder)):
-                if (chunkID >= 1 and chunkID <= 8):
-                    print("Warning2: Expected chunk ", chunkOrder[expectedChunk], " (", chunkNames[chunkOrder[expectedChunk]-1], "), but got chunk ", chunkID, " (", chunkNames[chunkID-1],") instead.  Proceeding with caution...")
-                else:
-                    print("Warning: Expected chunk ", chunkOrder[expectedChunk], " (", chunkNames[chunkOrder[expectedChunk]-1], "), but got chunk ", chunkID, " (unknown) instead.  Proceeding with caution...")
-            if (chunkID == 4):
-                self.materialChunk = SparkMaterialChunk()
-                self.materialChunk.readData(sD)
-            elif (chunkID == 1):
-                self.vertexChunk = SparkVertexChunk()
-                self.vertexChunk.readData(sD)
-            elif (chunkID == 2):
-                self.edgeChunk = SparkEdgeChunk()
-                self.edgeChunk.readData(sD)
-            elif (chunkID == 3):
-                self.faceChunk = SparkFaceChunk()
-                self.faceChunk.readData(sD)
-            elif (chunkID == 6):
-                sD.skipChunk()
-            elif (chunkID == 7):
-                self.mappingChunk = SparkMappingGroupChunk()
-                self.mappingChunk.readData(sD)
-            elif (chunkID == 8):
-                sD.skipChunk()
-            else:
+    def constructFromBinString(self, data, lazy = False):
+        """Reads the mesh chunk from the binary clipboard data.  The chunk headers are scanned first to find
+        where each sub-chunk lives.  If 'lazy' is True, the sub-chunks are left undecoded until they are first
+        accessed, so questions like "which materials?" or "how many faces?" don't pay for the whole clip."""
+        self.constructFromChunkTable(data, ReadChunkTable(data), lazy)
+    
+    def constructFromChunkTable(self, data, table, lazy = False):
+        """Same as constructFromBinString, but uses an already known list of (chunk id, offset, length) tuples
+        rather than scanning the chunk headers.  The offsets point at the chunk ids, relative to 'data'."""
+        self._sD = SparkData(data)
+        self._chunks = {}
+        self._chunkOffsets = {}
+        for chunkID, offset, length in table:
+            if (offset + 8 + length > len(self._sD.data)):
+                raise SparkError("Chunk " + str(chunkID) + " runs past the end of the data!")
+            if (chunkID in CHUNK_ATTRIBUTES):
+                self._chunkOffsets[CHUNK_ATTRIBUTES[chunkID]] = offset + 4
+            elif not (chunkID == 6 or chunkID == 8): #face-layers and geometry groups aren't used
                 print("Warning: Unknown chunk detected.  Skipping, and attempting to proceed as usual.")
-                sD.skipChunk()
-                
-            expectedChunk +=1
-      
-    def convertToBinString(self):
-        ### Material Chunk ###
-        materialChunkData = b''
+        
+        if not lazy:
+            for name in CHUNK_ATTRIBUTES.values():
+                getattr(self, name)
+    
+    def release(self):
+        """Lets go of the data the mesh chunk was read from, so the buffer it's in can be closed.  Sub-chunks that
+        have already been decoded are kept; the rest can't be read any more."""
+        if self._sD != None:
+            self._sD.data.release()
+            self._sD = None
+    
+    def getMaterials(self):
+        """Returns the list of material paths used by the mesh"""
         if (self.materialChunk == None):
-            materialChunkData += writeL(1)
-            materialChunkData += writeNString("materials/dev/dev_1024x1024.material")
+            return []
+        return self.materialChunk.materials
+    
+    def getFaceCount(self):
+        """Returns the number of faces, without decoding the face chunk if it hasn't been already"""
+        if 'faceChunk' in self._chunkOffsets and self._sD != None:
+            sD = self._sD
+            sD.dPt = self._chunkOffsets['faceChunk'] + 4
+            return sD.readL()
+        if (self.faceChunk == None or self.faceChunk.faces == None):
+            return 0
+        return len(self.faceChunk.faces)
+    
+    def getBoundingBox(self):
+        """Returns the ((minX, minY, minZ), (maxX, maxY, maxZ)) bounds of the vertices, or None if there are none.
+        Only the vertex chunk is decoded to answer this."""
+        p = SparkMeshColumns.fromMeshChunkVertices(self.vertexChunk)
+        if (len(p) == 0):
+            return None
+        if numpy != None:
+            co = numpy.frombuffer(p, dtype=numpy.float32).reshape(-1, 3)
+            return (tuple(float(c) for c in co.min(axis=0)), tuple(float(c) for c in co.max(axis=0)))
+        return ((min(p[0::3]), min(p[1::3]), min(p[2::3])), (max(p[0::3]), max(p[1::3]), max(p[2::3])))
+      
+    def _encodedMaterials(self):
+        if (self.materialChunk == None or self.materialChunk.materials == None or self.materialChunk.materials == []):
+            return [DEFAULT_MATERIAL.encode()]
+        return [material.encode() for material in self.materialChunk.materials]
+    
+    def _vertexCount(self):
+        if (self.vertexChunk == None):
+            return 0
+        if (self.vertexChunk.positions != None):
+            return len(self.vertexChunk.flags)
+        return len(self.vertexChunk.vertices or [])
+    
+    def _edgeCount(self):
+        if (self.edgeChunk == None):
+            return 0
+        if (self.edgeChunk.endpoints != None):
+            return len(self.edgeChunk.smooth)
+        return len(self.edgeChunk.edges or [])
+    
+    def _faceCount(self):
+        if (self.faceChunk == None):
+            return 0
+        if (self.faceChunk.texParams != None):
+            return len(self.faceChunk.materialIds)
+        return len(self.faceChunk.faces or [])
+    
+    def _borderLoopLengths(self):
+        fC = self.faceChunk
+        if (fC == None):
+            return
+        if (fC.texParams != None):
+            for i in range(0, len(fC.materialIds)):
+                j = fC.loopStarts[i]
+                yield fC.memberStarts[j+1] - fC.memberStarts[j]
         else:
-            if (self.materialChunk.materials == None or self.materialChunk.materials == []):
-                materialChunkData+= writeL(1)
-                materialChunkData += writeNString("materials/dev/dev_1024x1024.material")
-            else:
-                materialChunkData+=writeL(len(self.materialChunk.materials))
-                for material in self.materialChunk.materials:
-                    materialChunkData+=writeNString(material)
+            for face in (fC.faces or []):
+                yield len(face.borderLoop.edgeLoopMembers)
+    
+    def _faceRecords(self):
+        """Yields the face header fields and the border loop (as (flipped, edge) pairs) of every face, from
+        either the face columns or the face objects"""
+        fC = self.faceChunk
+        if (fC == None):
+            return
+        if (fC.texParams != None):
+            p = fC.texParams
+            for i in range(0, len(fC.materialIds)):
+                j = fC.loopStarts[i]
+                members = range(fC.memberStarts[j], fC.memberStarts[j+1])
+                yield ((p[i*5], p[i*5+1], p[i*5+2], p[i*5+3], p[i*5+4], fC.mappingIds[i], fC.materialIds[i]),
+                       [(fC.memberFlipped[k], fC.memberEdges[k]) for k in members])
+        else:
+            for face in (fC.faces or []):
+                yield ((face.angle, face.xOffset, face.yOffset, face.xScale, face.yScale, face.mapping, face.material),
+                       [(1 if loop.flipped else 0, loop.edge) for loop in face.borderLoop.edgeLoopMembers])
+    
+    def _mappingGroups(self):
+        if (self.mappingChunk == None):
+            return []
+        return self.mappingChunk.mappingGroups or []
+    
+    def getBinSize(self, materials = None):
+        """Returns the exact number of bytes convertToBinString() will produce"""
+        if materials == None:
+            materials = self._encodedMaterials()
+        nFaces = self._faceCount()
+        size = 4 + 4 + 2 #mesh chunk id, length, and the geometry format short
+        size += 8 + 4 + sum(4 + len(m) for m in materials)
+        size += 8 + 4 + VERTEX_RECORD.size * self._vertexCount()
+        size += 8 + 4 + EDGE_RECORD.size * self._edgeCount()
+        size += 8 + 4 + sum(FACE_HEADER_RECORD.size + 4 + LOOP_MEMBER_RECORD.size * n for n in self._borderLoopLengths())
+        size += 8 + 4 + ((4 + 4 * nFaces) if nFaces > 0 else 0)
+        size += 8 + 4 + MAPPING_GROUP_RECORD.size * len(self._mappingGroups())
+        size += 8 + 12
+        return size
+    
+    def writeInto(self, buf, offset = 0):
+        """Encodes the mesh chunk straight into the writable buffer supplied (bytearray, memoryview, mmap...),
+        starting at 'offset'.  The buffer must already be zero-filled and at least getBinSize() bytes long.
+        Returns the offset just past the end of the written data."""
+        materials = self._encodedMaterials()
+        size = self.getBinSize(materials)
+        if (len(buf) - offset < size):
+            raise SparkError("Buffer too small to hold the mesh chunk (need " + str(size) + " bytes)")
+        pt = offset
         
-        materialChunkData = writeL(4) + writeL(len(materialChunkData)) + materialChunkData
+        def beginChunk(id, length):
+            CHUNK_HEADER.pack_into(buf, pt, id, length)
+            return pt + 8
+        
+        UINT32.pack_into(buf, pt, 1)
+        UINT32.pack_into(buf, pt+4, size - 8)
+        UINT16.pack_into(buf, pt+8, 2)
+        pt += 10
+        
+        ### Material Chunk ###
+        pt = beginChunk(4, 4 + sum(4 + len(m) for m in materials))
+        UINT32.pack_into(buf, pt, len(materials))
+        pt += 4
+        for m in materials:
+            UINT32.pack_into(buf, pt, len(m))
+            buf[pt+4:pt+4+len(m)] = m
+            pt += 4 + len(m)
         
         ### Vertex Chunk ###
-        vertexChunkData = b''
-        if (self.vertexChunk == None):
-            vertexChunkData += writeL(0)
-        else:
-            if (self.vertexChunk.vertices == None or self.vertexChunk.vertices == []):
-                vertexChunkData += writeL(0)
+        n = self._vertexCount()
+        pt = beginChunk(1, 4 + VERTEX_RECORD.size * n)
+        UINT32.pack_into(buf, pt, n)
+        pt += 4
+        if n > 0:
+            vC = self.vertexChunk
+            if (vC.positions != None and numpy != None):
+                recs = numpy.frombuffer(buf, dtype=VERTEX_DTYPE, count=n, offset=pt)
+                recs['co'] = numpy.frombuffer(vC.positions, dtype=numpy.float32).reshape(n, 3)
+                recs['flag'] = 1
+            elif (vC.positions != None):
+                p = vC.positions
+                for i in range(0, n):
+                    VERTEX_RECORD.pack_into(buf, pt + i*VERTEX_RECORD.size, p[i*3], p[i*3+1], p[i*3+2], 1)
             else:
-                vertexChunkData += writeL(len(self.vertexChunk.vertices))
-                for vertex in self.vertexChunk.vertices:
-                    vertexChunkData+=writeF(vertex.x)
-                    vertexChunkData+=writeF(vertex.y)
-                    vertexChunkData+=writeF(vertex.z)
-                    vertexChunkData+=writeB(1)
-        vertexChunkData = writeL(1) + writeL(len(vertexChunkData)) + vertexChunkData
+                for i, vertex in enumerate(vC.vertices):
+                    VERTEX_RECORD.pack_into(buf, pt + i*VERTEX_RECORD.size, vertex.x, vertex.y, vertex.z, 1)
+            pt += VERTEX_RECORD.size * n
         
         ### Edge Chunk ###
-        edgeChunkData = b''
-        if (self.edgeChunk == None):
-            edgeChunkData += writeL(0)
-        else:
-            if (self.edgeChunk.edges == None or self.edgeChunk.edges == []):
-                edgeChunkData += writeL(0)
+        n = self._edgeCount()
+        pt = beginChunk(2, 4 + EDGE_RECORD.size * n)
+        UINT32.pack_into(buf, pt, n)
+        pt += 4
+        if n > 0:
+            eC = self.edgeChunk
+            if (eC.endpoints != None and numpy != None):
+                recs = numpy.frombuffer(buf, dtype=EDGE_DTYPE, count=n, offset=pt)
+                recs['ab'] = numpy.frombuffer(eC.endpoints, dtype=numpy.uint32).reshape(n, 2)
+                recs['smooth'] = numpy.frombuffer(eC.smooth, dtype=numpy.uint8)
+            elif (eC.endpoints != None):
+                e = eC.endpoints
+                for i, smooth in enumerate(eC.smooth):
+                    EDGE_RECORD.pack_into(buf, pt + i*EDGE_RECORD.size, e[i*2], e[i*2+1], smooth)
             else:
-                edgeChunkData += writeL(len(self.edgeChunk.edges))
-                for edge in self.edgeChunk.edges:
-                    edgeChunkData+=writeL(edge.a)
-                    edgeChunkData+=writeL(edge.b)
-                    edgeChunkData+=writeB(1 if edge.smooth else 0)
-        edgeChunkData = writeL(2) + writeL(len(edgeChunkData)) + edgeChunkData
+                for i, edge in enumerate(eC.edges):
+                    EDGE_RECORD.pack_into(buf, pt + i*EDGE_RECORD.size, edge.a, edge.b, 1 if edge.smooth else 0)
+            pt += EDGE_RECORD.size * n
         
         ### Face Chunk ###
-        faceChunkData = b''
-        if (self.faceChunk == None):
-            faceChunkData += writeL(0)
-        else:
-            if (self.faceChunk.faces == None or self.faceChunk.faces == []):
-                faceChunkData += writeL(0)
-            else:
-                faceChunkData+= writeL(len(self.faceChunk.faces))
-                for face in self.faceChunk.faces:
-                    faceChunkData+=writeF(face.angle)
-                    faceChunkData+=writeF(face.xOffset)
-                    faceChunkData+=writeF(face.yOffset)
-                    faceChunkData+=writeF(face.xScale)
-                    faceChunkData+=writeF(face.yScale)
-                    faceChunkData+=writeL(face.mapping)
-                    faceChunkData+=writeL(face.material)
-                    faceChunkData+=writeL(0) #Blender doesn't support inner-loops
-                    faceChunkData+=writeL(len(face.borderLoop.edgeLoopMembers))
-                    for loop in face.borderLoop.edgeLoopMembers:
-                        faceChunkData+=writeL(1 if loop.flipped else 0)
-                        faceChunkData+=writeL(loop.edge)
-        faceChunkData = writeL(3) + writeL(len(faceChunkData)) + faceChunkData
-          
+        nFaces = self._faceCount()
+        pt = beginChunk(3, 4 + sum(FACE_HEADER_RECORD.size + 4 + LOOP_MEMBER_RECORD.size * n for n in self._borderLoopLengths()))
+        UINT32.pack_into(buf, pt, nFaces)
+        pt += 4
+        for header, members in self._faceRecords():
+            FACE_HEADER_RECORD.pack_into(buf, pt, *header,
+                                         0) #Blender doesn't support inner-loops
+            UINT32.pack_into(buf, pt + FACE_HEADER_RECORD.size, len(members))
+            pt += FACE_HEADER_RECORD.size + 4
+            for flipped, edge in members:
+                LOOP_MEMBER_RECORD.pack_into(buf, pt, flipped, edge)
+                pt += LOOP_MEMBER_RECORD.size
+        
         ### Face-layers Chunk ###
-        faceLayersChunkData = b''
-        if (self.faceChunk == None):
-            faceLayersChunkData += writeL(0)
+        if nFaces > 0:
+            pt = beginChunk(6, 8 + 4 * nFaces)
+            UINT32.pack_into(buf, pt, nFaces)
+            UINT32.pack_into(buf, pt+4, 2) #Format number (?)
+            pt += 8 + 4 * nFaces #Always 0... and the buffer is already zeroed
         else:
-            if (self.faceChunk.faces == None or self.faceChunk.faces == []):
-                faceLayersChunkData += writeL(0)
-            else:
-                faceLayersChunkData+= writeL(len(self.faceChunk.faces))
-                faceLayersChunkData+= writeL(2) #Format number (?)
-                for face in self.faceChunk.faces:
-                    faceLayersChunkData+= writeL(0) #Always 0...
-        faceLayersChunkData = writeL(6) + writeL(len(faceLayersChunkData)) + faceLayersChunkData
-          
+            pt = beginChunk(6, 4)
+            UINT32.pack_into(buf, pt, 0)
+            pt += 4
+        
         ### Mapping Chunk ###
-        mappingChunkData = b''
-        if (self.mappingChunk == None):
-            mappingChunkData += writeL(0)
-        else:
-            if (self.mappingChunk.mappingGroups == None or self.mappingChunk.mappingGroups == []):
-                mappingChunkData += writeL(0)
-            else:
-                mappingChunkData+= writeL(len(self.mappingChunk.mappingGroups))
-                for map in self.mappingChunk.mappingGroups:
-                    mappingChunkData+=writeL(map.id)
-                    mappingChunkData+=writeF(map.angle)                     
-                    mappingChunkData+=writeF(map.xScale)
-                    mappingChunkData+=writeF(map.yScale)
-                    mappingChunkData+=writeF(map.xOffset)
-                    mappingChunkData+=writeF(map.yOffset)
-                    mappingChunkData+=writeF(map.xNormal)
-                    mappingChunkData+=writeF(map.yNormal)
-                    mappingChunkData+=writeF(map.zNormal)
-        mappingChunkData = writeL(7)+writeL(len(mappingChunkData))+mappingChunkData
+        mappingGroups = self._mappingGroups()
+        pt = beginChunk(7, 4 + MAPPING_GROUP_RECORD.size * len(mappingGroups))
+        UINT32.pack_into(buf, pt, len(mappingGroups))
+        pt += 4
+        for map in mappingGroups:
+            MAPPING_GROUP_RECORD.pack_into(buf, pt, map.id, map.angle, map.xScale, map.yScale, map.xOffset, map.yOffset,
+                                           map.xNormal, map.yNormal, map.zNormal)
+            pt += MAPPING_GROUP_RECORD.size
         
         ### Geometry Group Chunk ###
-        geometryGroupChunk = b''
-        geometryGroupChunk += writeL(8) #Chunk Id = 8
-        geometryGroupChunk += writeL(12) #Chunk length = 12 bytes
-        geometryGroupChunk += writeL(0) #0 vertex groups
-        geometryGroupChunk += writeL(0) #0 edge groups
-        geometryGroupChunk += writeL(0) #0 face groups
+        pt = beginChunk(8, 12) #0 vertex groups, 0 edge groups, 0 face groups (already zeroed)
+        pt += 12
         
-        meshChunk = materialChunkData + vertexChunkData + edgeChunkData + faceChunkData + faceLayersChunkData + mappingChunkData + geometryGroupChunk
-        meshChunk = writeS(2) + meshChunk
-        meshChunk = writeL(1) + writeL(len(meshChunk)) + meshChunk
-        
-        return meshChunk
+        return pt
+    
+    def convertToBinString(self):
+        """Returns the binary clipboard representation of the mesh chunk.  The exact size is computed up front
+        and everything is written into a single buffer."""
+        buf = bytearray(self.getBinSize())
+        self.writeInto(buf)
+        return bytes(buf)
 
 class SparkMaterialChunk:
     """Contains all the materials that are used in the level geometry"""
@@ -190,18 +308,58 @@ class SparkMaterialChunk:
             self.materials.append(sD.readNString())
 
 class SparkVertexChunk:
-    """Contains all the vertices used in the level geometry"""
+    """Contains all the vertices used in the level geometry.  The vertices are decoded in bulk into the
+    flat 'positions' array (x,y,z for each vertex, as 32-bit floats) and the 'flags' array.  The list of
+    SparkVertex objects in 'vertices' is only built the first time it's asked for, after which it
+    becomes the authoritative copy of the data (the arrays are dropped)."""
+    def __init__(self):
+        self.positions = None
+        self.flags = None
+        self._vertices = None
+    
+    @property
+    def vertices(self):
+        if self._vertices == None and self.positions != None:
+            p = self.positions
+            self._vertices = []
+            for i in range(0, len(self.flags)):
+                self._vertices.append(SparkVertex.fromCoords(p[i*3], p[i*3+1], p[i*3+2]))
+            self.positions = None
+            self.flags = None
+        return self._vertices
+    
+    @vertices.setter
+    def vertices(self, value):
+        self._vertices = value
+        self.positions = None
+        self.flags = None
+    
     def readData(self, sD):
         length = sD.readL()
         n = sD.readL()
-        self.vertices = []
-        for i in range(0, n):
-            sV = SparkVertex()
-            sV.readData(sD)
-            self.vertices.append(sV)
+        data = sD.readBlock(n * VERTEX_RECORD.size)
+        self._vertices = None
+        if numpy != None:
+            recs = numpy.frombuffer(data, dtype=VERTEX_DTYPE, count=n)
+            self.positions = array.array('f', recs['co'].tobytes())
+            self.flags = array.array('B', recs['flag'].tobytes())
+        else:
+            self.positions = array.array('f')
+            self.flags = array.array('B')
+            for x, y, z, flag in VERTEX_RECORD.iter_unpack(data):
+                self.positions.extend((x, y, z))
+                self.flags.append(flag)
 
 class SparkVertex:
     """Contains a single set of vertex data"""
+    @classmethod
+    def fromCoords(cls, x, y, z):
+        sV = cls()
+        sV.x = x
+        sV.y = y
+        sV.z = z
+        return sV
+    
     def readData(self, sD):
         self.x = sD.readF()
         self.y = sD.readF()
@@ -209,45 +367,195 @@ class SparkVertex:
         sD.nSkip(1) ## Skip that one extra byte that doesn't seem to do anything
 
 class SparkEdgeChunk:
-    """Contains all the edges used in the level geometry"""
+    """Contains all the edges used in the level geometry.  Like the vertex chunk, the edges are decoded in
+    bulk into the flat 'endpoints' array (a,b for each edge, as unsigned 32-bit integers) and the 'smooth'
+    array (1 for smooth, 0 for sharp), and the SparkEdge objects in 'edges' are built on first access."""
+    def __init__(self):
+        self.endpoints = None
+        self.smooth = None
+        self._edges = None
+    
+    @property
+    def edges(self):
+        if self._edges == None and self.endpoints != None:
+            e = self.endpoints
+            self._edges = []
+            for i, smooth in enumerate(self.smooth):
+                self._edges.append(SparkEdge.fromEndpoints(e[i*2], e[i*2+1], smooth == 1))
+            self.endpoints = None
+            self.smooth = None
+        return self._edges
+    
+    @edges.setter
+    def edges(self, value):
+        self._edges = value
+        self.endpoints = None
+        self.smooth = None
+    
     def readData(self, sD):
         length = sD.readL()
         n = sD.readL()
-        self.edges = []
-        for i in range(0, n):
-            sE = SparkEdge()
-            sE.readData(sD)
-            self.edges.append(sE)
+        data = sD.readBlock(n * EDGE_RECORD.size)
+        self._edges = None
+        if numpy != None:
+            recs = numpy.frombuffer(data, dtype=EDGE_DTYPE, count=n)
+            self.endpoints = array.array('I', recs['ab'].tobytes())
+            self.smooth = array.array('B', (recs['smooth'] == 1).astype('u1').tobytes())
+        else:
+            self.endpoints = array.array('I')
+            self.smooth = array.array('B')
+            for a, b, smooth in EDGE_RECORD.iter_unpack(data):
+                self.endpoints.extend((a, b))
+                self.smooth.append(1 if smooth == 1 else 0)
 
 class SparkEdge:
     """Contains a single set of edge data"""
+    @classmethod
+    def fromEndpoints(cls, a, b, smooth):
+        sE = cls()
+        sE.a = a
+        sE.b = b
+        sE.smooth = smooth
+        return sE
+    
     def readData(self, sD):
         self.a = sD.readL()
         self.b = sD.readL()
         self.smooth = True if (sD.readB() == 1) else False
 
 class SparkFaceChunk:
-    """Contains all the faces used in the level geometry"""
+    """Contains all the faces used in the level geometry.  The faces can either be held as a list of SparkFace
+    objects, or as flat columns:
+        texParams     - angle, xOffset, yOffset, xScale, yScale for each face (32-bit floats)
+        mappingIds    - mapping group id of each face (FF FF FF FF for none)
+        materialIds   - material index of each face
+        loopStarts    - CSR offsets into the loops; face i owns loops loopStarts[i] to loopStarts[i+1], and
+                        the first of those is always the border loop
+        memberStarts  - CSR offsets into the loop members; loop j owns members memberStarts[j] to memberStarts[j+1]
+        memberEdges   - edge index of each loop member
+        memberFlipped - 1 if the loop member's edge is flipped, 0 otherwise
+    As with the vertex and edge chunks, the SparkFace objects are built from the columns on first access."""
+    def __init__(self):
+        self._dropColumns()
+        self._faces = None
+    
+    def _dropColumns(self):
+        self.texParams = None
+        self.mappingIds = None
+        self.materialIds = None
+        self.loopStarts = None
+        self.memberStarts = None
+        self.memberEdges = None
+        self.memberFlipped = None
+    
+    @property
+    def faces(self):
+        if self._faces == None and self.texParams != None:
+            self._faces = []
+            for i in range(0, len(self.materialIds)):
+                self._faces.append(SparkFace.fromColumns(self, i))
+            self._dropColumns()
+        return self._faces
+    
+    @faces.setter
+    def faces(self, value):
+        self._faces = value
+        self._dropColumns()
+    
     def readData(self, sD):
+        """Decodes the face chunk into the face columns in two passes.  The first pass just hops through the
+        variable-length face records, noting where each face header and each edge loop's members start.  The
+        second pass then pulls all the headers and all the (flipped, edge) pairs out in bulk."""
         length = sD.readL()
         n = sD.readL()
-        self.faces = []
-        for i in range(0, n):
-            sF = SparkFace()
-            sF.readData(sD)
-            self.faces.append(sF)
+        data = sD.data
+        pt = sD.dPt
+        faceOffsets = array.array('I')
+        memberOffsets = array.array('I') #byte offset of the first member of each loop
+        loopStarts = array.array('I', [0])
+        memberStarts = array.array('I', [0])
+        total = 0
+        try:
+            for i in range(0, n):
+                faceOffsets.append(pt)
+                numLoops = UINT32.unpack_from(data, pt + FACE_HEADER_RECORD.size - 4)[0] + 1 #inner loops + border loop
+                pt += FACE_HEADER_RECORD.size
+                for j in range(0, numLoops):
+                    count = UINT32.unpack_from(data, pt)[0]
+                    memberOffsets.append(pt + 4)
+                    pt += 4 + LOOP_MEMBER_RECORD.size * count
+                    total += count
+                    memberStarts.append(total)
+                loopStarts.append(len(memberStarts) - 1)
+        except struct.error:
+            raise SparkError("Unexpected end of data stream when reading the face chunk!")
+        if (pt > len(data)):
+            raise SparkError("Unexpected end of data stream when reading the face chunk!")
+        sD.dPt = pt
+        
+        self._faces = None
+        self.loopStarts = loopStarts
+        self.memberStarts = memberStarts
+        if (numpy != None):
+            buf = numpy.frombuffer(data, dtype=numpy.uint8)
+            offsets = numpy.frombuffer(faceOffsets, dtype=numpy.uint32).astype(numpy.intp)
+            headers = buf[offsets[:, None] + numpy.arange(FACE_HEADER_RECORD.size)].view(FACE_HEADER_DTYPE).reshape(-1)
+            self.texParams = array.array('f', headers['tex'].tobytes())
+            self.mappingIds = array.array('I', headers['mapping'].tobytes())
+            self.materialIds = array.array('I', headers['material'].tobytes())
+            
+            counts = numpy.diff(numpy.frombuffer(memberStarts, dtype=numpy.uint32)).astype(numpy.intp)
+            starts = numpy.frombuffer(memberStarts, dtype=numpy.uint32)[:-1].astype(numpy.intp)
+            offsets = numpy.frombuffer(memberOffsets, dtype=numpy.uint32).astype(numpy.intp)
+            memberBytes = numpy.repeat(offsets, counts) + LOOP_MEMBER_RECORD.size * (numpy.arange(total) - numpy.repeat(starts, counts))
+            members = buf[memberBytes[:, None] + numpy.arange(LOOP_MEMBER_RECORD.size)].view('<u4').reshape(-1, 2)
+            self.memberFlipped = array.array('B', (members[:, 0] == 1).astype(numpy.uint8).tobytes())
+            self.memberEdges = array.array('I', members[:, 1].tobytes())
+        else:
+            self.texParams = array.array('f')
+            self.mappingIds = array.array('I')
+            self.materialIds = array.array('I')
+            for offset in faceOffsets:
+                header = FACE_HEADER_RECORD.unpack_from(data, offset)
+                self.texParams.extend(header[:5])
+                self.mappingIds.append(header[5])
+                self.materialIds.append(header[6])
+            
+            members = array.array('I', b''.join(data[memberOffsets[j]:memberOffsets[j] + LOOP_MEMBER_RECORD.size * (memberStarts[j+1] - memberStarts[j])]
+                                                for j in range(0, len(memberOffsets))))
+            if sys.byteorder == 'big':
+                members.byteswap()
+            self.memberFlipped = array.array('B', [1 if flipped == 1 else 0 for flipped in members[0::2]])
+            self.memberEdges = members[1::2]
 
 class SparkFace:
     """Contains a single set of face data"""
+    @classmethod
+    def fromColumns(cls, columns, i):
+        """Builds the face object for face 'i' of a SparkFaceChunk or SparkMeshColumns"""
+        sF = cls()
+        p = columns.texParams
+        sF.angle, sF.xOffset, sF.yOffset, sF.xScale, sF.yScale = p[i*5], p[i*5+1], p[i*5+2], p[i*5+3], p[i*5+4]
+        sF.mapping = columns.mappingIds[i]
+        sF.material = columns.materialIds[i]
+        loops = []
+        for j in range(columns.loopStarts[i], columns.loopStarts[i+1]):
+            sEL = SparkEdgeLoop()
+            sEL.edgeLoopMembers = []
+            for k in range(columns.memberStarts[j], columns.memberStarts[j+1]):
+                selm = SparkEdgeLoopMember()
+                selm.flipped = columns.memberFlipped[k] == 1
+                selm.edge = columns.memberEdges[k]
+                sEL.edgeLoopMembers.append(selm)
+            loops.append(sEL)
+        sF.borderLoop = loops[0]
+        sF.innerLoops = loops[1:]
+        return sF
+    
     def readData(self, sD):
-        self.angle = sD.readF()
-        self.xOffset = sD.readF()
-        self.yOffset = sD.readF()
-        self.xScale = sD.readF()
-        self.yScale = sD.readF()
-        self.mapping = sD.readL() #(FF FF FF FF in hex)
-        self.material = sD.readL()
-        numInnerLoops = sD.readL()
+        (self.angle, self.xOffset, self.yOffset, self.xScale, self.yScale,
+         self.mapping, #(FF FF FF FF in hex)
+         self.material, numInnerLoops) = sD.readRecord(FACE_HEADER_RECORD)
         self.borderLoop = SparkEdgeLoop()
         self.borderLoop.readData(sD)
         self.innerLoops = []
@@ -269,11 +577,30 @@ class SparkEdgeLoop:
 class SparkEdgeLoopMember:
     """Contains a single edge loop member"""
     def readData(self, sD):
-        self.flipped = True if (sD.readL() == 1) else False
-        self.edge = sD.readL()
+        flipped, self.edge = sD.readRecord(LOOP_MEMBER_RECORD)
+        self.flipped = True if (flipped == 1) else False
 
 class SparkMappingGroupChunk:
-    """Contains the mapping group information"""
+    """Contains the mapping group information.  Alongside the list of groups, it keeps an id -> list index map,
+    and the texture settings of each group laid out like a face's (angle, xOffset, yOffset, xScale, yScale)
+    plus its normal, so the importer and exporter can look groups up without scanning the list.  So that the map
+    can't go stale, the list is only handed out as a tuple: groups are added with addMappingGroup(), replaced
+    with setMappingGroup(), or the whole list swapped by assigning to mappingGroups.  A group mustn't be changed
+    once it's in the chunk; replace it with a new one instead."""
+    def __init__(self):
+        self._mappingGroups = []
+        self._index = {}
+        self._params = []
+    
+    @property
+    def mappingGroups(self):
+        return tuple(self._mappingGroups)
+    
+    @mappingGroups.setter
+    def mappingGroups(self, value):
+        self._mappingGroups = list(value or [])
+        self._reindex()
+    
     def readData(self, sD):
         length = sD.readL()
         n = sD.readL()
@@ -281,27 +608,278 @@ class SparkMappingGroupChunk:
         for i in range(0, n):
             sMG = SparkMappingGroup()
             sMG.readData(sD)
-            self.mappingGroups.append(sMG)
+            self.addMappingGroup(sMG)
+    
+    def addMappingGroup(self, map):
+        """Appends a mapping group, keeping the id index up to date"""
+        self._mappingGroups.append(map)
+        self._indexGroup(len(self._mappingGroups) - 1, map)
+    
+    def setMappingGroup(self, i, map):
+        """Replaces the mapping group at list index 'i', keeping the id index up to date"""
+        self._mappingGroups[i] = map
+        self._reindex()
+    
+    def _reindex(self):
+        self._index = {}
+        self._params = []
+        for i, map in enumerate(self._mappingGroups):
+            self._indexGroup(i, map)
+    
+    def _indexGroup(self, i, map):
+        self._index.setdefault(map.id, i) #first group with a given id wins, same as the old linear search
+        self._params.append(((map.angle, map.xOffset, map.yOffset, map.xScale, map.yScale),
+                             (map.xNormal, map.yNormal, map.zNormal)))
     
     def getMappingByID(self, id):
-        for i,map in enumerate(self.mappingGroups):
-            if map.id == id:
-                return i
-        return -1
+        """Returns the list index of the mapping group with the given id, or -1 if there isn't one"""
+        return self._index.get(id, -1)
+    
+    def getMappingParams(self, id):
+        """Returns ((angle, xOffset, yOffset, xScale, yScale), (xNormal, yNormal, zNormal)) for the mapping group
+        with the given id, or None if there isn't one"""
+        i = self._index.get(id, -1)
+        if (i == -1):
+            return None
+        return self._params[i]
 
 class SparkMappingGroup:
     """Contains a single mapping group"""
     def readData(self, sD):
-        self.id = sD.readL()
-        self.angle = sD.readF()
-        self.xScale = sD.readF()
-        self.yScale = sD.readF()
-        self.xOffset = sD.readF()
-        self.yOffset = sD.readF()
-        self.xNormal = sD.readF()
-        self.yNormal = sD.readF()
-        self.zNormal = sD.readF()
+        (self.id, self.angle, self.xScale, self.yScale, self.xOffset, self.yOffset,
+         self.xNormal, self.yNormal, self.zNormal) = sD.readRecord(MAPPING_GROUP_RECORD)
+        
+class SparkMeshColumns:
+    """Structure-of-arrays version of SparkMeshChunkClipboard.  Holds the same data as the chunk classes, but
+    in flat arrays rather than one Python object per vertex/edge/face/loop, which keeps big clips small and
+    lets the importer, exporter and merging work on whole columns at once.
+        positions - x,y,z of each vertex (32-bit floats)
+        endpoints - a,b vertex indices of each edge
+        smooth    - 1 for each smooth edge, 0 for each sharp edge
+        texParams, mappingIds, materialIds, loopStarts, memberStarts, memberEdges, memberFlipped -
+                    the face columns, laid out exactly like SparkFaceChunk's
+        materials - list of material paths
+        mappingChunk - the SparkMappingGroupChunk (mapping groups are few enough to stay as objects)"""
+    def __init__(self):
+        self.materials = []
+        self.positions = array.array('f')
+        self.endpoints = array.array('I')
+        self.smooth = array.array('B')
+        self.texParams = array.array('f')
+        self.mappingIds = array.array('I')
+        self.materialIds = array.array('I')
+        self.loopStarts = array.array('I', [0])
+        self.memberStarts = array.array('I', [0])
+        self.memberEdges = array.array('I')
+        self.memberFlipped = array.array('B')
+        self.mappingChunk = SparkMappingGroupChunk()
+    
+    def vertexCount(self):
+        return len(self.positions) // 3
+    
+    def edgeCount(self):
+        return len(self.smooth)
+    
+    def faceCount(self):
+        return len(self.materialIds)
+    
+    def getMemorySize(self):
+        """Returns roughly how many bytes the columns take up"""
+        size = sum(len(col) * col.itemsize for col in (self.positions, self.endpoints, self.smooth) +
+                   tuple(getattr(self, name) for name in FACE_COLUMNS))
+        return size + sum(len(m) for m in self.materials) + 40 * len(self.mappingChunk.mappingGroups)
+    
+    def getVertex(self, v):
+        """Returns the (x,y,z) coordinates of vertex 'v'"""
+        p = self.positions
+        return (p[v*3], p[v*3+1], p[v*3+2])
+    
+    def getFaceLoopCount(self, f):
+        """Returns the number of edge loops of face 'f', including the border loop"""
+        return self.loopStarts[f+1] - self.loopStarts[f]
+    
+    def getLoopVertices(self, f, loop = 0):
+        """Returns the list of vertex indices going around edge loop 'loop' of face 'f'.  Loop 0 is the border
+        loop, the rest are the inner loops."""
+        j = self.loopStarts[f] + loop
+        e = self.endpoints
+        return [e[self.memberEdges[k]*2 + self.memberFlipped[k]] for k in range(self.memberStarts[j], self.memberStarts[j+1])]
+    
+    def addFace(self, angle, xOffset, yOffset, xScale, yScale, mapping, material, loops):
+        """Appends a face.  'loops' is a list of edge loops (border loop first), each one a list of
+        (flipped, edge) pairs."""
+        self.texParams.extend((angle, xOffset, yOffset, xScale, yScale))
+        self.mappingIds.append(mapping)
+        self.materialIds.append(material)
+        for loop in loops:
+            for flipped, edge in loop:
+                self.memberFlipped.append(1 if flipped else 0)
+                self.memberEdges.append(edge)
+            self.memberStarts.append(len(self.memberEdges))
+        self.loopStarts.append(len(self.memberStarts) - 1)
+    
+    def append(self, other):
+        """Appends the mesh in 'other' (a SparkMeshColumns) to this one, in bulk.  Materials are merged by name,
+        mapping groups are carried over (given new ids where they clash with existing ones), and every index
+        in 'other' is offset to line up with the existing data.  Returns self."""
+        matIndex = {}
+        for i, mat in enumerate(self.materials):
+            matIndex.setdefault(mat, i)
+        matRefs = []
+        for mat in other.materials:
+            if not mat in matIndex:
+                matIndex[mat] = len(self.materials)
+                self.materials.append(mat)
+            matRefs.append(matIndex[mat])
+        
+        #Faces pointing at a mapping group that 'other' doesn't have end up with no mapping group, rather than
+        #accidentally picking up one of ours with the same id.  Either way the face's own settings get used.
+        usedIds = set(map.id for map in self.mappingChunk.mappingGroups)
+        nextId = 0
+        mapRefs = {NO_MAPPING: NO_MAPPING}
+        for map in (other.mappingChunk.mappingGroups or []):
+            newMap = SparkMappingGroup()
+            newMap.__dict__.update(map.__dict__)
+            if newMap.id in usedIds:
+                while nextId in usedIds:
+                    nextId += 1
+                newMap.id = nextId
+            usedIds.add(newMap.id)
+            mapRefs[map.id] = newMap.id
+            self.mappingChunk.addMappingGroup(newMap)
+        
+        self.materialIds.extend(array.array('I', [matRefs[m] for m in other.materialIds]))
+        self.mappingIds.extend(array.array('I', [mapRefs.get(m, NO_MAPPING) for m in other.mappingIds]))
+        self.endpoints.extend(OffsetArray(other.endpoints, self.vertexCount()))
+        self.memberEdges.extend(OffsetArray(other.memberEdges, self.edgeCount()))
+        self.loopStarts.extend(OffsetArray(other.loopStarts[1:], self.loopStarts[-1]))
+        self.memberStarts.extend(OffsetArray(other.memberStarts[1:], self.memberStarts[-1]))
+        self.positions.extend(other.positions)
+        self.smooth.extend(other.smooth)
+        self.texParams.extend(other.texParams)
+        self.memberFlipped.extend(other.memberFlipped)
+        return self
+    
+    @staticmethod
+    def fromMeshChunkVertices(vC):
+        """Returns a flat x,y,z array of the vertices in the SparkVertexChunk 'vC' (which may be None)"""
+        if (vC != None and vC.positions != None):
+            return array.array('f', vC.positions)
+        positions = array.array('f')
+        if (vC != None and vC.vertices != None):
+            for v in vC.vertices:
+                positions.extend((v.x, v.y, v.z))
+        return positions
+    
+    @classmethod
+    def fromMeshChunk(cls, mc):
+        """Returns a new SparkMeshColumns holding a copy of the data in the SparkMeshChunkClipboard 'mc'"""
+        mesh = cls()
+        if (mc.materialChunk != None and mc.materialChunk.materials != None):
+            mesh.materials = list(mc.materialChunk.materials)
+        
+        mesh.positions = cls.fromMeshChunkVertices(mc.vertexChunk)
         
+        eC = mc.edgeChunk
+        if (eC != None and eC.endpoints != None):
+            mesh.endpoints = array.array('I', eC.endpoints)
+            mesh.smooth = array.array('B', eC.smooth)
+        elif (eC != None and eC.edges != None):
+            for e in eC.edges:
+                mesh.endpoints.extend((e.a, e.b))
+                mesh.smooth.append(1 if e.smooth else 0)
+        
+        fC = mc.faceChunk
+        if (fC != None and fC.texParams != None):
+            for name in FACE_COLUMNS:
+                setattr(mesh, name, array.array(getattr(fC, name).typecode, getattr(fC, name)))
+        elif (fC != None and fC.faces != None):
+            for f in fC.faces:
+                loops = [f.borderLoop] + (f.innerLoops or [])
+                mesh.addFace(f.angle, f.xOffset, f.yOffset, f.xScale, f.yScale, f.mapping, f.material,
+                             [[(m.flipped, m.edge) for m in loop.edgeLoopMembers] for loop in loops])
+        
+        if (mc.mappingChunk != None and mc.mappingChunk.mappingGroups != None):
+            mesh.mappingChunk.mappingGroups = list(mc.mappingChunk.mappingGroups)
+        return mesh
+    
+    def toMeshChunk(self):
+        """Returns a new SparkMeshChunkClipboard holding a copy of this data.  The chunks are column-backed, so
+        no per-vertex/edge/face objects are created unless they're asked for."""
+        mc = SparkMeshChunkClipboard()
+        mc.materialChunk = SparkMaterialChunk()
+        mc.materialChunk.materials = list(self.materials)
+        mc.vertexChunk = SparkVertexChunk()
+        mc.vertexChunk.positions = array.array('f', self.positions)
+        mc.vertexChunk.flags = array.array('B', [1]) * self.vertexCount()
+        mc.edgeChunk = SparkEdgeChunk()
+        mc.edgeChunk.endpoints = array.array('I', self.endpoints)
+        mc.edgeChunk.smooth = array.array('B', self.smooth)
+        mc.faceChunk = SparkFaceChunk()
+        for name in FACE_COLUMNS:
+            setattr(mc.faceChunk, name, array.array(getattr(self, name).typecode, getattr(self, name)))
+        mc.mappingChunk = SparkMappingGroupChunk()
+        mc.mappingChunk.mappingGroups = list(self.mappingChunk.mappingGroups)
+        return mc
+    
+    def convertToBinString(self):
+        return self.toMeshChunk().convertToBinString()
+
+CHUNK_ATTRIBUTES = {4: 'materialChunk', 1: 'vertexChunk', 2: 'edgeChunk', 3: 'faceChunk', 7: 'mappingChunk'}
+CHUNK_CLASSES = {'materialChunk': SparkMaterialChunk, 'vertexChunk': SparkVertexChunk, 'edgeChunk': SparkEdgeChunk,
+                 'faceChunk': SparkFaceChunk, 'mappingChunk': SparkMappingGroupChunk}
+
+FACE_COLUMNS = ('texParams', 'mappingIds', 'materialIds', 'loopStarts', 'memberStarts', 'memberEdges', 'memberFlipped')
+
+NO_MAPPING = 4294967295 #FF FF FF FF, face doesn't belong to a mapping group
+
+DEFAULT_MATERIAL = "materials/dev/dev_1024x1024.material"
+
+CHUNK_HEADER = struct.Struct("<2L") #chunk id, chunk length
+UINT32 = struct.Struct("<L")
+UINT16 = struct.Struct("<H")
+FLOAT32 = struct.Struct("<f")
+MAPPING_GROUP_RECORD = struct.Struct("<L8f") #id, angle, x/y scale, x/y offset, x/y/z normal
+FACE_HEADER_RECORD = struct.Struct("<5f3L") #angle, x/y offset, x/y scale, mapping, material, inner loop count
+LOOP_MEMBER_RECORD = struct.Struct("<2L") #flipped, edge
+VERTEX_RECORD = struct.Struct("<3fB") #x, y, z, unused flag byte
+EDGE_RECORD = struct.Struct("<2LB") #vertex a, vertex b, smooth flag
+if numpy != None:
+    VERTEX_DTYPE = numpy.dtype([('co', '<f4', (3,)), ('flag', 'u1')])
+    EDGE_DTYPE = numpy.dtype([('ab', '<u4', (2,)), ('smooth', 'u1')])
+    FACE_HEADER_DTYPE = numpy.dtype([('tex', '<f4', (5,)), ('mapping', '<u4'), ('material', '<u4'), ('innerLoops', '<u4')])
+
+def ReadChunkTable(data):
+    """Scans the chunk headers of the mesh chunk in the binary clipboard data, without decoding any of the
+    chunks, and returns a list of (chunk id, offset of the chunk id, chunk length) tuples in the order found."""
+    sD = SparkData(data)
+    table = []
+
+    if (sD.readL() != 1):
+        raise SparkError("Data in clipboard doesn't appear to be valid (header byte not 1???)")
+    
+    rem = sD.readL() + 4
+
+    if (sD.readS() != 2):
+        raise SparkError("No geometry data detected in clipboard!")
+    chunkOrder = [4,1,2,3,6,7,8]
+    chunkNames = ["vertex", "edge", "face", "material", "unknown", "face-layers", "mapping", "geometry group"]
+    expectedChunk = 0
+    while (sD.dPt < (rem)):
+        offset = sD.dPt
+        chunkID = sD.readL()
+        if (expectedChunk < len(chunkOrder)) and (chunkID != chunkOrder[expectedChunk]):
+            if (chunkID >= 1 and chunkID <= 8):
+                print("Warning2: Expected chunk ", chunkOrder[expectedChunk], " (", chunkNames[chunkOrder[expectedChunk]-1], "), but got chunk ", chunkID, " (", chunkNames[chunkID-1],") instead.  Proceeding with caution...")
+            else:
+                print("Warning: Expected chunk ", chunkOrder[expectedChunk], " (", chunkNames[chunkOrder[expectedChunk]-1], "), but got chunk ", chunkID, " (unknown) instead.  Proceeding with caution...")
+        length = sD.readL()
+        sD.nSkip(length)
+        table.append((chunkID, offset, length))
+            
+        expectedChunk +=1
+    return table
+
 class SparkError(Exception):
     def __init__(self,value):
         self.value = value
@@ -309,46 +887,59 @@ class SparkError(Exception):
         return repr(self.value)
 
 class SparkData: ###Spark binary data
+    """Read cursor over the raw clipboard data.  The data is wrapped in a memoryview and every read unpacks
+    straight out of it with a precompiled struct, so no intermediate byte strings are created.  The bounds
+    check is done by unpack_from itself, once per call, so reading a whole record with readRecord() costs a
+    single check rather than one per field."""
     def __init__(self, data):
-        self.data = data
+        self.data = memoryview(data).cast('B')
         self.dPt = 0
         
         
     def readL(self): ### Read 4 byte integer
         """Reads the next 4-byte integer from the data, and returns it"""
-        if (len(self.data) < self.dPt +4):
+        try:
+            r = UINT32.unpack_from(self.data, self.dPt)
+        except struct.error:
             raise SparkError("Unexpected end of data stream when reading a 4-byte integer!")
-        else:
-            r = struct.unpack("<L", self.data[self.dPt:self.dPt+4])
-            self.dPt += 4
-            return r[0]
+        self.dPt += 4
+        return r[0]
     
     def readF(self): ### Read 4 byte float
         """Reads the next 4-byte float from the data, and returns it"""
-        if (len(self.data) < self.dPt +4):
+        try:
+            r = FLOAT32.unpack_from(self.data, self.dPt)
+        except struct.error:
             raise SparkError("Unexpected end of data stream when reading a 4-byte float!")
-        else:
-            r = struct.unpack("<f", self.data[self.dPt:self.dPt+4])
-            self.dPt += 4
-            return r[0]
+        self.dPt += 4
+        return r[0]
         
     def readS(self): ### Read 2 byte integer
         """Reads the next 2-byte integer from the data, and returns it"""
-        if (len(self.data) < self.dPt +2):
+        try:
+            r = UINT16.unpack_from(self.data, self.dPt)
+        except struct.error:
             raise SparkError("Unexpected end of data stream when reading a 2-byte integer!")
-        else:
-            r = struct.unpack("<H", self.data[self.dPt:self.dPt+2])
-            self.dPt += 2
-            return r[0]
+        self.dPt += 2
+        return r[0]
     
     def readB(self): ### Read 1 byte, return an integer
         """Reads the next byte from the data, and returns it"""
-        if (len(self.data) < self.dPt+1):
-            raise SparkError("Unexpected end of data stream when reading a single byte!")
-        else:
+        try:
             r = self.data[self.dPt]
-            self.dPt += 1
-            return r
+        except IndexError:
+            raise SparkError("Unexpected end of data stream when reading a single byte!")
+        self.dPt += 1
+        return r
+    
+    def readRecord(self, record): ### Read a whole fixed-size record
+        """Reads the next record described by the struct.Struct passed to it, and returns the tuple of fields"""
+        try:
+            r = record.unpack_from(self.data, self.dPt)
+        except struct.error:
+            raise SparkError("Unexpected end of data stream when reading a " + str(record.size) + "-byte record!")
+        self.dPt += record.size
+        return r
         
     def readNString(self): ### Read narrow string
         """Reads a narrow string from the data.  Narrow strings are 1-byte per character strings, that are prefixed with the string length as a 4-byte integer."""
@@ -356,9 +947,9 @@ class SparkData: ###Spark binary data
         if (len(self.data) < self.dPt +length):
             raise SparkError("Unexpected end of data stream when reading a narrow string!")
         else:
-            bOut = self.data[self.dPt:self.dPt+length]
+            bOut = str(self.data[self.dPt:self.dPt+length], 'utf-8')
             self.dPt = self.dPt+length
-            return bOut.decode()
+            return bOut
     
     def nSkip(self, n): ### skip n bytes
         """Skips the next N number of bytes in the string of data"""
@@ -369,6 +960,15 @@ class SparkData: ###Spark binary data
         else:
             self.dPt += n
             
+    def readBlock(self, n): ### read n bytes as a single block
+        """Returns a view of the next N bytes of data, without copying them, and moves past them.  Used to hand
+        whole arrays of fixed-size records to the bulk decoders."""
+        if (n < 0 or self.dPt + n > len(self.data)):
+            raise SparkError("Unexpected end of data stream when reading a block of " + str(n) + " bytes!")
+        block = self.data[self.dPt:self.dPt+n]
+        self.dPt += n
+        return block
+            
     def skipChunk(self): ### skips an entire chunk using the length field
         """Skips the entire chunk by using the first 4 bytes which are presumably the length field of the chunk to skip.  If not... you're doing it wrong."""
         length = self.readL()
@@ -376,88 +976,52 @@ class SparkData: ###Spark binary data
         
 def writeL(value): ### Write a 4 byte integer ###
     """Returns a byte-string representation of the integer passed to it"""
-    str = b''
-    str+= struct.pack("<L",value)
-    return str
+    return UINT32.pack(value)
 
 def writeF(value): ### Write a 4 byte float ###
     """Returns a byte-string representation of the float passed to it"""
-    str = b''
-    str+= struct.pack("<f", value)
-    return str
+    return FLOAT32.pack(value)
 
 def writeS(value): ### Write a 2 byte integer ###
     """Returns a byte-string representation of the unsigned short passed to it"""
-    str = b''
-    str+= struct.pack("<H", value)
-    return str
+    return UINT16.pack(value)
 
 def writeB(value): ### Write a single byte
     """Returns a byte-string representation of a single byte"""
-    str = b''
-    str+= struct.pack("<B", value)
-    return str
+    return struct.pack("<B", value)
 
 def writeNString(value): ### Write narrow string
     """Returns a byte-string representation of a narrow string, including the 4-byte length field at the beginning"""
     val = str.encode(value)
-    bstr = b''
-    bstr += struct.pack("<L", len(val))
-    for i in range(0,len(val)):
-        bstr += struct.pack("<c", val[i:i+1])
-    return bstr
-
-def appendList(l1, l2):
-    for item in l2:
-        l1.append(item)
-    return l1
-        
-        
-def materialInList(material, lst):
-    if (lst.count(material) > 0):
-        return lst.index(material)
-    else:
-        return -1
-    
-    
+    return UINT32.pack(len(val)) + val
+
+def OffsetArray(arr, offset):
+    """Returns a copy of the integer array 'arr' with 'offset' added to every element"""
+    if (numpy != None and len(arr) > 0):
+        return array.array(arr.typecode, (numpy.frombuffer(arr, dtype=arr.typecode) + offset).astype(arr.typecode).tobytes())
+    return array.array(arr.typecode, [x + offset for x in arr])
+
+def mergeSparkMeshes(meshes):
+    """Merges any number of meshes (SparkMeshColumns or SparkMeshChunkClipboard) into one new SparkMeshColumns, in
+    a single pass.  The inputs are left untouched."""
+    merged = SparkMeshColumns()
+    for mesh in meshes:
+        if not isinstance(mesh, SparkMeshColumns):
+            mesh = SparkMeshColumns.fromMeshChunk(mesh)
+        merged.append(mesh)
+    return merged
+
+
 def mergeSparkData(mc1, mc2): ### Merge two sets of mesh chunks, the first input is the output.
     """Merges two spark data objects, effectively turning them into one mesh"""
-    #First, let's intelligently merge the materials lists.  If there's any overlap, we'll need to adjust mc2's
-    #material chunk to reference mc1's copy of the material.
-    matRefs = []
-    for i, mat in enumerate(mc2.materialChunk.materials):
-        x = materialInList(mat, mc1.materialChunk.materials)
-        if (x == -1): #material doesn't exist in mc1
-            matRefs.append(len(mc1.materialChunk.materials)) #length of a list is equal to the index of the next item appended to it
-            mc1.materialChunk.materials.append(mat) #add that material to the end of mc1's material list
-        else: #material DOES exist in mc1
-            matRefs.append(x) #index of where the identical material was found in mc1
-     #We now have a list, "matRefs" that is effectively a map for mc2's material indices.        
-   
-           
-     #Now, we append the second list of vertices to the first list of vertices.  Nothing special to do here,
-     #but we need to keep in mind the starting number of vertices, so we can be sure to add this number to the
-    #vertex id when referenced by mc2's edges.
-    offset = len(mc1.vertexChunk.vertices)
-    mc1.vertexChunk.vertices = appendList(mc1.vertexChunk.vertices, mc2.vertexChunk.vertices)
-   
-    for edge in mc2.edgeChunk.edges:
-        edge.a +=offset
-        edge.b +=offset
-   
-    #Now we merge the edge lists after offsetting the vertex indices within each edge of chunk #2.  We'll store
-    #the offset for the faces chunk in the same manner as before.
-    offset = len(mc1.edgeChunk.edges)
-    mc1.edgeChunk.edges = appendList(mc1.edgeChunk.edges, mc2.edgeChunk.edges)
-    
-    for face in mc2.faceChunk.faces:
-        face.material = matRefs[face.material]   #Quickly take care of some unfinished material business whilst
-                                                 #in the neighborhood... so to speak... ;)
-        for blmem in face.borderLoop.edgeLoopMembers:
-            blmem.edge+= offset
-    mc1.faceChunk.faces = appendList(mc1.faceChunk.faces,mc2.faceChunk.faces)
-    #I really don't care about mapping groups at the moment... maybe I'll add support in the future, but for now,
-    #mc2's will just be lost.
-    for face in mc1.faceChunk.faces:
-        print("material#:",face.material)
+    if isinstance(mc1, SparkMeshColumns):
+        if not isinstance(mc2, SparkMeshColumns):
+            mc2 = SparkMeshColumns.fromMeshChunk(mc2)
+        return mc1.append(mc2)
+    merged = mergeSparkMeshes((mc1, mc2)).toMeshChunk()
+    mc1.materialChunk = merged.materialChunk
+    mc1.vertexChunk = merged.vertexChunk
+    mc1.edgeChunk = merged.edgeChunk
+    mc1.faceChunk = merged.faceChunk
+    mc1.mappingChunk = merged.mappingChunk
     return mc1
@@ -0,0 +1,105 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# On-disk container for Spark clipboard data (.sparkclip), so clips can be archived and replayed without the
+# clipboard.  The layout is:
+#     header       - magic "SPKCLIP\0", format version, number of chunks, payload offset, payload length
+#     chunk table  - chunk id, offset (relative to the payload, pointing at the chunk id) and length of every
+#                    sub-chunk of the mesh chunk
+#     payload      - the mesh chunk, byte-for-byte as it appears on the clipboard
+# The reader memory-maps the file and hands SparkData a view of the payload, so nothing is read from disk until
+# a chunk is actually decoded.
+
+import mmap
+import struct
+from . import SparkClasses
+
+SPARKCLIP_MAGIC = b'SPKCLIP\0'
+SPARKCLIP_VERSION = 1
+SPARKCLIP_HEADER = struct.Struct("<8s2L2Q") #magic, version, chunk count, payload offset, payload length
+SPARKCLIP_CHUNK = struct.Struct("<L2Q") #chunk id, offset, length
+
+
+def WriteSparkClipFile(path, data):
+    """Writes a .sparkclip file.  'data' is either the raw clipboard bytes, or anything with a
+    convertToBinString() method (SparkMeshChunkClipboard, SparkMeshColumns)."""
+    if hasattr(data, 'convertToBinString'):
+        data = data.convertToBinString()
+    table = SparkClasses.ReadChunkTable(data) #Also makes sure we're not archiving garbage
+    payloadOffset = SPARKCLIP_HEADER.size + SPARKCLIP_CHUNK.size * len(table)
+
+    header = bytearray(payloadOffset)
+    SPARKCLIP_HEADER.pack_into(header, 0, SPARKCLIP_MAGIC, SPARKCLIP_VERSION, len(table), payloadOffset, len(data))
+    for i, (chunkID, offset, length) in enumerate(table):
+        SPARKCLIP_CHUNK.pack_into(header, SPARKCLIP_HEADER.size + SPARKCLIP_CHUNK.size * i, chunkID, offset, length)
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(data)
+
+
+class SparkClipFile:
+    """A memory-mapped .sparkclip file.  Use as a context manager, or call close() when done.  Any mesh chunk
+    returned by getMeshChunk() reads straight out of the mapping, so only the sub-chunks it has decoded by the time
+    the file is closed can be used after that."""
+    def __init__(self, path):
+        self.path = path
+        self._meshChunks = [] #Handed out by getMeshChunk(), each holding a view of the mapping until closed
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: #Empty file, can't be mapped
+            self._file.close()
+            raise SparkClasses.SparkError("\"" + path + "\" is not a .sparkclip file (empty)")
+        self._view = memoryview(self._map)
+        self.payload = None
+        try:
+            self._readHeader()
+        except:
+            self.close()
+            raise
+
+    def _readHeader(self):
+        if (len(self._view) < SPARKCLIP_HEADER.size):
+            raise SparkClasses.SparkError("\"" + self.path + "\" is not a .sparkclip file (too short)")
+        magic, version, count, payloadOffset, payloadLength = SPARKCLIP_HEADER.unpack_from(self._view, 0)
+        if (magic != SPARKCLIP_MAGIC):
+            raise SparkClasses.SparkError("\"" + self.path + "\" is not a .sparkclip file (bad magic)")
+        if (version != SPARKCLIP_VERSION):
+            raise SparkClasses.SparkError("\"" + self.path + "\" has unsupported .sparkclip version " + str(version))
+        if (SPARKCLIP_HEADER.size + SPARKCLIP_CHUNK.size * count > payloadOffset or payloadOffset + payloadLength > len(self._view)):
+            raise SparkClasses.SparkError("\"" + self.path + "\" is truncated")
+        self.chunkTable = [SPARKCLIP_CHUNK.unpack_from(self._view, SPARKCLIP_HEADER.size + SPARKCLIP_CHUNK.size * i)
+                           for i in range(0, count)]
+        self.payload = self._view[payloadOffset:payloadOffset + payloadLength]
+
+    def getMeshChunk(self, lazy = True):
+        """Returns a SparkMeshChunkClipboard for the archived clip.  By default the chunks are only decoded
+        (and so only paged in) when they're first accessed."""
+        mc = SparkClasses.SparkMeshChunkClipboard()
+        mc.constructFromChunkTable(self.payload, self.chunkTable, lazy)
+        self._meshChunks.append(mc)
+        return mc
+
+    def close(self):
+        """Unmaps and closes the file.  Raises BufferError if something other than the mesh chunks from
+        getMeshChunk() is still looking at the mapping."""
+        if (self._map == None):
+            return
+        for mc in self._meshChunks:
+            mc.release()
+        self._meshChunks = []
+        if (self.payload != None):
+            self.payload.release()
+            self.payload = None
+        self._view.release()
+        self._map.close()
+        self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
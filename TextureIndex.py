@@ -0,0 +1,209 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Index of the .material and .dds files in the texture directories.  Each directory is walked once, and every
+# lookup after that is answered from memory instead of asking the filesystem, which adds up fast on network
+# drives and big mod trees.  Lookups ignore case, like Spark does, and give back the path with the casing it
+# actually has on disk.
+# Each directory's index is kept for the rest of the session, and can optionally be saved to a file too.  It's
+# checked as it's used rather than all at once: before a lookup is answered, the mtimes of the directories the file
+# would be in are checked, from the texture directory down (a directory's mtime changes whenever a file is added
+# to, removed from, or renamed in it).  The first one that's changed is walked again, along with everything below
+# it.  So an import only costs a stat for each directory its materials and textures are in, and their parents.
+
+import os
+import stat
+import json
+import posixpath
+import threading
+
+INDEXED_EXTENSIONS = ('.material', '.dds')
+TEXTURE_INDEX_VERSION = 1
+HAVE_SCANDIR = hasattr(os, 'scandir') #Python 3.5 and up
+
+scannedRoots = {} #root -> (files, dirs) as from ScanRoot, for every root indexed this session
+
+
+def IndexKey(path):
+    """Returns the key a path is looked up by: forward slashes, no redundant separators or '..'s, lower case"""
+    return posixpath.normpath(path.replace('\\','/')).lower()
+
+
+def GetMTime(path):
+    """Returns the mtime of the file or directory at 'path', or None if there isn't one"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def ListDir(path):
+    """Returns (name, is directory) for each entry of the directory 'path'.  Symbolic links to directories don't
+    count as directories, so walks can't go round in circles."""
+    if HAVE_SCANDIR:
+        entries = []
+        for entry in os.scandir(path):
+            try:
+                entries.append((entry.name, entry.is_dir(follow_symlinks=False)))
+            except OSError:
+                pass
+        return entries
+    #Without scandir it's a stat per entry to tell the directories apart.  Indexed files are taken as files, as
+    #they make up most of a texture directory.
+    entries = []
+    for name in os.listdir(path):
+        if name.lower().endswith(INDEXED_EXTENSIONS):
+            entries.append((name, False))
+            continue
+        try:
+            entries.append((name, stat.S_ISDIR(os.lstat(os.path.join(path, name)).st_mode)))
+        except OSError:
+            pass
+    return entries
+
+
+def ScanRoot(root, start = ''):
+    """Walks the directory 'start' (relative to 'root', ending in '/', or '' for 'root' itself) and everything
+    below it.  Returns (files, dirs): 'files' maps the IndexKey() of each indexed file's path (relative to 'root')
+    to that relative path, 'dirs' maps the relative path of every directory walked to its mtime."""
+    files = {}
+    dirs = {}
+    stack = [start]
+    while len(stack) > 0:
+        rel = stack.pop()
+        try:
+            dirs[rel] = os.stat(root + rel).st_mtime_ns
+            entries = ListDir(root + rel)
+        except OSError:
+            dirs.pop(rel, None)
+            continue #Vanished or unreadable, just leave it out
+        for name, isDir in entries:
+            if isDir:
+                stack.append(rel + name + '/')
+            elif name.lower().endswith(INDEXED_EXTENSIONS):
+                files[IndexKey(rel + name)] = rel + name
+    return files, dirs
+
+
+class TextureIndex:
+    """Case-insensitive index of the .material and .dds files under each of the texture directories 'roots'
+    (paths ending in '/', as from FixPath).  Directories already indexed this session, or saved to 'cacheFile' if
+    it's given, are reused, and only walked again once a lookup finds they've changed.  Lookups can come from
+    several threads at once."""
+    def __init__(self, roots, cacheFile = None):
+        self.cacheFile = cacheFile
+        self.roots = [] #(root key, root), in the order given, so lookups keep the directories' priority
+        self.indexes = {} #root -> (files, dirs, the relative path of each directory by its lower case version)
+        self.checked = {} #path -> mtime of everything lookups have checked: directories, and files outside the roots
+        self.lock = threading.Lock()
+        cached = {}
+        if cacheFile != None:
+            cached = self._loadCacheFile(cacheFile)
+        changed = False
+        for root in roots:
+            #What was indexed earlier this session comes first, so repeat imports don't walk the directories again
+            #even without a cache file
+            scanned = scannedRoots.get(root)
+            entry = cached.get(root)
+            if scanned != None:
+                files, dirs = scanned
+                if entry == None or entry['dirs'] != dirs:
+                    changed = True
+            elif entry != None:
+                files, dirs = entry['files'], entry['dirs']
+            else:
+                files, dirs = ScanRoot(root)
+                changed = True
+            self._setIndex(root, files, dirs)
+            self.roots.append((IndexKey(root) + '/', root))
+        if cacheFile != None and (changed or set(self.indexes) != set(cached)):
+            self._saveCacheFile(cacheFile, self._getSaved())
+
+    def _setIndex(self, root, files, dirs):
+        scannedRoots[root] = (files, dirs)
+        self.indexes[root] = (files, dirs, dict((rel.lower(), rel) for rel in dirs))
+
+    def _getSaved(self):
+        return dict((root, {'files' : files, 'dirs' : dirs}) for root, (files, dirs, dirKeys) in self.indexes.items())
+
+    @staticmethod
+    def _loadCacheFile(cacheFile):
+        try:
+            with open(cacheFile, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {} #Missing or corrupt, start over
+        if not isinstance(data, dict) or data.get('version') != TEXTURE_INDEX_VERSION:
+            return {}
+        return data.get('roots', {})
+
+    @staticmethod
+    def _saveCacheFile(cacheFile, roots):
+        tmp = cacheFile + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'version' : TEXTURE_INDEX_VERSION, 'roots' : roots}, f)
+            os.replace(tmp, cacheFile)
+        except OSError as e:
+            print("WARNING: Unable to save texture index to \"", cacheFile, "\":", e)
+
+    def _getFiles(self, root, relKey):
+        """Returns the index of the files under 'root', after making sure it's still right about the file 'relKey'
+        (its IndexKey(), relative to 'root').  Checks the directories it would be in from 'root' down, and walks
+        the first one that's changed again.  Call with the lock held."""
+        files, dirs, dirKeys = self.indexes[root]
+        parts = relKey.split('/')[:-1]
+        dirKey = ''
+        for i in range(0, len(parts) + 1):
+            if i > 0:
+                dirKey += parts[i-1] + '/'
+            rel = dirKeys.get(dirKey)
+            if rel == None:
+                break #It wasn't there when its parent was walked, and its parent hasn't changed since
+            if root + rel in self.checked:
+                continue
+            mtime = GetMTime(root + rel)
+            if mtime != dirs[rel]:
+                newFiles, newDirs = ScanRoot(root, rel)
+                files = dict((key, path) for key, path in files.items() if not path.startswith(rel))
+                files.update(newFiles)
+                dirs = dict((path, walked) for path, walked in dirs.items() if not path.startswith(rel))
+                dirs.update(newDirs)
+                self._setIndex(root, files, dirs)
+                files, dirs, dirKeys = self.indexes[root]
+                if self.cacheFile != None:
+                    self._saveCacheFile(self.cacheFile, self._getSaved())
+                mtime = dirs.get(rel)
+            self.checked[root + rel] = mtime
+        return files
+
+    def getChecked(self):
+        """Returns a dict of path -> mtime (None if it didn't exist) of every directory lookups have checked so
+        far, and every file looked for outside the texture directories.  As long as none of them change, the same
+        lookups give the same answers."""
+        with self.lock:
+            return dict(self.checked)
+
+    def resolve(self, path):
+        """Returns the path of the file on disk matching 'path' (ignoring case), or None if there isn't one.  Files
+        outside the texture directories, or of a type that isn't indexed, are checked for on disk."""
+        key = IndexKey(path)
+        covered = False
+        if key.endswith(INDEXED_EXTENSIONS):
+            for rootKey, root in self.roots:
+                if key.startswith(rootKey):
+                    covered = True
+                    with self.lock:
+                        rel = self._getFiles(root, key[len(rootKey):]).get(key[len(rootKey):])
+                    if rel != None:
+                        return root + rel
+        if covered:
+            return None
+        try:
+            found = os.stat(path)
+        except OSError:
+            found = None
+        with self.lock:
+            self.checked[path] = found.st_mtime_ns if found != None else None
+        return path if found != None and stat.S_ISREG(found.st_mode) else None
@@ -6,24 +6,15 @@
 # Special thanks to Max McGuire for providing C++ source!
 # Never would have figured this out without that help. :)
 
+# Vertices are referred to by their index into a polygon's workspace: flat 'x' and 'y' arrays of the projected
+# coordinates, border loop first, then each hole.
+
 from . import SparkClasses
 import math
+import heapq
+import array
 
-class vert2D:
-    """2d vertex"""
-    def __init__(self,vX,vY,id):
-        self.x = vX
-        self.y = vY
-        self.realId = id
-    def __str__(self):
-        return ('( ' + str(self.x*39.37) + ' , ' + str(self.y*39.37) + ') id='+str(self.realId))
-        
-class triangle:
-    """Simple triangle that references two "vert2D" objects"""
-    def __init__(self, vert1, vert2, vert3):
-        self.v1 = vert1
-        self.v2 = vert2
-        self.v3 = vert3
+VECTORIZE_MIN_VERTS = 64 #Below this, NumPy's per-call overhead costs more than it saves
 
 def cross(a,b):
     """Taken from http://stackoverflow.com/questions/1984799/cross-product-of-2-different-vectors-in-python"""
@@ -31,236 +22,474 @@ def cross(a,b):
          a[2]*b[0] - a[0]*b[2],
          a[0]*b[1] - a[1]*b[0]]
     return c
-        
-def get3Verts(verts, earV):
-    v1 = verts[((earV-1)+len(verts))%len(verts)]
-    v2 = verts[earV]
-    v3 = verts[(earV+1)%len(verts)]
-    vertTriple = [v1,v2,v3]
-    return vertTriple
-        
-def PointInTriangle(p, v1, v2, v3):
+
+def PointInTriangle(x, y, p, v1, v2, v3):
     # Adapted from: http://stackoverflow.com/questions/2049582/how-to-determine-a-point-in-a-triangle
-    area = 0.5*(-v2.y*v3.x + v1.y*(-v2.x + v3.x) + v1.x*(v2.y - v3.y) + v2.x*v3.y)
+    x1 = x[v1]
+    y1 = y[v1]
+    x2 = x[v2]
+    y2 = y[v2]
+    x3 = x[v3]
+    y3 = y[v3]
+    area = 0.5*(-y2*x3 + y1*(-x2 + x3) + x1*(y2 - y3) + x2*y3)
     if area <= 0.00001: #Either a tiny sliver or inline point
         return False
     
-    s = 1.0 / (2.0 * area)*(v1.y*v3.x - v1.x*v3.y + (v3.y - v1.y)*p.x + (v1.x - v3.x)*p.y);
-    t = 1.0 / (2.0 * area)*(v1.x*v2.y - v1.y*v2.x + (v1.y - v2.y)*p.x + (v2.x - v1.x)*p.y);
+    pX = x[p]
+    pY = y[p]
+    s = 1.0 / (2.0 * area)*(y1*x3 - x1*y3 + (y3 - y1)*pX + (x1 - x3)*pY);
+    t = 1.0 / (2.0 * area)*(x1*y2 - y1*x2 + (y1 - y2)*pX + (x2 - x1)*pY);
     
     if ( s > 0 ) and ( t > 0 ) and ( 1.0 - s - t > 0 ):
         return True
     else:
         return False
-    
-def IsConvex(v1, v2, v3):
-    area = (v2.x - v1.x) * (v3.y - v1.y) - (v2.y - v1.y) * (v3.x - v1.x)
+
+def InTriangleInclusive(x, y, p, v1, v2, v3):
+    """Like PointInTriangle, but counts points on the edges as inside, and works for either winding"""
+    pX = x[p]
+    pY = y[p]
+    d1 = (x[v2] - x[v1]) * (pY - y[v1]) - (y[v2] - y[v1]) * (pX - x[v1])
+    d2 = (x[v3] - x[v2]) * (pY - y[v2]) - (y[v3] - y[v2]) * (pX - x[v2])
+    d3 = (x[v1] - x[v3]) * (pY - y[v3]) - (y[v1] - y[v3]) * (pX - x[v3])
+    return (d1 >= 0.0 and d2 >= 0.0 and d3 >= 0.0) or (d1 <= 0.0 and d2 <= 0.0 and d3 <= 0.0)
+
+def IsConvex(x, y, v1, v2, v3):
+    area = (x[v2] - x[v1]) * (y[v3] - y[v1]) - (y[v2] - y[v1]) * (x[v3] - x[v1])
     '''###DEBUG PRINT
     print("CalculatedAreaValue:",area)'''
     return (area >= 0.0001)
 
-def UnitVector(vect):
-    mag = math.sqrt((vect[0] * vect[0] )+ (vect[1] * vect[1]))
-    vect[0] = vect[0]/mag
-    vect[1] = vect[1]/mag
-
-def MaxMinAngle(v1,v2,v3):
-    e1=[v1.x-v2.x, v1.y-v2.y]
-    e2=[v1.x-v3.x, v1.y-v3.y]
-    e3=[v2.x-v3.x, v2.y-v3.y]
-    UnitVector(e1)
-    UnitVector(e2)
-    UnitVector(e3)
-    
-    minA = abs(e1[0]*e2[0] + e1[1]*e2[1])
-    minA = min(minA,abs(e1[0]*e3[0] + e1[1]*e3[1]))
-    minA = min(minA,abs(e3[0]*e2[0] + e3[1]*e2[1]))
+def MaxMinAngle(x, y, v1, v2, v3):
+    e1x = x[v1] - x[v2]
+    e1y = y[v1] - y[v2]
+    e2x = x[v1] - x[v3]
+    e2y = y[v1] - y[v3]
+    e3x = x[v2] - x[v3]
+    e3y = y[v2] - y[v3]
+    mag = math.sqrt((e1x * e1x) + (e1y * e1y))
+    e1x = e1x / mag
+    e1y = e1y / mag
+    mag = math.sqrt((e2x * e2x) + (e2y * e2y))
+    e2x = e2x / mag
+    e2y = e2y / mag
+    mag = math.sqrt((e3x * e3x) + (e3y * e3y))
+    e3x = e3x / mag
+    e3y = e3y / mag
+    
+    minA = abs(e1x*e2x + e1y*e2y)
+    minA = min(minA,abs(e1x*e3x + e1y*e3y))
+    minA = min(minA,abs(e3x*e2x + e3y*e2y))
     
     return minA
 
+class PolygonRing:
+    """A polygon as a doubly linked ring of nodes, each referring to a vertex of the workspace 'x', 'y' (the same
+    vertex can be used by more than one node once holes are bridged in), so holes can be spliced in and ears
+    clipped off without shifting a list around.  Starts out as just the border: vertices 0 to 'count'-1, with
+    node 0 first."""
+    def __init__(self, x, y, count):
+        self.x = x.tolist() #Reading a list doesn't box a new float every time, which adds up in the ear tests
+        self.y = y.tolist()
+        self.vert = list(range(0, count))
+        self.prevIndex = [(i + count - 1) % count for i in range(0, count)]
+        self.nextIndex = [(i + 1) % count for i in range(0, count)]
+    
+    def addLoop(self, start, count):
+        """Adds vertices 'start' to 'start'+'count'-1 as a separate ring of new nodes, and returns the index of
+        the first one"""
+        first = len(self.vert)
+        self.vert.extend(range(start, start + count))
+        self.prevIndex.extend([first + (i + count - 1) % count for i in range(0, count)])
+        self.nextIndex.extend([first + (i + 1) % count for i in range(0, count)])
+        return first
+    
+    def addNode(self, i):
+        """Adds a new, unlinked node for the same vertex as node 'i', and returns its index"""
+        self.vert.append(self.vert[i])
+        self.prevIndex.append(-1)
+        self.nextIndex.append(-1)
+        return len(self.vert) - 1
+    
+    def link(self, i, j):
+        """Makes node 'j' come right after node 'i'"""
+        self.nextIndex[i] = j
+        self.prevIndex[j] = i
+    
+    def isReflex(self, i):
+        vert = self.vert
+        return not IsConvex(self.x, self.y, vert[self.prevIndex[i]], vert[i], vert[self.nextIndex[i]])
+    
+    def walk(self, start = 0):
+        """Yields the nodes of the ring 'start' is in, in order, beginning with 'start'"""
+        i = start
+        while True:
+            yield i
+            i = self.nextIndex[i]
+            if i == start:
+                return
 
-def IsEar(verts, v1, v2, v3):
-    if (not IsConvex(v1,v2,v3)):
-        '''###DEBUG PRINT
-        print("    not convex...")'''
-        return False
+class NodeGrid:
+    """Uniform grid over some of the nodes of a PolygonRing, so geometric tests can look at just the ones nearby.
+    The ear tests only put the reflex nodes in: if any of the polygon's vertices are inside a convex corner's
+    triangle, then a reflex one is too.  That only holds while the ring doesn't cross itself, so it relies on the
+    hole bridges being right."""
+    def __init__(self, ring, nodes, count = None):
+        self.ring = ring
+        x = ring.x
+        y = ring.y
+        minX = min(x)
+        maxX = max(x)
+        minY = min(y)
+        maxY = max(y)
+        if (count == None): #Number of nodes to size the grid for, if more are going to be added
+            count = len(nodes)
+        self.size = max(1, int(math.sqrt(count))) #Cells along each side, about one node per cell
+        self.minX = minX
+        self.minY = minY
+        self.scaleX = self.size / (maxX - minX) if maxX > minX else 0.0
+        self.scaleY = self.size / (maxY - minY) if maxY > minY else 0.0
+        self.cells = [[] for i in range(0, self.size * self.size)]
+        for i in nodes:
+            self.add(i)
+    
+    def cellX(self, x):
+        return min(self.size - 1, max(0, int((x - self.minX) * self.scaleX)))
+    
+    def cellY(self, y):
+        return min(self.size - 1, max(0, int((y - self.minY) * self.scaleY)))
+    
+    def cell(self, i):
+        v = self.ring.vert[i]
+        return self.cellY(self.ring.y[v]) * self.size + self.cellX(self.ring.x[v])
+    
+    def add(self, i):
+        self.cells[self.cell(i)].append(i)
+    
+    def remove(self, i):
+        self.cells[self.cell(i)].remove(i)
+    
+    def query(self, v1, v2, v3):
+        """Yields the nodes in the cells overlapped by the bounding box of the triangle of vertices v1, v2,
+        v3"""
+        x = self.ring.x
+        y = self.ring.y
+        x0 = self.cellX(min(x[v1], x[v2], x[v3]))
+        x1 = self.cellX(max(x[v1], x[v2], x[v3]))
+        for cy in range(self.cellY(min(y[v1], y[v2], y[v3])), self.cellY(max(y[v1], y[v2], y[v3])) + 1):
+            row = cy * self.size
+            for cx in range(x0, x1 + 1):
+                for i in self.cells[row + cx]:
+                    yield i
+
+class EdgeRows:
+    """The edges of a PolygonRing (each by the node it starts at) sorted into horizontal rows by the span of their y
+    coordinates, so a horizontal ray only has to be tested against the edges in its row"""
+    def __init__(self, ring, edges, count):
+        self.ring = ring
+        minY = min(ring.y)
+        maxY = max(ring.y)
+        self.size = max(1, int(math.sqrt(count)))
+        self.minY = minY
+        self.scaleY = self.size / (maxY - minY) if maxY > minY else 0.0
+        self.rows = [[] for i in range(0, self.size)]
+        for i in edges:
+            self.add(i)
+    
+    def rowY(self, y):
+        return min(self.size - 1, max(0, int((y - self.minY) * self.scaleY)))
     
-    for v in verts:
-        if (v is v1 or v is v2 or v is v3):
+    def span(self, i):
+        ring = self.ring
+        y1 = ring.y[ring.vert[i]]
+        y2 = ring.y[ring.vert[ring.nextIndex[i]]]
+        return range(self.rowY(min(y1, y2)), self.rowY(max(y1, y2)) + 1)
+    
+    def add(self, i):
+        for r in self.span(i):
+            self.rows[r].append(i)
+    
+    def remove(self, i):
+        for r in self.span(i):
+            self.rows[r].remove(i)
+    
+    def query(self, y):
+        return self.rows[self.rowY(y)]
+
+def ClipEars(ring, tris):
+    """Triangulates the PolygonRing 'ring', counter-clockwise with any holes already merged in, by clipping off
+    ears, adding the vertices of each triangle to 'tris'.  The ears are kept in a heap ordered by MaxMinAngle,
+    best first, with ties going to the vertex that comes first around the ring.  Clipping an ear only changes the
+    triangles of its two neighbours, so only they get re-checked, and only against the nearby reflex vertices in
+    a NodeGrid."""
+    x = ring.x
+    y = ring.y
+    vert = ring.vert
+    prevIndex = ring.prevIndex
+    nextIndex = ring.nextIndex
+    order = list(ring.walk())
+    rank = [0] * len(vert) #Position of each node around the ring, for breaking ties
+    for r, i in enumerate(order):
+        rank[i] = r
+    removed = [False] * len(vert)
+    version = [0] * len(vert) #Bumped whenever a vertex is re-checked, so older heap entries for it are skipped
+    reflex = [False] * len(vert)
+    for i in order:
+        reflex[i] = ring.isReflex(i)
+    grid = NodeGrid(ring, [i for i in order if reflex[i]])
+    ears = [] #heap of (-MaxMinAngle, rank, index, version)
+    head = order[0]
+    remaining = len(order)
+    
+    def CheckEar(i):
+        version[i] += 1
+        v1 = vert[prevIndex[i]]
+        v2 = vert[i]
+        v3 = vert[nextIndex[i]]
+        if (not IsConvex(x, y, v1, v2, v3)):
+            return
+        if (reflex[i]):
+            #Clipping its neighbours made it convex.  Never goes the other way.
+            reflex[i] = False
+            grid.remove(i)
+        for j in grid.query(v1, v2, v3):
+            v = vert[j]
+            if (v == v1 or v == v2 or v == v3):
+                continue
+            #A vertex on the edge between the neighbours counts too: clipping past it leaves the rest of the ring
+            #touching itself there, which sooner or later ends in a triangle with no area
+            if (InTriangleInclusive(x, y, v, v1, v2, v3)):
+                return
+        heapq.heappush(ears, (-MaxMinAngle(x, y, v1, v2, v3), rank[i], i, version[i]))
+    
+    for i in order:
+        CheckEar(i)
+    
+    while (remaining > 3):
+        if len(ears) == 0:
+            #Shouldn't happen often, but clipping can free up ears that aren't next to the clipped vertex.  Check
+            #everything once more before giving up.
+            for i in list(ring.walk(head)):
+                CheckEar(i)
+            if len(ears) == 0:
+                break
+        
+        metric, r, i, ver = heapq.heappop(ears)
+        if (removed[i] or ver != version[i]):
             continue
         
-        if (PointInTriangle(v, v1,v2,v3)):
-            '''###DEBUG PRINT
-            print("    point contained triangle")'''
-            return False
-    return True
+        p = prevIndex[i]
+        q = nextIndex[i]
+        tris.extend((vert[p], vert[i], vert[q]))
+        ring.link(p, q)
+        removed[i] = True
+        remaining -= 1
+        if (head == i):
+            head = q
+        
+        CheckEar(p)
+        CheckEar(q)
+    
+    last = [i for i in order if not removed[i]][:3]
+    tris.extend((vert[last[0]], vert[last[1]], vert[last[2]]))
 
-def GetHoleMaxX(hole):
-    maxX = hole[0].x
-    for i in range(1,len(hole)):
-        maxX = max(maxX, hole[i].x)
-    return maxX
+def LocallyInside(ring, i, v):
+    """Returns True if the direction from node 'i' to vertex 'v' starts off inside the polygon, i.e. within the
+    corner at 'i'.  Tells apart the nodes of a vertex that's been used more than once by earlier bridges."""
+    x = ring.x
+    y = ring.y
+    vert = ring.vert
+    a = vert[i]
+    aX = x[a]
+    aY = y[a]
+    e1x = x[vert[ring.nextIndex[i]]] - aX
+    e1y = y[vert[ring.nextIndex[i]]] - aY
+    e2x = x[vert[ring.prevIndex[i]]] - aX
+    e2y = y[vert[ring.prevIndex[i]]] - aY
+    dX = x[v] - aX
+    dY = y[v] - aY
+    afterNext = (e1x * dY - e1y * dX >= 0.0) #Counter-clockwise of the edge to the next vertex
+    beforePrev = (dX * e2y - dY * e2x >= 0.0) #Clockwise of the edge to the previous vertex
+    if (e1x * e2y - e1y * e2x >= 0.0):
+        return afterNext and beforePrev
+    else:
+        #Reflex corner, so the inside is everything but the (convex) wedge outside it
+        return afterNext or beforePrev
 
-def GetHoleMaxXVert(hole):
-    maxX = hole[0].x
-    maxXVert = 0
-    for i in range(1,len(hole)):
-        if (hole[i].x > maxX):
-            maxX = hole[i].x
+def GetHoleMaxXVert(x, start, count):
+    maxX = x[start]
+    maxXVert = start
+    for i in range(start+1,start+count):
+        if (x[i] > maxX):
+            maxX = x[i]
             maxXVert = i
     return maxXVert
+
+def FindBridge(ring, grid, edges, m, intersectPoint):
+    """Returns the node that hole node 'm' (the hole's maximum X vertex) can be bridged to, or None if there's
+    nothing to its right.  'intersectPoint' is a spare workspace vertex to put the ray hit in."""
+    x = ring.x
+    y = ring.y
+    vert = ring.vert
+    nextIndex = ring.nextIndex
+    maxXVert = vert[m]
+    mX = x[maxXVert]
+    mY = y[maxXVert]
+    
+    #Cast a ray to the right, and find the nearest edge it hits.  Moving right out of the polygon can only be
+    #through an edge going up, so that's all that's looked at: an edge going down (or flat) can only be hit where
+    #it meets one going up, and a vertex the ray only grazes isn't a way out.
+    hitX = None
+    point = None
+    for i in edges.query(mY):
+        v1 = vert[i]
+        v2 = vert[nextIndex[i]]
+        y1 = y[v1]
+        y2 = y[v2]
+        if (y1 > mY) or (y2 < mY) or (y1 == y2):
+            continue
+        t = x[v1] + (mY - y1) * (x[v2] - x[v1]) / (y2 - y1)
+        if (t >= mX) and (hitX == None or t < hitX):
+            hitX = t
+            #The edge's end with the larger X, which is the one that can be seen from inside the triangle below
+            if (x[v1] > x[v2]):
+                point = i
+            else:
+                point = nextIndex[i]
+            if (t == mX): #The hole touches the edge
+                return point
+    
+    if (hitX == None):
+        return None
     
-def SortHolesByMaxX(holes):
-    newHoles = []
-    
-    while (len(holes) > 1):
-        maxXIndex = 0
-        maxXValue = GetHoleMaxX(holes[0])
-        for i in range(1,len(holes)):
-            testVal = GetHoleMaxX(holes[i])
-            if testVal > maxXValue:
-                maxXIndex = i
-                maxXValue = testVal
-        newHoles.append(holes.pop(maxXIndex))
-    newHoles.append(holes.pop())
-    
-    return newHoles
+    #Anything inside the triangle formed by the hole vertex, the hit, and the end of the edge might block the view
+    #of that end.  If so, bridge to the vertex in there with the smallest angle to the ray instead (closest wins
+    #ties).  A vertex can have more than one node by now, and only the one whose corner faces the hole vertex will
+    #do.
+    x[intersectPoint] = hitX
+    y[intersectPoint] = mY
+    pointVert = vert[point]
+    pointX = x[pointVert]
+    bridge = point
+    bridgeX = pointX
+    tanMin = None
+    for i in grid.query(maxXVert, intersectPoint, pointVert):
+        v = vert[i]
+        vX = x[v]
+        if (vX <= mX) or (vX > pointX):
+            continue
+        if not InTriangleInclusive(x, y, v, maxXVert, intersectPoint, pointVert):
+            continue
+        tan = abs(y[v] - mY) / (vX - mX)
+        if (tanMin == None or tan < tanMin or (tan == tanMin and vX < bridgeX)) and LocallyInside(ring, i, maxXVert):
+            tanMin = tan
+            bridge = i
+            bridgeX = vX
+    
+    return bridge
 
-def ProcessHoles(border, holes):
+def ProcessHoles(ring, holes):
+    """Merges each of 'holes' (clockwise loops, as (first vertex, vertex count)) into the PolygonRing 'ring' by
+    bridging it to a vertex it can see, which makes the ring one polygon that can be ear clipped."""
     # Based on the algorithm outlined here:
     # http://www.geometrictools.com/Documentation/TriangulationByEarClipping.pdf
     if (holes == None) or (holes == []): #If no holes, no work needs to be done!
         return
-    '''###Debug Print
-    print("Before Sorting:")
-    for i in range(0,len(holes)):
-        print("Hole ",i,":",sep='')
-        for j in range(0,len(holes[i])):
-            print("( %.3f" % (holes[i][j].x*39.37)," , %.3f )" %(holes[i][j].y*39.37))'''
-    if (len(holes) > 1):
-        holes = SortHolesByMaxX(holes)
-        
-    '''###Debug Print
-    print("\nAfter Sorting:")
-    for i in range(0,len(holes)):
-        print("Hole ",i,":",sep='')
-        for j in range(0,len(holes[i])):
-            print("( %.3f" % (holes[i][j].x*39.37)," , %.3f )" %(holes[i][j].y*39.37))'''
-    for hole in holes:
-        maxXV = GetHoleMaxXVert(hole)
-        
-        tMin = None
-        intersectVertexIndex1 = 0
-        intersectVertexIndex2 = 0
-        
-        for i in range(0,len(border)):
-            v1 = border[i]
-            v2 = border[(i+1)%len(border)]
-            
-            if ( v1.y > hole[maxXV].y) or (v2.y < hole[maxXV].y): #Ensure edge even intersects ray
-                continue
-            
-            vertIndex1 = i
-            vertIndex2 = (i + 1) % len(border)
-            t = None
-            
-            if ((v2.y - v1.y) != 0.00):
-                t = (v1.x - hole[maxXV].x) + (hole[maxXV].y - v1.y) * (v2.x - v1.x) / (v2.y - v1.y)
-                #Check if the ray hits a vertex
-                if (v1.y == hole[maxXV].y):
-                    vertIndex2 = vertIndex1
-                elif (v2.y == hole[maxXV].y):
-                    vertIndex1 = vertIndex2
-            else:
-                #Edge is parallel to the ray, so it hits the vertex with minimum X
-                if (v1.x < v2.x):
-                    t = v1.x - hole[maxXV].x
-                    vertIndex2 = vertIndex1
-                else:
-                    t = v2.x - hole[maxXV].x
-                    vertIndex1 = vertIndex2
-            
-            if (t >= 0.0 and (tMin == None or t < tMin)):
-                tMin = t
-                intersectVertexIndex1 = vertIndex1
-                intersectVertexIndex2 = vertIndex2
-                
-        intersectPoint = vert2D(hole[maxXV].x + tMin, hole[maxXV].y, None)
-        insertIndex = 0
-        
-        if (intersectVertexIndex1 == intersectVertexIndex2):
-            #We hit a vertex
-            insertIndex = intersectVertexIndex1
-        else:
-            pointIndex = 0
-            if (border[intersectVertexIndex1].x > border[intersectVertexIndex2].x):
-                pointIndex = intersectVertexIndex1
-            else:
-                pointIndex = intersectVertexIndex2
-            
-            ##Check for reflex, border vertices inside the triangle formed by maxX, intersect point, and p.
-            insertIndex = pointIndex
-            
-            point = border[pointIndex]
-            
-            dX = border[insertIndex].x - hole[maxXV].x
-            dY = border[insertIndex].y - hole[maxXV].y
-            
-            maxLengthSquared = ((dX * dX) + (dY * dY))
-            maxCosSquared = math.sqrt(dX) / maxLengthSquared
-            
-            for i in range(0,len(border)):
-                if ( i != pointIndex ):
-                    v1 = border[((i+(len(border)-1))%len(border))]
-                    v2 = border[i]
-                    v3 = border[((i+1)%len(border))]
-                    if ( (not IsConvex(v1,v2,v3) ) and PointInTriangle( border[i] , hole[maxXV] , intersectPoint , point )):
-                        dX = border[i].x - hole[maxXV].x
-                        dY = border[i].y - hole[maxXV].y
-                        lengthSquared = ((dX * dX) + (dY * dY))
-                        cosSquared = math.sqrt(dX) / lengthSquared
-                        
-                        if (cosSquared > maxCosSquared):
-                            maxCosSquared = cosSquared
-                            maxLengthSquared = lengthSquared
-                            insertIndex = i
-                        elif ((cosSquared == maxCosSquared) and (lengthSquared < maxLengthSquared)):
-                            #Reflex vertex has angle equal to the current minimum but the length is smaller
-                            #so it becomes the new visible candidate
-                            maxLengthSquared = lengthSquared
-                            insertIndex = i
+    
+    x = ring.x
+    y = ring.y
+    vert = ring.vert
+    nextIndex = ring.nextIndex
+    
+    #Holes are merged in order of their maximum X, largest first (ties go to the earlier hole)
+    queue = []
+    borderNodes = list(ring.walk())
+    for h, (start, count) in enumerate(holes):
+        maxXV = GetHoleMaxXVert(x, start, count)
+        heapq.heappush(queue, (-x[maxXV], h, ring.addLoop(start, count) + maxXV - start))
+    
+    #The ray casts only look at the edges that cross the ray's row, and the visibility checks only at the nodes
+    #nearby
+    grid = NodeGrid(ring, borderNodes, len(vert))
+    edges = EdgeRows(ring, borderNodes, len(vert))
+    
+    #Spare vertex for where the ray hits
+    intersectPoint = len(x)
+    x.append(0.0)
+    y.append(0.0)
+    
+    while (len(queue) > 0):
+        maxX, h, m = heapq.heappop(queue)
+        b = FindBridge(ring, grid, edges, m, intersectPoint)
+        if (b == None):
+            print("WARNING: Hole in polygon isn't inside its border, skipping it...")
+            continue
         
-        #Now we just have to create two virtual vertices and merge the hole verts with the border verts in the proper order
-        for i in range(0,len(hole)):
-            border.insert(insertIndex + 1 + i, hole[(i + maxXV) % len(hole)])
-        border.insert(insertIndex + 1 + len(hole), hole[maxXV])
-        border.insert(insertIndex + 2 + len(hole), border[insertIndex])
+        #Now we just have to create two virtual vertices and splice the hole into the ring in the proper order:
+        #b -> m -> rest of hole -> m' -> b' -> whatever came after b
+        holeNodes = list(ring.walk(m))
+        mPrev = ring.prevIndex[m]
+        bNext = nextIndex[b]
+        m2 = ring.addNode(m)
+        b2 = ring.addNode(b)
+        edges.remove(b)
+        ring.link(b, m)
+        ring.link(mPrev, m2)
+        ring.link(m2, b2)
+        ring.link(b2, bNext)
+        #The hole's edges and the bridge are now part of the ring
+        for i in holeNodes + [m2, b2]:
+            edges.add(i)
+            grid.add(i)
+        edges.add(b)
     
+    x.pop()
+    y.pop()
+
+def LoopAreas(x, y, loopStarts):
+    """Returns twice the signed area of each loop (positive for counter-clockwise), where loop i is vertices
+    loopStarts[i] to loopStarts[i+1]-1"""
+    numpy = SparkClasses.numpy
+    if numpy != None and len(x) >= VECTORIZE_MIN_VERTS:
+        xs = numpy.frombuffer(x, dtype=numpy.float64)
+        ys = numpy.frombuffer(y, dtype=numpy.float64)
+        starts = numpy.array(loopStarts[:-1], dtype=numpy.intp)
+        nextVert = numpy.arange(1, len(x) + 1, dtype=numpy.intp)
+        nextVert[numpy.array(loopStarts[1:], dtype=numpy.intp) - 1] = starts #Last vertex of each loop wraps around
+        return numpy.add.reduceat(xs * ys[nextVert] - xs[nextVert] * ys, starts).tolist()
+    areas = []
+    for l in range(0, len(loopStarts) - 1):
+        start = loopStarts[l]
+        end = loopStarts[l+1]
+        area = 0.0
+        for i in range(start, end):
+            j = i + 1 if i + 1 < end else start
+            area += (x[i] * y[j] - x[j] * y[i])
+        areas.append(area)
+    return areas
 
 class polygon:
-    """A polygon for triangulation, created from a Spark Face"""
-    def __init__(self, sF, sD):
-        vertices= sD.vertexChunk.vertices
-        edges = sD.edgeChunk.edges
-        self.triangles = []
+    """A polygon for triangulation, created from face 'f' of a SparkMeshColumns.  Its vertices (border loop, then
+    each hole of 3 or more vertices) are kept in a flat workspace: the projected coordinates in 'x' and 'y', and the
+    mesh vertex each one is in 'realIds'.  'triangles' holds the mesh vertices of the result, 3 per triangle."""
+    def __init__(self, mesh, f):
+        self.triangles = array.array('I')
+        loops = [mesh.getLoopVertices(f, l) for l in range(0, mesh.getFaceLoopCount(f))]
         
         #Guess the normal vector of the polygon by picking 3 adjacent vertices from the
         #border edge until a vaild triplet is found
-
-        length = len(sF.borderLoop.edgeLoopMembers) #Number of vertices in border loop
+        
+        length = len(loops[0]) #Number of vertices in border loop
         if (length < 3):
-            raise SparkError("ERROR:  Attempt to triangulate polygon with less than 3 vertices.  WHAT DID YOU DO???????")
+            raise SparkClasses.SparkError("ERROR:  Attempt to triangulate polygon with less than 3 vertices.  WHAT DID YOU DO???????")
         nVec = (0,1,0)
         for i in range(0,length):
-            vertIndex1 = ((i-1)+length)%length
-            vertIndex3 = (i+1)%length
-            
-            v1 = vertices[edges[sF.borderLoop.edgeLoopMembers[vertIndex1].edge].b] if sF.borderLoop.edgeLoopMembers[vertIndex1].flipped else vertices[edges[sF.borderLoop.edgeLoopMembers[vertIndex1].edge].a]
-            v2 = vertices[edges[sF.borderLoop.edgeLoopMembers[i].edge].b] if sF.borderLoop.edgeLoopMembers[i].flipped else vertices[edges[sF.borderLoop.edgeLoopMembers[i].edge].a]
-            v3 = vertices[edges[sF.borderLoop.edgeLoopMembers[vertIndex3].edge].b] if sF.borderLoop.edgeLoopMembers[vertIndex3].flipped else vertices[edges[sF.borderLoop.edgeLoopMembers[vertIndex3].edge].a]
+            v1 = mesh.getVertex(loops[0][((i-1)+length)%length])
+            v2 = mesh.getVertex(loops[0][i])
+            v3 = mesh.getVertex(loops[0][(i+1)%length])
             
-            vec1 = ( v1.x-v2.x , v1.y-v2.y , v1.z-v2.z )
-            vec2 = ( v3.x-v2.x , v3.y-v2.y , v3.z-v2.z )
+            vec1 = ( v1[0]-v2[0] , v1[1]-v2[1] , v1[2]-v2[2] )
+            vec2 = ( v3[0]-v2[0] , v3[1]-v2[1] , v3[2]-v2[2] )
             
             nVec = cross(vec1,vec2)
             for i in range(0,len(nVec)):
@@ -268,167 +497,75 @@ class polygon:
             if (nVec[0] > 0.00001) or (nVec[1] > 0.00001) or (nVec[2] > 0.00001): #Acceptable cross product value.  Was checking for in-line vertices, loop may terminate
                 break;
         
-        self.verts = [] #border loop vertices
-        self.holes = [] #inner loop vertices
-        
         '''###DEBUG PRINT
         print("Guess NORMAL VECTOR =",nVec)'''
         
         if (nVec[0] >= nVec[1]) and (nVec[0] >= nVec[2]):
             #X is least significant
-            '''###DEBUG PRINT
-            print("X is least significant")'''
-            for mem in sF.borderLoop.edgeLoopMembers:
-                if not mem.flipped:
-                    self.verts.append( vert2D(vertices[edges[mem.edge].a].z , vertices[edges[mem.edge].a].y, edges[mem.edge].a ))
-                else:
-                    self.verts.append( vert2D(vertices[edges[mem.edge].b].z , vertices[edges[mem.edge].b].y, edges[mem.edge].b ))
-            
-            for il in sF.innerLoops:
-                holeVerts = []
-                for mem in il.edgeLoopMembers:
-                    if not mem.flipped:
-                        holeVerts.append( vert2D(vertices[edges[mem.edge].a].z , vertices[edges[mem.edge].a].y, edges[mem.edge].a ))
-                    else:
-                        holeVerts.append( vert2D(vertices[edges[mem.edge].b].z , vertices[edges[mem.edge].b].y, edges[mem.edge].b ))
-                self.holes.append(holeVerts)
-            
+            axes = (2, 1)
         elif (nVec[1] > nVec[0]) and (nVec[1] >= nVec[2]):
             #Y is least significant
-            '''###DEBUG PRINT
-            print("Y is least significant")'''
-            for mem in sF.borderLoop.edgeLoopMembers:
-                if not mem.flipped:
-                    self.verts.append( vert2D( vertices[edges[mem.edge].a].x , vertices[edges[mem.edge].a].z, edges[mem.edge].a ))
-                else:
-                    self.verts.append( vert2D( vertices[edges[mem.edge].b].x , vertices[edges[mem.edge].b].z, edges[mem.edge].b ))
-            
-            for il in sF.innerLoops:
-                holeVerts = []
-                for mem in il.edgeLoopMembers:
-                    if not mem.flipped:
-                        holeVerts.append( vert2D( vertices[edges[mem.edge].a].x , vertices[edges[mem.edge].a].z, edges[mem.edge].a ))
-                    else:
-                        holeVerts.append( vert2D( vertices[edges[mem.edge].b].x , vertices[edges[mem.edge].b].z, edges[mem.edge].b ))
-                self.holes.append(holeVerts)
-            
+            axes = (0, 2)
         else:
             #Z is least significant
-            '''###DEBUG PRINT
-            print("Z is least significant")'''
-            for mem in sF.borderLoop.edgeLoopMembers:
-                if not mem.flipped:
-                    self.verts.append( vert2D( vertices[edges[mem.edge].a].x , vertices[edges[mem.edge].a].y, edges[mem.edge].a ))
-                else:
-                    self.verts.append( vert2D( vertices[edges[mem.edge].b].x , vertices[edges[mem.edge].b].y, edges[mem.edge].b ))
-            
-            for il in sF.innerLoops:
-                holeVerts = []
-                for mem in il.edgeLoopMembers:
-                    if not mem.flipped:
-                        holeVerts.append( vert2D( vertices[edges[mem.edge].a].x , vertices[edges[mem.edge].a].y, edges[mem.edge].a ))
-                    else:
-                        holeVerts.append( vert2D( vertices[edges[mem.edge].b].x , vertices[edges[mem.edge].b].y, edges[mem.edge].b ))
-                self.holes.append(holeVerts)
-        #Now we need to ensure that the vert order is counter-clockwise
-        area = 0.0
-        vert_order_reversed = False
-        for i in range(0,len(self.verts)):
-            x1 = self.verts[i].x
-            y1 = self.verts[i].y
-            x2 = self.verts[(i+1) % len(self.verts)].x
-            y2 = self.verts[(i+1) % len(self.verts)].y
-            
-            area+= (x1 * y2 - x2 * y1)
+            axes = (0, 1)
         
-        if (area < 0.0):
-            '''###DEBUG Print
-            print("reversing vert order!!!")'''
-            vert_order_reversed = True
-            self.verts.reverse()
-            
-        #Now, we need to do the same for the vert order of the holes, but they need to be clockwise
-        for hole in self.holes:
-            area = 0.0
-            for i in range(0,len(hole)):
-                x1 = hole[i].x
-                y1 = hole[i].y
-                x2 = hole[(i+1) % len(hole)].x
-                y2 = hole[(i+1) % len(hole)].y
-                
-                area+= (x1 * y2 - x2 * y1)
-            
-            if (area > 0.0):
-                hole.reverse()
+        #Quick sanity-check to make sure there's no <3 length holes in the list
+        loops = [loops[0]] + [l for l in loops[1:] if len(l) >= 3]
         
-        #Now, before we can start triangulating, we need to get rid of any holes.
-        holes = self.holes
-        border = self.verts
+        self.realIds = array.array('I')
+        loopStarts = [0]
+        for loop in loops:
+            self.realIds.extend(loop)
+            loopStarts.append(len(self.realIds))
         
-        #Quick sanity-check to make sure there's no <3 length holes in the list
-        for i in range(0,len(holes)):
-            if len(holes[i]) < 3:
-                holes[i] = None
-        holes[:] = [h for h in holes if h!=None]
+        #Project every vertex at once
+        numpy = SparkClasses.numpy
+        positions = mesh.positions
+        if numpy != None and len(self.realIds) >= VECTORIZE_MIN_VERTS:
+            co = numpy.frombuffer(positions, dtype=numpy.float32).reshape(-1, 3)[numpy.frombuffer(self.realIds, dtype=numpy.uint32)]
+            self.x = array.array('d', co[:, axes[0]].astype(numpy.float64).tobytes())
+            self.y = array.array('d', co[:, axes[1]].astype(numpy.float64).tobytes())
+        else:
+            self.x = array.array('d', [positions[v*3 + axes[0]] for v in self.realIds])
+            self.y = array.array('d', [positions[v*3 + axes[1]] for v in self.realIds])
+        x = self.x
+        y = self.y
+        
+        #Now we need to ensure that the vert order of the border is counter-clockwise, and the vert order of the
+        #holes is clockwise
+        vert_order_reversed = False
+        for l, area in enumerate(LoopAreas(x, y, loopStarts)):
+            if (l == 0 and area < 0.0) or (l > 0 and area > 0.0):
+                '''###DEBUG Print
+                print("reversing vert order!!!")'''
+                if l == 0:
+                    vert_order_reversed = True
+                s = loopStarts[l]
+                e = loopStarts[l+1]
+                x[s:e] = x[s:e][::-1]
+                y[s:e] = y[s:e][::-1]
+                self.realIds[s:e] = self.realIds[s:e][::-1]
+        
+        border = length
+        holes = [(loopStarts[l], loopStarts[l+1] - loopStarts[l]) for l in range(1, len(loops))]
         
-        ProcessHoles(border, holes)
+        ring = PolygonRing(x, y, border)
+        ProcessHoles(ring, holes)
         
         """###DEBUG VERBOSITY###
         print("TRIANGULATION VERTS AFTER HOLE FIXING:")
-        for i,v in enumerate(border):
-            print("    ",i,":", v.realId)"""
-        
-        # Now we can start triangulating by clipping off ears.  To get nice results, we're going to first gather a list of all
-        # the candidate "ears".  An ear is a triangle formed by 3 consecutive vertices that is convex, and contains no other
-        # vertices from the same polygon.  We will sort this list of ears by the maximum minumum interior angle.
-        while (len(border) > 3):
-            ears = [] #stores the border[] list index of the vertex, not a reference to the vertex
-            for i in range(0, len(border)):
-                v1 = border[(i + (len(border)-1)) % (len(border))]
-                v2 = border[i]
-                v3 = border[(i+1)%(len(border))]
-                '''###DEBUG
-                print("Checking vert:",i)
-                print("V1:",v1)
-                print("V2:",v2)
-                print("V3:",v3)'''
-                if (IsEar(border, v1, v2, v3)):
-                    ears.append(i)
-            
-            '''###DEBUG PRINTING###
-            print("EAR LIST")
-            for i,e in enumerate(ears):
-                print("    ",i,'-',e)'''
-            
-            
-            sEars = [] ##sorted ears
-            while(len(ears) >0):
-                if (len(ears) == 1):
-                    sEars.append(ears[0])
-                    ears.pop(0)
-                else:
-                    maxE = 0
-                    triple = get3Verts(border, ears[0])
-                    minVal = MaxMinAngle(triple[0],triple[1],triple[2])
-                    for i in range(1,len(ears)):
-                        triple = get3Verts(border, ears[i])
-                        minCandidate = MaxMinAngle(triple[0],triple[1],triple[2])
-                        if (minCandidate > minVal):
-                            maxE = i
-                            minval = minCandidate
-                    sEars.append(ears[maxE])
-                    ears.pop(maxE)
-            
-            #Now we have the best candidate for the ear at the top of the sorted list, let's use it.
-            if len(sEars) == 0:
-                break
-            earVerts = get3Verts(border,sEars[0])
-            self.triangles.append(triangle(earVerts[0],earVerts[1],earVerts[2]))
-            border.pop(sEars[0])
+        for i in ring.walk():
+            print("    ",i,":", self.realIds[ring.vert[i]])"""
         
-        self.triangles.append(triangle(border[0], border[1], border[2]))
+        # Now we can start triangulating by clipping off ears.  To get nice results, we always clip the ear with the
+        # best (maximum minimum) interior angle first.
+        tris = array.array('I') #Workspace vertices, 3 per triangle
+        ClipEars(ring, tris)
         if vert_order_reversed:
-            for t in self.triangles:
-                temp_vert = t.v1
-                t.v1 = t.v3
-                t.v3 = temp_vert
+            first = tris[0::3]
+            tris[0::3] = tris[2::3]
+            tris[2::3] = first
+        
+        realIds = self.realIds
+        self.triangles = array.array('I', [realIds[v] for v in tris])
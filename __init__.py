@@ -74,6 +74,18 @@ class ImportSparkData(bpy.types.Operator):
         description="You thought it was over with #3... but you were wrong... DEAD WRONG!  Here we are: THE FOURTH AND FINAL ALTERNATE TEXTURE DIRECTORY!!! MUAHAHAHAHAHAHAHA!!!",
         default = "",
         )
+    
+    texture_index_file = StringProperty(
+        name = "Texture Index File",
+        description = "Optional file to save the index of the texture directories to (eg. \"c:\\projects\\spark_texture_index.json\"), so it's kept between Blender sessions.  Within a session the index is always kept, and only the parts of the directories that have changed are searched again.  Keep the file outside the texture directories.  Leave blank to search them fresh once each session.",
+        default = "",
+        )
+    
+    profile = BoolProperty(
+        name = "Profile",
+        description = "Time each step of the import and print a report (JSON) to the console, along with a full dump of the data.  Setting the SPARK_PROFILE environment variable to \"1\", or to a file to save the report to, does the same.  Leave this off unless you're tracking down something slow, as the dump can take a while on big meshes.",
+        default = False,
+        )
 
     def execute(self, context):
         from . import ImportSparkClipboard
@@ -115,6 +127,12 @@ class ExportSparkData(bpy.types.Operator):
         description = "This exports the textures applied to each face via UV layers.  The file extension is changed to \".material\", and the file path is stripped off up to and including \"ns2\" and/or \"output\".  For example, if a face has a UV texture from \"C:\\Program Files (x86)\\Steam\\steamapps\\common\\Natural Selection 2\\ns2\\materials\\descent\\descent_ceiling_01.dds\", the new path becomes \"materials\\descent\\descent_ceiling_01.material\".  If this option is unchecked, the materials default to a developer texture. Muahahahahahaha!!!!!",
         default = True,
         )
+    
+    profile = BoolProperty(
+        name = "Profile",
+        description = "Time each step of the export and print a report (JSON) to the console.  Setting the SPARK_PROFILE environment variable to \"1\", or to a file to save the report to, does the same.",
+        default = False,
+        )
         
     def execute(self, context):
         from . import ExportSparkClipboard
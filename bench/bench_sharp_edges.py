@@ -0,0 +1,69 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Time taken by FindSharpEdges for 1k to 1M edges, with and without NumPy, to show it grows linearly with the
+# edge count.  ImportSparkClipboard needs Blender's modules, so run it with Blender's Python:
+#     blender --background --python bench/bench_sharp_edges.py
+
+import os
+import sys
+import array
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+from common import load
+
+SparkClasses = load("SparkClasses")
+ImportSparkClipboard = load("ImportSparkClipboard")
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+def MakeEdges(count):
+    """Returns spark edges ('endpoints', 'smooth', about 30% smooth) and the same edges the way Blender would hand
+    them back: shuffled, and each one either way around"""
+    rand = random.Random(count)
+    endpoints = array.array('I')
+    smooth = array.array('B')
+    for i in range(0, count):
+        endpoints.extend((i, (i * 7 + 1) % (count + 1)))
+        smooth.append(1 if rand.random() < 0.3 else 0)
+    order = list(range(0, count))
+    rand.shuffle(order)
+    edgeVerts = array.array('i')
+    for e in order:
+        a = endpoints[e*2]
+        b = endpoints[e*2+1]
+        edgeVerts.extend((a, b) if rand.random() < 0.5 else (b, a))
+    return endpoints, smooth, edgeVerts
+
+def Time(endpoints, smooth, edgeVerts):
+    best = None
+    for r in range(0, 3):
+        start = time.perf_counter()
+        sharp = ImportSparkClipboard.FindSharpEdges(endpoints, smooth, edgeVerts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best, sharp
+
+def main():
+    numpy = SparkClasses.numpy
+    paths = [("sets", None)] + ([("numpy", numpy)] if numpy != None else [])
+    print("%10s" % "edges" + "".join("  %10s %9s" % (name + " s", "ns/edge") for (name, module) in paths))
+    for count in SIZES:
+        endpoints, smooth, edgeVerts = MakeEdges(count)
+        line = "%10d" % count
+        results = []
+        for name, module in paths:
+            SparkClasses.numpy = module
+            elapsed, sharp = Time(endpoints, smooth, edgeVerts)
+            results.append(sharp)
+            line += "  %10.4f %9.1f" % (elapsed, elapsed / count * 1e9)
+        SparkClasses.numpy = numpy
+        if any(sharp != results[0] for sharp in results):
+            raise RuntimeError("The NumPy and plain versions disagree at " + str(count) + " edges")
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Reads per second of SparkData over a synthetic buffer of 1M 4-byte scalars, against the old cursor that sliced a
+# new bytes object out of the data for every read.  Run it with: python bench/bench_sparkdata.py
+
+import os
+import sys
+import struct
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+from common import load
+
+SparkClasses = load("SparkClasses")
+
+COUNT = 1000000
+REPEATS = 3
+
+class SliceData:
+    """The cursor as it was before SparkData used a memoryview: a bounds check, a slice and a struct.unpack per
+    read"""
+    def __init__(self, data):
+        self.data = data
+        self.dPt = 0
+    
+    def readL(self):
+        if (len(self.data) < self.dPt +4):
+            raise SparkClasses.SparkError("Unexpected end of data stream when reading a 4-byte integer!")
+        else:
+            r = struct.unpack("<L", self.data[self.dPt:self.dPt+4])
+            self.dPt += 4
+            return r[0]
+    
+    def readF(self):
+        if (len(self.data) < self.dPt +4):
+            raise SparkClasses.SparkError("Unexpected end of data stream when reading a 4-byte float!")
+        else:
+            r = struct.unpack("<f", self.data[self.dPt:self.dPt+4])
+            self.dPt += 4
+            return r[0]
+
+def ReadsPerSecond(cls, data, method):
+    """Best of REPEATS passes, each reading all COUNT scalars with 'method' of a fresh cursor"""
+    best = None
+    for r in range(0, REPEATS):
+        sD = cls(data)
+        read = getattr(sD, method)
+        start = time.perf_counter()
+        for i in range(0, COUNT):
+            read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return COUNT / best
+
+def RecordsPerSecond(data, record):
+    """Same, but through readRecord(), a whole record per call"""
+    best = None
+    for r in range(0, REPEATS):
+        sD = SparkClasses.SparkData(data)
+        start = time.perf_counter()
+        for i in range(0, COUNT // (record.size // 4)):
+            sD.readRecord(record)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return COUNT / best
+
+def main():
+    ints = struct.pack("<%dL" % COUNT, *range(0, COUNT))
+    floats = struct.pack("<%df" % COUNT, *[i * 0.5 for i in range(0, COUNT)])
+    print("%d scalars, best of %d, millions of scalars read per second" % (COUNT, REPEATS))
+    print("%-28s %8s %8s %8s" % ("", "slices", "view", "speedup"))
+    for name, data, method in (("readL", ints, "readL"), ("readF", floats, "readF")):
+        before = ReadsPerSecond(SliceData, data, method)
+        after = ReadsPerSecond(SparkClasses.SparkData, data, method)
+        print("%-28s %8.2f %8.2f %7.2fx" % (name, before / 1e6, after / 1e6, after / before))
+    before = ReadsPerSecond(SliceData, floats, "readF")
+    after = RecordsPerSecond(floats, struct.Struct("<3f"))
+    print("%-28s %8.2f %8.2f %7.2fx" % ("readRecord, 3 floats a call", before / 1e6, after / 1e6, after / before))
+
+if __name__ == "__main__":
+    main()
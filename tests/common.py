@@ -0,0 +1,29 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Helpers shared by the tests.  The add-on's __init__ needs Blender, so the modules are loaded into a stand-in
+# package instead of importing the add-on itself.
+
+import sys
+import os
+import types
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "spark_tools"
+
+def load(name):
+    """Returns the add-on module 'name' (e.g. "Triangulation"), without running the add-on's __init__"""
+    if not PACKAGE in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(PACKAGE + "." + name)
+
+def pytest_collect_directory(path, parent):
+    """pytest hook (common is loaded as a plugin by pytest.ini): the add-on folder has an __init__, but mustn't be
+    collected as a package, since importing it needs Blender"""
+    import pytest
+    if path == parent.config.rootpath:
+        return pytest.Dir.from_parent(parent, path = path)
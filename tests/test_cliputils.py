@@ -0,0 +1,98 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for the ClipUtils clipboard backends: picking one, and getting data through the file and memory stand-ins.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+from common import load, PACKAGE
+
+SparkClasses = load("SparkClasses")
+ClipUtils = load("ClipUtils")
+
+DATA = b'\x01\x00\x00\x00spark data\x00\xff'
+
+class BackendTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "clipboard.bin")
+        #Each test starts with no backend picked yet, and none of the environment variables set
+        for patch in (unittest.mock.patch.object(ClipUtils, "activeBackend", None),
+                      unittest.mock.patch.dict(os.environ),
+                      unittest.mock.patch.dict(ClipUtils.BACKENDS)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        os.environ.pop("SPARK_CLIPBOARD_BACKEND", None)
+        os.environ.pop("SPARK_CLIPBOARD_FILE", None)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def testBackendFromEnvironment(self):
+        os.environ["SPARK_CLIPBOARD_BACKEND"] = "file"
+        os.environ["SPARK_CLIPBOARD_FILE"] = self.path
+        backend = ClipUtils.GetBackend()
+        self.assertIsInstance(backend, ClipUtils.FileClipboard)
+        self.assertEqual(backend.path, self.path)
+        self.assertIs(ClipUtils.GetBackend(), backend)
+    
+    def testSetBackend(self):
+        os.environ["SPARK_CLIPBOARD_BACKEND"] = "file"
+        backend = ClipUtils.SetBackend("memory", data = DATA)
+        self.assertIsInstance(backend, ClipUtils.MemoryClipboard)
+        self.assertIs(ClipUtils.GetBackend(), backend)
+        self.assertEqual(ClipUtils.GetClipboardAsString(), DATA)
+    
+    def testUnknownBackend(self):
+        with self.assertRaises(SparkClasses.SparkError):
+            ClipUtils.SetBackend("carrier pigeon")
+        os.environ["SPARK_CLIPBOARD_BACKEND"] = "carrier pigeon"
+        with self.assertRaises(SparkClasses.SparkError):
+            ClipUtils.GetBackend()
+        self.assertEqual(ClipUtils.activeBackend, None)
+    
+    def testRegisterBackend(self):
+        ClipUtils.RegisterBackend("spare", ClipUtils.MemoryClipboard)
+        self.assertIsInstance(ClipUtils.SetBackend("spare"), ClipUtils.MemoryClipboard)
+    
+    def testFileRoundTrip(self):
+        ClipUtils.SetBackend("file", path = self.path)
+        self.assertTrue(ClipUtils.SetClipboardFromString(memoryview(bytearray(DATA))))
+        self.assertEqual(ClipUtils.GetClipboardAsString(), DATA)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), DATA)
+    
+    def testFileMissingOrEmpty(self):
+        with self.assertRaises(SparkClasses.SparkError):
+            ClipUtils.SetBackend("file") #No path, and no SPARK_CLIPBOARD_FILE
+        ClipUtils.SetBackend("file", path = self.path)
+        open(self.path, 'wb').close()
+        with self.assertRaises(SparkClasses.SparkError):
+            ClipUtils.GetClipboardAsString()
+    
+    def testMemoryRoundTrip(self):
+        ClipUtils.SetBackend("memory")
+        with self.assertRaises(SparkClasses.SparkError):
+            ClipUtils.GetClipboardAsString()
+        data = bytearray(DATA)
+        ClipUtils.SetClipboardFromString(data)
+        data[0] = 0 #It keeps its own copy
+        self.assertEqual(ClipUtils.GetClipboardAsString(), DATA)
+    
+    @unittest.skipIf(sys.platform == "win32", "The native clipboard is the default on Windows")
+    def testNativeNotImported(self):
+        os.environ["SPARK_CLIPBOARD_BACKEND"] = "memory"
+        with unittest.mock.patch.dict(sys.modules):
+            sys.modules.pop(PACKAGE + ".sparkclip", None)
+            ClipUtils.GetBackend().set(DATA)
+            ClipUtils.SetBackend("file", path = self.path).set(DATA)
+            self.assertNotIn(PACKAGE + ".sparkclip", sys.modules)
+
+if __name__ == "__main__":
+    unittest.main()
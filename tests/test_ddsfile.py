@@ -0,0 +1,77 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for DDSFile: reading the size and channels out of the header, and reading them again once the file changes.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import load
+
+DDSFile = load("DDSFile")
+
+def MakeHeader(width, height, fourCC = b'DXT5'):
+    header = bytearray(DDSFile.DDS_HEADER_SIZE)
+    DDSFile.DDS_HEADER.pack_into(header, 0, DDSFile.DDS_MAGIC, 124, 0, height, width)
+    DDSFile.DDS_PIXELFORMAT.pack_into(header, DDSFile.DDS_PIXELFORMAT_OFFSET, 32, DDSFile.DDPF_FOURCC, fourCC, 0, 0, 0, 0, 0)
+    return bytes(header)
+
+class DDSFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "wall.dds")
+        DDSFile.ddsInfoCache.clear()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        DDSFile.ddsInfoCache.clear()
+    
+    def write(self, header, mtime):
+        with open(self.path, 'wb') as f:
+            f.write(header)
+        os.utime(self.path, ns = (mtime, mtime))
+    
+    def testParseHeader(self):
+        self.assertEqual(DDSFile.ParseDDSHeader(MakeHeader(256, 128)), (256, 128, 4))
+        self.assertEqual(DDSFile.ParseDDSHeader(MakeHeader(64, 64, b'DXT1')), (64, 64, 3))
+        self.assertEqual(DDSFile.ParseDDSHeader(b'not a dds file'), None)
+    
+    def testRememberedUntilChanged(self):
+        self.write(MakeHeader(256, 128), 10 ** 18)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (256, 128, 4))
+        probe = DDSFile.ProbeDDSFile
+        reads = []
+        def CountingProbe(path):
+            reads.append(path)
+            return probe(path)
+        DDSFile.ProbeDDSFile = CountingProbe
+        self.addCleanup(setattr, DDSFile, "ProbeDDSFile", probe)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (256, 128, 4))
+        self.assertEqual(reads, [])
+        
+        #Same size, only the mtime tells it apart
+        self.write(MakeHeader(512, 512), 2 * 10 ** 18)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (512, 512, 4))
+        self.assertEqual(len(reads), 1)
+        
+        #Same mtime, only the size tells it apart
+        self.write(MakeHeader(64, 64) + b'\0' * 16, 2 * 10 ** 18)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (64, 64, 4))
+        self.assertEqual(len(reads), 2)
+        
+        os.remove(self.path)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), None)
+        self.assertEqual(len(reads), 3)
+    
+    def testRememberDDSInfo(self):
+        self.write(MakeHeader(256, 128), 10 ** 18)
+        DDSFile.RememberDDSInfo(self.path, (1, 2, 3))
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (1, 2, 3))
+        self.write(MakeHeader(256, 128) + b'\0', 10 ** 18)
+        self.assertEqual(DDSFile.ReadDDSInfo(self.path), (256, 128, 4))
+
+if __name__ == "__main__":
+    unittest.main()
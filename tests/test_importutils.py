@@ -0,0 +1,329 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for ImportUtils, the parts of the importer that run without Blender.
+
+import array
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from common import load
+
+SparkClasses = load("SparkClasses")
+TextureIndex = load("TextureIndex")
+ImportUtils = load("ImportUtils")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_clip.bin")
+
+def CalculateVertUVCoord(co, normalVector, texSettings, CORRECT_UNIT_FACTOR, texSizes):
+    """The importer's original UV formula, worked out one vertex at a time.  Only the texture size lookup differs:
+    it's given the sizes, where the original took them from the Blender images."""
+    angle = texSettings[0]
+    xOffset = texSettings[1]*-1
+    yOffset = texSettings[2]*-1
+    xScale = texSettings[3]
+    yScale = texSettings[4]
+    material = texSettings[5]
+    texDim = (512, 512) #default value, if no texture is found
+    if (texSizes[material] != None):
+        texDim = texSizes[material]
+    norm = [normalVector[0], normalVector[1], normalVector[2]]
+    
+    xScale = (8*CORRECT_UNIT_FACTOR) / (xScale * texDim[0])
+    yScale = (8*CORRECT_UNIT_FACTOR) / (yScale * texDim[1])
+    
+    texCoords = []
+    texCoords.append(co[0])
+    texCoords.append(co[1])
+    texCoords.append(co[2])
+    
+    norm[0]*=-1
+    norm[1]*=-1
+    norm[2]*=-1
+    
+    if ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] >= -0.99873 ):
+        norm[0] = 0.0
+        norm[1] = 0.0
+        norm[2] = 1.0
+    elif ( abs( norm[0] ) < 0.00127 ) and ( abs( norm[1] ) < 0.00127 ) and (  norm[2] <= 0.99873 ):
+        norm[0] = 0.0
+        norm[1] = 0.0
+        norm[2] = 1.0
+        texCoords[0] = texCoords[0]*-1
+        texCoords[1] = texCoords[1]*-1
+        texCoords[2] = texCoords[2]*-1
+    else:
+        a = math.pi - math.atan2( norm[0] , norm[1] )
+        x = texCoords[0] * math.cos(-a) - texCoords[1] * math.sin(-a)
+        y = texCoords[0] * math.sin(-a) + texCoords[1] * math.cos(-a)
+        texCoords[0] = x
+        texCoords[1] = y
+        norm[1] = math.sqrt( ( norm[0]*norm[0] ) + ( norm[1]*norm[1] ) )
+        norm[0] = 0.0
+        
+        a = -math.atan2( norm[1], norm[2] )
+        texCoords[1] = texCoords[1] * math.cos(a) - texCoords[2] * math.sin(a)
+    
+    x = texCoords[0] * math.cos(angle) - texCoords[1] * math.sin(angle)
+    y = texCoords[0] * math.sin(angle) + texCoords[1] * math.cos(angle)
+    texCoords[0] = x
+    texCoords[1] = y
+    
+    texCoords[0] = (((texCoords[0] * 8) / (texDim[0] * xScale)) - xOffset)
+    texCoords[1] = (((texCoords[1] * 8) / (texDim[1] * yScale)) + yOffset)
+    
+    texCoords=texCoords[:2]
+    return texCoords
+
+def RandomNormal(rand):
+    """A random unit normal.  Some are straight up or down, or just off it, to cover each branch of the formula."""
+    kind = rand.randint(0, 5)
+    if kind == 0:
+        return (0.0, 0.0, rand.choice([1.0, -1.0]))
+    if kind == 1:
+        x = rand.uniform(-0.001, 0.001)
+        y = rand.uniform(-0.001, 0.001)
+        z = rand.choice([1.0, -1.0]) * math.sqrt(1.0 - x * x - y * y)
+        return (x, y, z)
+    x, y, z = (rand.gauss(0.0, 1.0) for i in range(0, 3))
+    if kind == 2:
+        z = 0.0
+    length = math.sqrt(x * x + y * y + z * z)
+    return (x / length, y / length, z / length)
+
+class Grouping:
+    """Stands in for the importer's MaterialGrouping, which is just the attributes"""
+    def __init__(self, file, albedoMap):
+        self.file = file
+        self.albedoMap = albedoMap
+        self.normalMap = None
+        self.specularMap = None
+        self.opacityMap = None
+        self.emissiveMap = None
+
+class ParseCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(BASELINE, "rb") as f:
+            cls.data = f.read()
+    
+    def decode(self, data):
+        mc = SparkClasses.SparkMeshChunkClipboard()
+        mc.constructFromBinString(data)
+        return ImportUtils.ParseCacheEntry(SparkClasses.SparkMeshColumns.fromMeshChunk(mc))
+    
+    def testKey(self):
+        key = ImportUtils.ParseCache.getKey(self.data)
+        self.assertIsInstance(key, bytes)
+        self.assertEqual(ImportUtils.ParseCache.getKey(bytes(bytearray(self.data))), key)
+        self.assertNotEqual(ImportUtils.ParseCache.getKey(self.data[:-1] + bytes([self.data[-1] ^ 1])), key)
+    
+    def testHit(self):
+        cache = ImportUtils.ParseCache()
+        self.assertEqual(cache.lookup(ImportUtils.ParseCache.getKey(self.data)), None)
+        entry = self.decode(self.data)
+        cache.store(ImportUtils.ParseCache.getKey(self.data), entry)
+        #A second paste of the same selection comes in as a new bytes object
+        self.assertIs(cache.lookup(ImportUtils.ParseCache.getKey(bytes(bytearray(self.data)))), entry)
+    
+    def testLeastRecentlyUsedDropped(self):
+        cache = ImportUtils.ParseCache(maxEntries = 2)
+        entries = [self.decode(self.data) for i in range(0, 3)]
+        cache.store(b'a', entries[0])
+        cache.store(b'b', entries[1])
+        cache.lookup(b'a')
+        cache.store(b'c', entries[2])
+        self.assertIs(cache.lookup(b'a'), entries[0])
+        self.assertEqual(cache.lookup(b'b'), None)
+        self.assertIs(cache.lookup(b'c'), entries[2])
+    
+    def testMemorySize(self):
+        entry = self.decode(self.data)
+        self.assertEqual(entry.getMemorySize(), entry.mesh.getMemorySize())
+        entry.uvs[(True, True, False, ())] = array.array('f', [0.0]) * 100
+        self.assertEqual(entry.getMemorySize(), entry.mesh.getMemorySize() + 400)
+        cache = ImportUtils.ParseCache(maxBytes = entry.getMemorySize() - 1)
+        cache.store(b'a', entry)
+        self.assertEqual(cache.lookup(b'a'), None)
+
+class MaterialSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = self.dir.replace('\\','/') + '/'
+        os.makedirs(self.root + "materials/dev")
+        os.makedirs(self.root + "models")
+        self.material = self.root + "materials/dev/wall.material"
+        self.texture = self.root + "materials/dev/wall.dds"
+        for path in (self.material, self.texture):
+            with open(path, 'w') as f:
+                f.write("x")
+        TextureIndex.scannedRoots.clear()
+        #The lookups ResolveMaterial() would make
+        index = TextureIndex.TextureIndex([self.root])
+        index.resolve(self.material)
+        index.resolve(self.texture)
+        index.resolve(self.root + "materials/dev/wall_normal.dds")
+        self.entry = ImportUtils.ParseCacheEntry(SparkClasses.SparkMeshColumns())
+        self.resolved = [(Grouping(self.material, self.texture), self.texture)]
+        self.entry.storeMaterials([self.root], self.resolved, index.getChecked())
+        self.entry.uvs[(True, True, True, (self.root,))] = array.array('f')
+        self.entry.uvs[(True, True, True, ("/elsewhere/",))] = array.array('f')
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TextureIndex.scannedRoots.clear()
+    
+    def touch(self, path):
+        mtime = os.stat(path).st_mtime_ns + 10 ** 9
+        os.utime(path, ns = (mtime, mtime))
+    
+    def testUnchanged(self):
+        self.assertIs(self.entry.getMaterials([self.root]), self.resolved)
+        self.assertEqual(len(self.entry.uvs), 2)
+    
+    def testTextureChanged(self):
+        self.touch(self.texture)
+        self.assertEqual(self.entry.getMaterials([self.root]), None)
+        self.assertEqual(list(self.entry.uvs), [(True, True, True, ("/elsewhere/",))])
+    
+    def testMaterialChanged(self):
+        self.touch(self.material)
+        self.assertEqual(self.entry.getMaterials([self.root]), None)
+    
+    def testFileAdded(self):
+        with open(self.root + "materials/dev/wall_normal.dds", 'w') as f:
+            f.write("x")
+        self.touch(self.root + "materials/dev")
+        self.assertEqual(self.entry.getMaterials([self.root]), None)
+    
+    def testOtherDirectoryChanged(self):
+        #Nothing was looked up there, so it can't change what was found
+        with open(self.root + "models/wall.material", 'w') as f:
+            f.write("x")
+        self.touch(self.root + "models")
+        self.assertIs(self.entry.getMaterials([self.root]), self.resolved)
+
+class TransformPositionsTest(unittest.TestCase):
+    def assertTransformed(self):
+        rand = random.Random(1)
+        positions = array.array('f', [rand.uniform(-500.0, 500.0) for i in range(0, 100 * 3)])
+        for unitFactor in (1.0, 39.3700787):
+            for correctAxes in (False, True):
+                with self.subTest(unitFactor = unitFactor, correctAxes = correctAxes):
+                    #The way the importer used to do it, a vertex at a time
+                    expected = array.array('f')
+                    for v in range(0, 100):
+                        x, y, z = positions[v*3:v*3+3]
+                        if correctAxes:
+                            expected.extend((z*unitFactor, x*unitFactor, y*unitFactor))
+                        else:
+                            expected.extend((x*unitFactor, y*unitFactor, z*unitFactor))
+                    self.assertEqual(ImportUtils.TransformPositions(positions, unitFactor, correctAxes), expected)
+        self.assertEqual(ImportUtils.TransformPositions(array.array('f'), 39.3700787, True), array.array('f'))
+    
+    @unittest.skipIf(SparkClasses.numpy == None, "NumPy isn't installed")
+    def testTransform(self):
+        self.assertTransformed()
+    
+    def testTransformWithoutNumPy(self):
+        with unittest.mock.patch.object(SparkClasses, "numpy", None):
+            self.assertTransformed()
+
+class ProjectUVsTest(unittest.TestCase):
+    TEX_SIZES = [(1024, 512), None, (256, 256), (64, 2048)]
+    
+    def project(self, seed):
+        """Projects a random mesh with ProjectUVs, and with the original formula.  Returns both, as flat u,v lists."""
+        rand = random.Random(seed)
+        unitFactor = rand.choice([1.0, 39.3700787])
+        coords = array.array('f', [rand.uniform(-500.0, 500.0) for i in range(0, 200 * 3)])
+        groups = []
+        for g in range(0, rand.randint(1, 20)):
+            texSettings = (rand.uniform(-math.pi, math.pi), rand.uniform(-2.0, 2.0), rand.uniform(-2.0, 2.0),
+                           rand.uniform(0.05, 4.0), rand.uniform(0.05, 4.0), rand.randrange(0, len(self.TEX_SIZES)))
+            groups.append((RandomNormal(rand), texSettings))
+        matrices = array.array('d')
+        for normalVector, texSettings in groups:
+            matrices.extend(ImportUtils.CalculateUVMatrix(normalVector, texSettings, unitFactor, self.TEX_SIZES))
+        loopVerts = array.array('i')
+        polyTotals = array.array('i')
+        polyMatrices = array.array('i')
+        expected = []
+        for p in range(0, 100):
+            g = rand.randrange(0, len(groups))
+            polyMatrices.append(g)
+            polyTotals.append(rand.randint(3, 8))
+            for i in range(0, polyTotals[-1]):
+                v = rand.randrange(0, 200)
+                loopVerts.append(v)
+                expected.extend(CalculateVertUVCoord(coords[v*3:v*3+3], groups[g][0], groups[g][1], unitFactor, self.TEX_SIZES))
+        return ImportUtils.ProjectUVs(coords, loopVerts, polyTotals, polyMatrices, matrices), expected
+    
+    def assertMatchesFormula(self):
+        for seed in range(0, 50):
+            with self.subTest(seed = seed):
+                uvs, expected = self.project(seed)
+                self.assertEqual(len(uvs), len(expected))
+                for i in range(0, len(uvs)):
+                    #The UVs are stored as 32 bit floats
+                    self.assertAlmostEqual(uvs[i], expected[i], delta = 1e-6 * max(1.0, abs(expected[i])))
+    
+    @unittest.skipIf(SparkClasses.numpy == None, "NumPy isn't installed")
+    def testMatchesFormula(self):
+        self.assertMatchesFormula()
+    
+    def testMatchesFormulaWithoutNumPy(self):
+        with unittest.mock.patch.object(SparkClasses, "numpy", None):
+            self.assertMatchesFormula()
+
+class FindSharpEdgesTest(unittest.TestCase):
+    def edges(self, seed):
+        """Random spark edges, and the Blender edges: the same vertex pairs, reordered and some flipped, plus some
+        Blender made up"""
+        rand = random.Random(seed)
+        pairs = set()
+        while len(pairs) < 300:
+            a, b = rand.sample(range(0, 100), 2)
+            pairs.add((min(a, b), max(a, b)))
+        pairs = list(pairs)
+        endpoints = array.array('I')
+        smooth = array.array('B')
+        for a, b in pairs[:200]:
+            endpoints.extend((a, b) if rand.random() < 0.5 else (b, a))
+            smooth.append(rand.randint(0, 1))
+        blenderPairs = pairs[:]
+        rand.shuffle(blenderPairs)
+        edgeVerts = array.array('i')
+        for a, b in blenderPairs:
+            edgeVerts.extend((a, b) if rand.random() < 0.5 else (b, a))
+        return endpoints, smooth, edgeVerts
+    
+    def testMatchesSets(self):
+        for seed in range(0, 20):
+            with self.subTest(seed = seed):
+                endpoints, smooth, edgeVerts = self.edges(seed)
+                with unittest.mock.patch.object(SparkClasses, "numpy", None):
+                    expected = ImportUtils.FindSharpEdges(endpoints, smooth, edgeVerts)
+                self.assertEqual(len(expected), len(edgeVerts) // 2)
+                self.assertIn(True, expected)
+                self.assertIn(False, expected)
+                if SparkClasses.numpy != None:
+                    self.assertEqual(ImportUtils.FindSharpEdges(endpoints, smooth, edgeVerts), expected)
+    
+    def testSmoothEdgesMarked(self):
+        #Spark's smooth edges are the ones Blender needs marking sharp
+        endpoints = array.array('I', [0, 1, 2, 1, 2, 3])
+        smooth = array.array('B', [1, 1, 0])
+        edgeVerts = array.array('i', [3, 2, 1, 0, 1, 2, 0, 3])
+        self.assertEqual(ImportUtils.FindSharpEdges(endpoints, smooth, edgeVerts), [False, True, True, False])
+        with unittest.mock.patch.object(SparkClasses, "numpy", None):
+            self.assertEqual(ImportUtils.FindSharpEdges(endpoints, smooth, edgeVerts), [False, True, True, False])
+
+if __name__ == "__main__":
+    unittest.main()
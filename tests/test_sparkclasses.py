@@ -0,0 +1,197 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Round trip tests for the clipboard encoder: decoding a clip and encoding it again has to give back exactly the same
+# bytes.  data/baseline_clip.bin was written by the original bytes += encoder (2 materials, 120 vertices, 120 edges
+# with some smooth, 40 faces, half of them in one of 3 mapping groups).  Also tests merging meshes, and the
+# mapping group index.
+
+import os
+import random
+import unittest
+import unittest.mock
+
+from common import load
+
+SparkClasses = load("SparkClasses")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_clip.bin")
+
+class RoundTripTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(BASELINE, "rb") as f:
+            cls.data = f.read()
+    
+    def decode(self, lazy = False):
+        mc = SparkClasses.SparkMeshChunkClipboard()
+        mc.constructFromBinString(self.data, lazy)
+        return mc
+    
+    def assertRoundTrip(self):
+        self.assertEqual(self.decode().convertToBinString(), self.data)
+        self.assertEqual(self.decode(True).convertToBinString(), self.data)
+        self.assertEqual(SparkClasses.SparkMeshColumns.fromMeshChunk(self.decode()).convertToBinString(), self.data)
+    
+    def testRoundTrip(self):
+        self.assertRoundTrip()
+    
+    @unittest.skipIf(SparkClasses.numpy == None, "NumPy isn't installed")
+    def testRoundTripWithoutNumPy(self):
+        with unittest.mock.patch.object(SparkClasses, "numpy", None):
+            self.assertRoundTrip()
+    
+    def testWriteInto(self):
+        mc = self.decode()
+        size = mc.getBinSize()
+        self.assertEqual(size, len(self.data))
+        buf = bytearray(size + 16)
+        self.assertEqual(mc.writeInto(buf, 8), 8 + size)
+        self.assertEqual(bytes(buf[8:8+size]), self.data)
+        self.assertEqual(bytes(buf[:8]) + bytes(buf[8+size:]), bytes(16))
+    
+    def testWriteIntoSmallBuffer(self):
+        mc = self.decode()
+        with self.assertRaises(SparkClasses.SparkError):
+            mc.writeInto(bytearray(mc.getBinSize() - 1))
+
+def MakeMappingGroup(id, angle):
+    map = SparkClasses.SparkMappingGroup()
+    map.id = id
+    map.angle, map.xScale, map.yScale, map.xOffset, map.yOffset = angle, 1.0, 1.0, 0.0, 0.0
+    map.xNormal, map.yNormal, map.zNormal = 0.0, 0.0, 1.0
+    return map
+
+class MappingGroupChunkTest(unittest.TestCase):
+    def setUp(self):
+        self.chunk = SparkClasses.SparkMappingGroupChunk()
+        for id in (5, 8, 5):
+            self.chunk.addMappingGroup(MakeMappingGroup(id, float(id)))
+    
+    def testLookup(self):
+        self.assertEqual(self.chunk.getMappingByID(8), 1)
+        self.assertEqual(self.chunk.getMappingByID(5), 0) #First group with the id wins
+        self.assertEqual(self.chunk.getMappingByID(2), -1)
+        self.assertEqual(self.chunk.getMappingParams(8), ((8.0, 0.0, 0.0, 1.0, 1.0), (0.0, 0.0, 1.0)))
+        self.assertEqual(self.chunk.getMappingParams(2), None)
+    
+    def testSetMappingGroup(self):
+        self.chunk.setMappingGroup(1, MakeMappingGroup(8, 3.0))
+        self.assertEqual(self.chunk.getMappingParams(8)[0][0], 3.0)
+        self.chunk.setMappingGroup(0, MakeMappingGroup(2, 4.0))
+        self.assertEqual(self.chunk.getMappingByID(2), 0)
+        self.assertEqual(self.chunk.getMappingByID(5), 2)
+        self.assertEqual(self.chunk.getMappingParams(5)[0][0], 5.0)
+    
+    def testReplaceList(self):
+        groups = [MakeMappingGroup(1, 1.0), MakeMappingGroup(8, 2.0)]
+        self.chunk.mappingGroups = groups
+        #The chunk keeps its own copy of the list
+        groups.append(MakeMappingGroup(9, 9.0))
+        self.assertEqual([map.id for map in self.chunk.mappingGroups], [1, 8])
+        self.assertEqual(self.chunk.getMappingParams(8)[0][0], 2.0)
+        self.assertEqual(self.chunk.getMappingByID(5), -1)
+        self.chunk.mappingGroups = None
+        self.assertEqual(self.chunk.mappingGroups, ())
+    
+    def testListNotChangedInPlace(self):
+        with self.assertRaises(TypeError):
+            self.chunk.mappingGroups[1] = MakeMappingGroup(8, 3.0)
+        with self.assertRaises(AttributeError):
+            self.chunk.mappingGroups.append(MakeMappingGroup(9, 9.0))
+
+def MakeMesh(seed, materials, mappingIds):
+    """A mesh of random quads and triangles, one per material/mapping id pair given (NO_MAPPING for none), each
+    with its own vertices and edges.  Every other face has its border loop going backwards over its edges."""
+    rand = random.Random(seed)
+    mesh = SparkClasses.SparkMeshColumns()
+    mesh.materials = list(materials)
+    for id in set(mappingIds) - set([SparkClasses.NO_MAPPING]):
+        map = SparkClasses.SparkMappingGroup()
+        map.id = id
+        map.angle, map.xScale, map.yScale, map.xOffset, map.yOffset = (rand.uniform(0.1, 2.0) for i in range(0, 5))
+        map.xNormal, map.yNormal, map.zNormal = 0.0, 0.0, rand.choice([1.0, -1.0])
+        mesh.mappingChunk.addMappingGroup(map)
+    for f, mapping in enumerate(mappingIds):
+        first = mesh.vertexCount()
+        corners = rand.randint(3, 4)
+        for i in range(0, corners):
+            mesh.positions.extend(rand.uniform(-10.0, 10.0) for j in range(0, 3))
+        for i in range(0, corners):
+            mesh.endpoints.extend((first + i, first + (i + 1) % corners))
+            mesh.smooth.append(rand.randint(0, 1))
+        edges = range(mesh.edgeCount() - corners, mesh.edgeCount())
+        if f % 2 == 0:
+            loop = [(False, e) for e in edges]
+        else:
+            loop = [(True, e) for e in reversed(edges)]
+        mesh.addFace(*([rand.uniform(0.1, 2.0) for i in range(0, 5)] + [mapping, f % len(materials), [loop]]))
+    return mesh
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        NONE = SparkClasses.NO_MAPPING
+        self.meshes = [
+            MakeMesh(1, ["materials/dev/a.material", "materials/dev/b.material"], [3, 7, NONE, 3]),
+            MakeMesh(2, ["materials/dev/b.material", "materials/dev/c.material"], [4, 9, 4]),
+            #Clashes with the first mesh's ids, so they have to be given new ones
+            MakeMesh(3, ["materials/dev/c.material", "materials/dev/a.material"], [3, NONE, 7, 5]),
+            ]
+    
+    def faces(self, mesh):
+        """Describes each face by what it points at rather than by index: its corners' coordinates, its
+        material's name, its texture settings and its mapping group's settings"""
+        faces = []
+        for f in range(0, mesh.faceCount()):
+            corners = [mesh.getVertex(v) for v in mesh.getLoopVertices(f)]
+            params = mesh.mappingChunk.getMappingParams(mesh.mappingIds[f])
+            faces.append((corners, mesh.materials[mesh.materialIds[f]], tuple(mesh.texParams[f*5:f*5+5]), params))
+        return faces
+    
+    def assertMerged(self, merged):
+        self.assertEqual(merged.vertexCount(), sum(m.vertexCount() for m in self.meshes))
+        self.assertEqual(merged.edgeCount(), sum(m.edgeCount() for m in self.meshes))
+        self.assertEqual(list(merged.smooth), sum((list(m.smooth) for m in self.meshes), []))
+        self.assertEqual(merged.materials, ["materials/dev/a.material", "materials/dev/b.material", "materials/dev/c.material"])
+        self.assertEqual(self.faces(merged), sum((self.faces(m) for m in self.meshes), []))
+        #Every face in a mapping group still has one, and no two groups share an id
+        ids = [map.id for map in merged.mappingChunk.mappingGroups]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(ids[:2], [3, 7])
+        self.assertEqual([m == SparkClasses.NO_MAPPING for m in merged.mappingIds],
+                         sum(([m == SparkClasses.NO_MAPPING for m in mesh.mappingIds] for mesh in self.meshes), []))
+        #Each edge's ends land on the merged copies of its vertices
+        first = 0
+        offset = 0
+        for mesh in self.meshes:
+            for e in range(0, mesh.edgeCount()):
+                self.assertEqual(merged.endpoints[(first + e)*2], mesh.endpoints[e*2] + offset)
+                self.assertEqual(merged.endpoints[(first + e)*2 + 1], mesh.endpoints[e*2 + 1] + offset)
+            first += mesh.edgeCount()
+            offset += mesh.vertexCount()
+    
+    def testMergeSparkMeshes(self):
+        before = [m.convertToBinString() for m in self.meshes]
+        self.assertMerged(SparkClasses.mergeSparkMeshes(self.meshes))
+        self.assertEqual([m.convertToBinString() for m in self.meshes], before)
+    
+    def testMergeMeshChunks(self):
+        merged = SparkClasses.mergeSparkMeshes([m.toMeshChunk() for m in self.meshes])
+        self.assertMerged(merged)
+    
+    def testMergeSparkData(self):
+        expected = SparkClasses.mergeSparkMeshes(self.meshes).convertToBinString()
+        mc = self.meshes[0].toMeshChunk()
+        for mesh in self.meshes[1:]:
+            self.assertIs(SparkClasses.mergeSparkData(mc, mesh.toMeshChunk()), mc)
+        self.assertEqual(mc.convertToBinString(), expected)
+        columns = SparkClasses.mergeSparkMeshes(self.meshes[:1])
+        for mesh in self.meshes[1:]:
+            self.assertIs(SparkClasses.mergeSparkData(columns, mesh.toMeshChunk()), columns)
+        self.assertMerged(columns)
+        self.assertEqual(columns.convertToBinString(), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for SparkClipFile: writing a clip to a .sparkclip file and reading it back, rejecting broken files, and
+# unmapping the file on close.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import load
+
+SparkClasses = load("SparkClasses")
+SparkClipFile = load("SparkClipFile")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_clip.bin")
+
+class SparkClipFileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(BASELINE, "rb") as f:
+            cls.data = f.read()
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "clip.sparkclip")
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def testRoundTrip(self):
+        SparkClipFile.WriteSparkClipFile(self.path, self.data)
+        with SparkClipFile.SparkClipFile(self.path) as clip:
+            self.assertEqual(bytes(clip.payload), self.data)
+            self.assertEqual(clip.getMeshChunk().convertToBinString(), self.data)
+            self.assertEqual(clip.getMeshChunk(lazy = False).convertToBinString(), self.data)
+    
+    def testWriteMeshChunk(self):
+        mc = SparkClasses.SparkMeshChunkClipboard()
+        mc.constructFromBinString(self.data)
+        SparkClipFile.WriteSparkClipFile(self.path, SparkClasses.SparkMeshColumns.fromMeshChunk(mc))
+        with SparkClipFile.SparkClipFile(self.path) as clip:
+            self.assertEqual(clip.getMeshChunk().convertToBinString(), self.data)
+    
+    def testTruncated(self):
+        SparkClipFile.WriteSparkClipFile(self.path, self.data)
+        with open(self.path, 'rb') as f:
+            whole = f.read()
+        for length in (0, 4, SparkClipFile.SPARKCLIP_HEADER.size, len(whole) - 1):
+            with self.subTest(length = length):
+                with open(self.path, 'wb') as f:
+                    f.write(whole[:length])
+                with self.assertRaises(SparkClasses.SparkError):
+                    SparkClipFile.SparkClipFile(self.path)
+    
+    def testBadMagic(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(SparkClasses.SparkError):
+            SparkClipFile.SparkClipFile(self.path)
+    
+    def testClosed(self):
+        SparkClipFile.WriteSparkClipFile(self.path, self.data)
+        clip = SparkClipFile.SparkClipFile(self.path)
+        decoded = clip.getMeshChunk()
+        decoded.materialChunk
+        undecoded = clip.getMeshChunk()
+        clip.close()
+        self.assertTrue(clip._file.closed)
+        self.assertEqual(clip._map, None)
+        #What was decoded before closing is still there, the rest can't be read from the closed file
+        self.assertEqual(len(decoded.getMaterials()), 2)
+        with self.assertRaises(SparkClasses.SparkError):
+            undecoded.vertexChunk
+        clip.close()
+    
+    def testCloseWithViewHeld(self):
+        SparkClipFile.WriteSparkClipFile(self.path, self.data)
+        clip = SparkClipFile.SparkClipFile(self.path)
+        view = clip.payload[0:16]
+        with self.assertRaises(BufferError):
+            clip.close()
+        view.release()
+        clip.close()
+        self.assertTrue(clip._file.closed)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for TextureIndex: lookups, and reusing what was indexed earlier instead of walking the directories again.
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from common import load
+
+TextureIndex = load("TextureIndex")
+
+class TextureIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = self.dir.replace('\\','/') + '/'
+        os.makedirs(self.root + "Materials/Dev")
+        self.touch("Materials/Dev/Dev_1024x1024.material")
+        self.touch("Materials/Dev/dev_1024x1024.dds")
+        TextureIndex.scannedRoots.clear()
+        self.scans = 0
+        self.walked = [] #Where each walk started, relative to the root
+        scanRoot = TextureIndex.ScanRoot
+        def CountingScanRoot(root, start = ''):
+            self.scans += 1
+            self.walked.append(start)
+            return scanRoot(root, start)
+        patch = unittest.mock.patch.object(TextureIndex, "ScanRoot", CountingScanRoot)
+        patch.start()
+        self.addCleanup(patch.stop)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        TextureIndex.scannedRoots.clear()
+    
+    def touch(self, rel):
+        with open(self.root + rel, 'w') as f:
+            f.write("x")
+    
+    def bump(self, rel):
+        #Make sure the directory's mtime moves, even on filesystems with coarse timestamps
+        stat = os.stat(self.root + rel)
+        os.utime(self.root + rel, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    
+    def testResolve(self):
+        index = TextureIndex.TextureIndex([self.root])
+        self.assertEqual(index.resolve(self.root + "materials/dev/dev_1024x1024.material"), self.root + "Materials/Dev/Dev_1024x1024.material")
+        self.assertEqual(index.resolve(self.root + "materials/dev/missing.dds"), None)
+    
+    def testReusedInSession(self):
+        TextureIndex.TextureIndex([self.root])
+        index = TextureIndex.TextureIndex([self.root])
+        self.assertEqual(self.scans, 1)
+        self.assertNotEqual(index.resolve(self.root + "materials/dev/dev_1024x1024.dds"), None)
+    
+    def testRescannedWhenChanged(self):
+        TextureIndex.TextureIndex([self.root])
+        self.touch("Materials/Dev/New.dds")
+        self.bump("Materials/Dev")
+        index = TextureIndex.TextureIndex([self.root])
+        self.assertEqual(index.resolve(self.root + "materials/dev/new.dds"), self.root + "Materials/Dev/New.dds")
+        #Only the directory that changed is walked again
+        self.assertEqual(self.walked, ["", "Materials/Dev/"])
+    
+    def testNewDirectoryFound(self):
+        index = TextureIndex.TextureIndex([self.root])
+        self.assertEqual(index.resolve(self.root + "materials/new/new.dds"), None)
+        os.makedirs(self.root + "Materials/New")
+        self.touch("Materials/New/New.dds")
+        self.bump("Materials")
+        index = TextureIndex.TextureIndex([self.root])
+        self.assertEqual(index.resolve(self.root + "materials/new/new.dds"), self.root + "Materials/New/New.dds")
+        self.assertEqual(self.walked, ["", "Materials/"])
+    
+    def testOnlyLookupsChecked(self):
+        os.makedirs(self.root + "Models/Props")
+        self.touch("Models/Props/prop.material")
+        TextureIndex.TextureIndex([self.root])
+        #Directories nothing is looked up in aren't checked, even when they've changed
+        self.touch("Models/Props/prop2.material")
+        self.bump("Models/Props")
+        index = TextureIndex.TextureIndex([self.root])
+        index.resolve(self.root + "materials/dev/dev_1024x1024.dds")
+        index.resolve(self.root + "materials/dev/missing.dds")
+        index.resolve(self.root + "materials/missing/missing.dds")
+        self.assertEqual(self.scans, 1)
+        self.assertEqual(set(index.getChecked()), set([self.root, self.root + "Materials/", self.root + "Materials/Dev/"]))
+        self.assertEqual(index.resolve(self.root + "models/props/prop2.material"), self.root + "Models/Props/prop2.material")
+        self.assertEqual(self.walked, ["", "Models/Props/"])
+    
+    def testOutsideRootsChecked(self):
+        index = TextureIndex.TextureIndex([self.root + "Materials/"])
+        path = self.root + "elsewhere.dds"
+        self.assertEqual(index.resolve(path), None)
+        self.touch("elsewhere.dds")
+        self.assertEqual(index.resolve(path), path)
+        self.assertEqual(index.getChecked()[path], os.stat(path).st_mtime_ns)
+    
+    def testWithoutScanDir(self):
+        #Python 3.4 has no os.scandir
+        os.makedirs(self.root + "Materials/Dev/Sub.dds")
+        self.touch("Materials/Dev/Sub.dds/inside.dds")
+        with unittest.mock.patch.object(TextureIndex, "HAVE_SCANDIR", False):
+            index = TextureIndex.TextureIndex([self.root])
+            self.assertEqual(index.resolve(self.root + "materials/dev/dev_1024x1024.dds"), self.root + "Materials/Dev/dev_1024x1024.dds")
+        #A directory with an indexed extension is taken for a file; that's all it gets wrong
+        self.assertEqual(index.resolve(self.root + "materials/dev/sub.dds/inside.dds"), None)
+    
+    def testCacheFileWrittenFromSession(self):
+        #An index from earlier in the session still ends up in a cache file that doesn't have it yet
+        TextureIndex.TextureIndex([self.root])
+        cacheFile = self.root + "index.json"
+        TextureIndex.TextureIndex([self.root], cacheFile)
+        self.assertEqual(self.scans, 1)
+        self.assertIn(self.root, TextureIndex.TextureIndex._loadCacheFile(cacheFile))
+    
+    def testCacheFileUpdatedWhenChanged(self):
+        #Kept out of the texture directory, so saving it doesn't change the directory
+        cacheDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cacheDir)
+        cacheFile = os.path.join(cacheDir, "index.json")
+        TextureIndex.TextureIndex([self.root], cacheFile)
+        TextureIndex.scannedRoots.clear()
+        self.touch("Materials/Dev/New.dds")
+        self.bump("Materials/Dev")
+        TextureIndex.TextureIndex([self.root], cacheFile).resolve(self.root + "materials/dev/new.dds")
+        TextureIndex.scannedRoots.clear()
+        index = TextureIndex.TextureIndex([self.root], cacheFile)
+        self.assertEqual(index.resolve(self.root + "materials/dev/new.dds"), self.root + "Materials/Dev/New.dds")
+        self.assertEqual(self.walked, ["", "Materials/Dev/"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+# Part of the Blender Spark Tools, see __init__.py for credits.
+# Feel free to modify at your leisure, just make sure you
+# give credit where it's due.
+
+# Tests for Triangulation.polygon: every face has to come out as the right number of triangles, all wound the same
+# way as the face, covering exactly the face's area.
+
+import math
+import random
+import unittest
+import unittest.mock
+
+from common import load
+
+SparkClasses = load("SparkClasses")
+Triangulation = load("Triangulation")
+
+def MakeFace(loops):
+    """Returns a SparkMeshColumns with a single face in the z = 0 plane.  'loops' are lists of (x, y) points, the
+    border first and then any holes."""
+    mesh = SparkClasses.SparkMeshColumns()
+    mesh.materials = ["test.material"]
+    faceLoops = []
+    for points in loops:
+        first = mesh.vertexCount()
+        count = len(points)
+        loop = []
+        for (x, y) in points:
+            mesh.positions.extend((x, y, 0.0))
+        for i in range(0, count):
+            loop.append((False, mesh.edgeCount()))
+            mesh.endpoints.extend((first + i, first + (i + 1) % count))
+            mesh.smooth.append(0)
+        faceLoops.append(loop)
+    mesh.addFace(0.0, 0.0, 0.0, 1.0, 1.0, SparkClasses.NO_MAPPING, 0, faceLoops)
+    return mesh
+
+def SignedArea(points):
+    area = 0.0
+    for i in range(0, len(points)):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % len(points)]
+        area += x1 * y2 - x2 * y1
+    return area * 0.5
+
+def PointInPolygon(points, x, y):
+    inside = False
+    for i in range(0, len(points)):
+        x1, y1 = points[i]
+        x2, y2 = points[(i + 1) % len(points)]
+        if ((y1 > y) != (y2 > y)) and (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1)):
+            inside = not inside
+    return inside
+
+def DistanceToSegment(x, y, x1, y1, x2, y2):
+    dX = x2 - x1
+    dY = y2 - y1
+    t = max(0.0, min(1.0, ((x - x1) * dX + (y - y1) * dY) / (dX * dX + dY * dY)))
+    return math.hypot(x - x1 - t * dX, y - y1 - t * dY)
+
+def RegularPolygon(cX, cY, radius, sides, offset = 0.0):
+    return [(cX + radius * math.cos(2.0 * math.pi * (i + offset) / sides),
+             cY + radius * math.sin(2.0 * math.pi * (i + offset) / sides)) for i in range(0, sides)]
+
+def PillarFloor(count, sides, seed = 0):
+    """A square floor with 'count' pillars on an exact grid, so lots of vertices share the same x or y.  One side
+    of the border is notched in line with each row of pillars."""
+    rand = random.Random(seed)
+    size = int(math.ceil(math.sqrt(count)))
+    length = size * 4.0
+    border = [(0.0, 0.0), (length, 0.0)]
+    for j in range(0, size):
+        y = j * 4.0 + 1.5
+        border.extend([(length, y), (length - 1.0, y), (length - 1.0, y + 1.0), (length, y + 1.0)])
+    border.extend([(length, length), (0.0, length)])
+    holes = []
+    for i in range(0, count):
+        cX = (i // size) * 4.0 + 2.0
+        cY = (i % size) * 4.0 + 2.0
+        if sides == 4:
+            hole = [(cX - 0.5, cY - 0.5), (cX + 0.5, cY - 0.5), (cX + 0.5, cY + 0.5), (cX - 0.5, cY + 0.5)]
+        else:
+            hole = RegularPolygon(cX, cY, 0.5, sides)
+        if rand.random() < 0.5:
+            hole.reverse()
+        holes.append(hole)
+    return [border] + holes
+
+def StarWithHoles(seed):
+    """A random star-shaped border with 2 to 40 small holes scattered around inside it.  Even seeds snap
+    everything to whole numbers, which lines lots of vertices up."""
+    rand = random.Random(seed)
+    sides = rand.randint(4, 30)
+    count = rand.randint(2, 40)
+    snap = (seed % 2 == 0)
+    border = []
+    for i in range(0, sides):
+        angle = 2.0 * math.pi * i / sides
+        radius = rand.uniform(30.0, 100.0) if i % 2 else rand.uniform(80.0, 100.0)
+        x = radius * math.cos(angle)
+        y = radius * math.sin(angle)
+        if snap:
+            x = round(x)
+            y = round(y)
+        border.append((x, y))
+    circles = []
+    tries = 0
+    while len(circles) < count and tries < 20000:
+        tries += 1
+        cX = rand.uniform(-100.0, 100.0)
+        cY = rand.uniform(-100.0, 100.0)
+        radius = rand.uniform(0.5, 5.0)
+        if snap:
+            cX = round(cX)
+            cY = round(cY)
+            radius = max(1, round(radius))
+        if not PointInPolygon(border, cX, cY):
+            continue
+        if min(DistanceToSegment(cX, cY, *(border[i] + border[(i + 1) % sides])) for i in range(0, sides)) < radius * 1.01:
+            continue
+        if any(math.hypot(cX - hX, cY - hY) < radius + hR + 0.01 for (hX, hY, hR) in circles):
+            continue
+        circles.append((cX, cY, radius))
+    holes = []
+    for (cX, cY, radius) in circles:
+        hole = RegularPolygon(cX, cY, radius, rand.choice([3, 4, 4, 5, 6, 8]), rand.choice([0.0, 0.5, rand.random()]))
+        if rand.random() < 0.5:
+            hole.reverse()
+        holes.append(hole)
+    return [border] + holes
+
+class AllNodesGrid(Triangulation.NodeGrid):
+    """NodeGrid that hands back every node still in the ring, instead of just the ones it was given"""
+    def query(self, v1, v2, v3):
+        ring = self.ring
+        for i in range(0, len(ring.vert)):
+            if ring.nextIndex[i] != -1 and ring.prevIndex[ring.nextIndex[i]] == i:
+                yield i
+
+class TriangulationTest(unittest.TestCase):
+    def assertTriangulated(self, loops):
+        mesh = MakeFace(loops)
+        #Positions are stored as 32 bit floats, so measure the face as stored
+        first = 0
+        for l in range(0, len(loops)):
+            loops[l] = [mesh.getVertex(v)[:2] for v in range(first, first + len(loops[l]))]
+            first += len(loops[l])
+        tris = Triangulation.polygon(mesh, 0).triangles
+        vertexCount = sum(len(loop) for loop in loops)
+        holeCount = len(loops) - 1
+        self.assertEqual(len(tris), (vertexCount + 2 * holeCount - 2) * 3)
+        
+        sign = 1.0 if SignedArea(loops[0]) > 0.0 else -1.0
+        total = 0.0
+        for t in range(0, len(tris), 3):
+            area = SignedArea([mesh.getVertex(v)[:2] for v in tris[t:t+3]]) * sign
+            self.assertGreater(area, 0.0, "triangle %d is wound the wrong way or has no area" % (t // 3))
+            total += area
+        expected = abs(SignedArea(loops[0])) - sum(abs(SignedArea(loop)) for loop in loops[1:])
+        self.assertAlmostEqual(total, expected, delta = expected * 1e-9)
+    
+    def testTriangle(self):
+        self.assertTriangulated([[(0.0, 0.0), (1.0, 0.0), (0.0, 1.0)]])
+    
+    def testQuads(self):
+        self.assertTriangulated([[(0.0, 0.0), (2.0, 0.0), (2.0, 1.0), (0.0, 1.0)]])
+        self.assertTriangulated([[(0.0, 0.0), (2.0, 0.0), (0.5, 0.5), (0.0, 2.0)]])
+    
+    def testConvex(self):
+        self.assertTriangulated([RegularPolygon(0.0, 0.0, 10.0, 32)])
+        self.assertTriangulated([RegularPolygon(0.0, 0.0, 10.0, 32)[::-1]])
+    
+    def testConcave(self):
+        star = [(math.cos(math.pi * i / 16) * (10.0 if i % 2 else 4.0), math.sin(math.pi * i / 16) * (10.0 if i % 2 else 4.0)) for i in range(0, 32)]
+        self.assertTriangulated([star])
+        self.assertTriangulated([star[::-1]])
+    
+    def testPillarFloors(self):
+        for count in (1, 2, 9, 100, 150, 400):
+            for sides in (4, 8):
+                with self.subTest(count = count, sides = sides):
+                    self.assertTriangulated(PillarFloor(count, sides, count))
+    
+    def testUpsideDownPillarFloor(self):
+        loops = PillarFloor(100, 4)
+        self.assertTriangulated([loop[::-1] for loop in loops])
+    
+    def testStarsWithHoles(self):
+        for seed in range(0, 150):
+            with self.subTest(seed = seed):
+                self.assertTriangulated(StarWithHoles(seed))
+    
+    def testReflexShortcut(self):
+        #The ear tests only look at reflex vertices.  That has to give exactly the same triangles as looking at all
+        #of them.
+        faces = [StarWithHoles(seed) for seed in range(0, 40)] + [PillarFloor(100, 4), PillarFloor(100, 8)]
+        for f, loops in enumerate(faces):
+            with self.subTest(face = f):
+                mesh = MakeFace(loops)
+                tris = Triangulation.polygon(mesh, 0).triangles
+                with unittest.mock.patch.object(Triangulation, "NodeGrid", AllNodesGrid):
+                    self.assertEqual(Triangulation.polygon(mesh, 0).triangles, tris)
+
+if __name__ == "__main__":
+    unittest.main()